@@ -0,0 +1,114 @@
+"""
+Event-loop latency while slow queries are in flight. Several concurrent "requests" keep
+issuing full-scan queries (a file name substring nothing matches, which no index can
+serve) while a cheap request that only needs the loop is timed over and over. Sync
+DatabaseClient calls stall the loop for the whole scan; AsyncDatabaseClient keeps it free.
+"""
+
+import asyncio
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+
+from common import ops_per_second, report
+from sqlalchemy import insert
+from sqlmodel import Session, col, select
+
+from smolvault.clients.async_database import AsyncDatabaseClient
+from smolvault.clients.database import DatabaseClient, FileMetadataRecord, get_engine
+
+ROWS = 50_000
+CONCURRENT_QUERIES = 16
+DURATION = 3.0
+
+
+class ScanningClient(DatabaseClient):
+    def find_by_name_fragment(self, fragment: str) -> object:
+        with Session(self.engine) as session:
+            statement = select(FileMetadataRecord).where(col(FileMetadataRecord.file_name).contains(fragment))
+            return session.exec(statement).all()
+
+
+class AsyncScanningClient(AsyncDatabaseClient):
+    client: ScanningClient
+
+    async def find_by_name_fragment(self, fragment: str) -> object:
+        return await self._run(self.client.find_by_name_fragment, fragment)
+
+
+def populate() -> None:
+    rows = [
+        {
+            "file_name": f"file-{i}.txt",
+            "file_sha256": "0" * 64,
+            "size": i,
+            "object_key": f"file-{i}.txt",
+            "link": "",
+            "upload_timestamp": datetime(2024, 1, 1).isoformat(),
+            "tags": None,
+            "user_id": 1,
+        }
+        for i in range(ROWS)
+    ]
+    with get_engine().begin() as conn:
+        conn.execute(insert(FileMetadataRecord), rows)
+
+
+async def measure(slow_query: Callable[[], Awaitable[object]]) -> tuple[list[float], int]:
+    """Runs slow queries from several concurrent "requests" for DURATION seconds while timing a 1 ms sleep."""
+    latencies: list[float] = []
+    completed = 0
+    deadline = time.perf_counter() + DURATION
+
+    async def ping() -> None:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            latencies.append((time.perf_counter() - start - 0.001) * 1000)
+
+    async def request_loop() -> None:
+        nonlocal completed
+        while time.perf_counter() < deadline:
+            await slow_query()
+            completed += 1
+            await asyncio.sleep(0)
+
+    await asyncio.gather(ping(), *(request_loop() for _ in range(CONCURRENT_QUERIES)))
+    return latencies, completed
+
+
+async def main() -> None:
+    populate()
+    sync_client = ScanningClient()
+    async_client = AsyncScanningClient(sync_client)
+    query_rate = ops_per_second(lambda: sync_client.find_by_name_fragment("no-such-file"), seconds=1)
+
+    async def blocking_query() -> object:
+        return sync_client.find_by_name_fragment("no-such-file")
+
+    async def offloaded_query() -> object:
+        return await async_client.find_by_name_fragment("no-such-file")
+
+    rows = []
+    for label, query in (("sync client (before)", blocking_query), ("async client (after)", offloaded_query)):
+        latencies, completed = await measure(query)
+        quantiles = statistics.quantiles(latencies, n=100)
+        rows.append(
+            [
+                label,
+                f"{quantiles[49]:.2f}",
+                f"{quantiles[98]:.2f}",
+                f"{max(latencies):.2f}",
+                f"{completed / DURATION:,.0f}",
+            ]
+        )
+    report(
+        f"Loop latency, {CONCURRENT_QUERIES} concurrent scans of {ROWS:,} rows ({query_rate:,.0f}/sec serially)",
+        ["client", "p50 ms", "p99 ms", "max ms", "scans/sec"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,46 @@
+"""
+Requests/sec for the database work an authenticated download does: build the request's
+DatabaseClient, resolve the user and look up the file. Compares an engine (and create_all)
+per request with the shared per-process engine and pool.
+"""
+
+from common import WORKDIR, ops_per_second, report
+from sqlmodel import SQLModel, create_engine
+
+from smolvault.auth.models import NewUserDTO
+from smolvault.auth.passwords import hash_password
+from smolvault.clients.database import DatabaseClient, get_engine
+
+
+class PerRequestEngineClient(DatabaseClient):
+    def __init__(self) -> None:
+        self.engine = create_engine(f"sqlite:///{WORKDIR / 'bench.db'}", echo=False)
+        SQLModel.metadata.create_all(self.engine)
+
+
+def handle_request(client_cls: type[DatabaseClient]) -> None:
+    client = client_cls()
+    client.get_user("bench")
+    client.get_metadata("missing.txt", 1)
+
+
+def main() -> None:
+    get_engine()
+    DatabaseClient().add_user(
+        NewUserDTO(username="bench", email="bench@example.com", full_name="Bench", password="bench"),  # noqa: S106
+        hash_password("bench", rounds=4),
+    )
+    before = ops_per_second(lambda: handle_request(PerRequestEngineClient))
+    after = ops_per_second(lambda: handle_request(DatabaseClient))
+    report(
+        "DatabaseClient per request",
+        ["engine", "requests/sec", "speedup"],
+        [
+            ["per request (before)", f"{before:,.0f}", "1.0x"],
+            ["shared pool (after)", f"{after:,.0f}", f"{after / before:.1f}x"],
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
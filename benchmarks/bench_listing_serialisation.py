@@ -0,0 +1,106 @@
+"""
+Cost of turning a page of files into the JSON body of a listing, for 100 and 10,000 row pages.
+Before: full records loaded, copied into FileMetadata models, then validated and serialised again
+the way FastAPI handles a list[FileMetadata] return value. After: only the listed columns are
+selected and ListingResponse encodes the rows directly.
+"""
+
+import asyncio
+
+from common import ops_per_second, report
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import insert
+from sqlmodel import Session, col, select
+
+from smolvault.clients.database import DatabaseClient, FileMetadataRecord, get_engine
+from smolvault.models import FileMetadata
+from smolvault.responses import ListingResponse, dumps
+
+PAGES = {100: 1, 10_000: 2}  # page size: the user owning exactly that many files
+RESPONSE_FIELD = create_model_field("Response_get_files", list[FileMetadata], mode="serialization")
+LOOP = asyncio.new_event_loop()
+
+
+def populate() -> None:
+    records = [
+        {
+            "file_name": f"file-{i}.txt",
+            "file_sha256": f"{i:064x}",
+            "size": i,
+            "object_key": f"objects/{i:064x}",
+            "link": f"http://localhost:8000/file/original?filename=file-{i}.txt",
+            "upload_timestamp": f"2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}+00:00",
+            "tags": "holiday, beach,family" if i % 2 else None,
+            "user_id": user_id,
+        }
+        for size, user_id in PAGES.items()
+        for i in range(size)
+    ]
+    with get_engine().begin() as conn:
+        conn.execute(insert(FileMetadataRecord), records)
+
+
+def fetch_records(user_id: int) -> list[FileMetadataRecord]:
+    with Session(get_engine()) as session:
+        statement = (
+            select(FileMetadataRecord)
+            .where(FileMetadataRecord.user_id == user_id)
+            .order_by(col(FileMetadataRecord.upload_timestamp), col(FileMetadataRecord.id))
+        )
+        return list(session.exec(statement).all())
+
+
+def render_records(records: list[FileMetadataRecord]) -> bytes:
+    results = [FileMetadata.model_validate(record.model_dump()) for record in records]
+    # what FastAPI does with a list[FileMetadata] returned from an async endpoint
+    content = LOOP.run_until_complete(serialize_response(field=RESPONSE_FIELD, response_content=results))
+    return JSONResponse(content).body
+
+
+def main() -> None:
+    populate()
+    client = DatabaseClient()
+    encoder = "orjson" if dumps.__module__ == "orjson" else "json"
+    rows = []
+    for size, user_id in PAGES.items():
+        records = fetch_records(user_id)
+        listing = client.get_all_metadata(user_id, limit=None)
+        assert render_records(records) == ListingResponse(listing).body
+        seconds = 1 if size < 1000 else 3
+        timings = [
+            ops_per_second(lambda: render_records(records), seconds=seconds),  # noqa: B023
+            ops_per_second(lambda: ListingResponse(listing).body, seconds=seconds),  # noqa: B023
+            ops_per_second(lambda: render_records(fetch_records(user_id)), seconds=seconds),  # noqa: B023
+            ops_per_second(lambda: ListingResponse(client.get_all_metadata(user_id, limit=None)).body, seconds=seconds),  # noqa: B023
+        ]
+        serialise_before, serialise_after, total_before, total_after = (1000 / rate for rate in timings)
+        rows.append(
+            [
+                f"{size:,}",
+                f"{serialise_before:.2f}",
+                f"{serialise_after:.2f}",
+                f"{serialise_before / serialise_after:.1f}x",
+                f"{total_before:.2f}",
+                f"{total_after:.2f}",
+                f"{total_before / total_after:.1f}x",
+            ]
+        )
+    report(
+        f"Listing page rendering, ms per page (encoder: {encoder})",
+        [
+            "rows",
+            "serialise before",
+            "serialise after",
+            "speedup",
+            "query + serialise before",
+            "query + serialise after",
+            "speedup",
+        ],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Cost of each BCRYPT_ROUNDS setting, and what running bcrypt inline does to the event loop.
+A burst of logins is verified while a cheap request that only needs the loop is timed;
+inline checkpw stalls it for the whole burst, the PasswordHasher pool keeps it free.
+"""
+
+import asyncio
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+
+from common import ops_per_second, report
+
+from smolvault.auth.passwords import PasswordHasher, hash_password, verify_password
+
+ROUNDS = (10, 11, 12, 13)
+LOGINS = 16
+WORKERS = 2
+
+
+async def loop_latency(logins: Callable[[], Awaitable[object]]) -> tuple[list[float], float]:
+    """Runs a burst of logins while timing a 1 ms sleep; returns the latencies and the burst duration."""
+    latencies: list[float] = []
+    done = False
+
+    async def ping() -> None:
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            latencies.append((time.perf_counter() - start - 0.001) * 1000)
+
+    pinger = asyncio.create_task(ping())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await logins()
+    elapsed = time.perf_counter() - start
+    done = True
+    await pinger
+    return latencies, elapsed
+
+
+async def main() -> None:
+    rows = []
+    for rounds in ROUNDS:
+        hashed_password = hash_password("bench", rounds)
+        rate = ops_per_second(lambda: verify_password("bench", hashed_password), seconds=1)  # noqa: B023
+        rows.append([str(rounds), f"{1000 / rate:,.0f}", f"{rate:,.1f}"])
+    report("bcrypt cost per BCRYPT_ROUNDS", ["rounds", "ms/login", "logins/sec per worker"], rows)
+
+    hashed_password = hash_password("bench", 12)
+    hasher = PasswordHasher(max_workers=WORKERS, max_pending=LOGINS, rounds=12)
+
+    async def inline() -> None:
+        for _ in range(LOGINS):
+            verify_password("bench", hashed_password)
+            await asyncio.sleep(0)
+
+    async def pooled() -> None:
+        await asyncio.gather(*(hasher.verify("bench", hashed_password) for _ in range(LOGINS)))
+
+    rows = []
+    for label, logins in (("inline (before)", inline), (f"pool of {WORKERS} (after)", pooled)):
+        latencies, elapsed = await loop_latency(logins)
+        rows.append([label, f"{statistics.median(latencies):.2f}", f"{max(latencies):.2f}", f"{elapsed:.2f}"])
+    report(
+        f"Loop latency during {LOGINS} concurrent logins at 12 rounds",
+        ["bcrypt", "p50 ms", "max ms", "burst seconds"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
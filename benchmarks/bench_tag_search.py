@@ -0,0 +1,64 @@
+"""
+Queries/sec for tag searches on a large library: single tags, three-tag AND, a four-tag
+AND/OR/NOT mix and the per-user tag counts, all answered from the per-user posting-list index.
+"""
+
+import random
+
+from common import ops_per_second, report
+from sqlalchemy import insert
+
+from smolvault.clients.database import DatabaseClient, FileMetadataRecord, FileTag, get_engine
+from smolvault.clients.migrations import add_tag_posting_lists
+
+FILES = 100_000
+TAGS = [f"tag-{i}" for i in range(50)]
+TAGS_PER_FILE = 4
+
+
+def populate() -> None:
+    rng = random.Random(0)  # noqa: S311
+    records = [
+        {
+            "id": i + 1,
+            "file_name": f"file-{i}.txt",
+            "file_sha256": f"{i:064x}",
+            "size": 1,
+            "object_key": f"objects/{i:064x}",
+            "link": "",
+            "upload_timestamp": f"2024-01-01T00:00:{i % 60:02d}+00:00",
+            "tags": None,
+            "user_id": 1,
+        }
+        for i in range(FILES)
+    ]
+    tags = [
+        {"tag_name": tag, "file_id": i + 1, "user_id": 1}
+        for i in range(FILES)
+        for tag in rng.sample(TAGS, TAGS_PER_FILE)
+    ]
+    with get_engine().begin() as conn:
+        conn.execute(insert(FileMetadataRecord), records)
+        conn.execute(insert(FileTag), tags)
+        add_tag_posting_lists(conn)  # fills in the tag counts
+
+
+def main() -> None:
+    populate()
+    client = DatabaseClient()
+    queries = {
+        "1 tag": lambda: client.select_metadata_by_tags(1, all_tags=TAGS[:1], limit=50),
+        "3 tags AND": lambda: client.select_metadata_by_tags(1, all_tags=TAGS[:3], limit=50),
+        "2 AND, 1 OR, 1 NOT": lambda: client.select_metadata_by_tags(
+            1, all_tags=TAGS[:2], any_tags=TAGS[2:4], not_tags=TAGS[4:5], limit=50
+        ),
+        "tag counts": lambda: client.get_tag_counts(1),
+    }
+    rows = [[label, f"{ops_per_second(query, seconds=1):,.0f}"] for label, query in queries.items()]
+    report(
+        f"Tag search over {FILES:,} files with {TAGS_PER_FILE} of {len(TAGS)} tags each", ["query", "queries/sec"], rows
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Cost of the checks behind user creation and upload admission with tens of thousands of
+users: counting users by fetching every row versus COUNT(*), and matching the uploader
+against a whitelist split on every request versus a precomputed frozenset.
+"""
+
+from common import ops_per_second, report
+from sqlalchemy import insert
+from sqlmodel import Session, select
+
+from smolvault.clients.database import DatabaseClient, UserInfo, get_engine
+from smolvault.validators.operation_validator import parse_whitelist
+
+USERS = 50_000
+
+
+def populate() -> None:
+    rows = [{"username": f"user-{i}", "hashed_password": "x"} for i in range(USERS)]
+    with get_engine().begin() as conn:
+        conn.execute(insert(UserInfo), rows)
+
+
+def count_by_fetching() -> int:
+    with Session(get_engine()) as session:
+        return len(session.exec(select(UserInfo)).fetchall())
+
+
+def main() -> None:
+    populate()
+    client = DatabaseClient()
+    assert count_by_fetching() == client.get_user_count() == USERS
+    whitelist = ",".join(str(i) for i in range(USERS))
+    last_user = str(USERS - 1)
+
+    rows = []
+    for label, before_fn, after_fn in (
+        ("user count", count_by_fetching, client.get_user_count),
+        (
+            "whitelist lookup",
+            lambda: last_user in whitelist.split(","),
+            lambda: last_user in parse_whitelist(whitelist),
+        ),
+    ):
+        before = ops_per_second(before_fn, seconds=1)
+        after = ops_per_second(after_fn, seconds=1)
+        rows.append([label, f"{before:,.0f}", f"{after:,.0f}", f"{after / before:,.0f}x"])
+    report(f"Admission checks with {USERS:,} users", ["check", "before ops/sec", "after ops/sec", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Shared setup for the benchmark scripts. Import it before anything from smolvault so the
+settings resolve to a throwaway database and cache directory.
+"""
+
+import os
+import pathlib
+import tempfile
+import time
+from collections.abc import Callable
+from typing import Any
+
+from rich.console import Console
+from rich.table import Table
+
+WORKDIR = pathlib.Path(tempfile.mkdtemp(prefix="smolvault-bench-"))
+
+os.environ.setdefault("ENVIRONMENT", "bench")
+os.environ.setdefault("SMOLVAULT_BUCKET", "bench-bucket")
+os.environ.setdefault("SMOLVAULT_DB", (WORKDIR / "bench.db").as_posix())
+os.environ.setdefault("SMOLVAULT_CACHE", (WORKDIR / "cache").as_posix())
+os.environ.setdefault("AUTH_SECRET_KEY", "bench-secret")
+os.environ.setdefault("USER_WHITELIST", "1")
+os.environ.setdefault("USERS_LIMIT", "1000000")
+os.environ.setdefault("DAILY_UPLOAD_LIMIT_BYTES", str(10**12))
+os.environ.setdefault("SENTRY_ENABLED", "false")
+os.environ.setdefault("SENTRY_DSN", "none")
+
+console = Console()
+
+
+def ops_per_second(fn: Callable[[], Any], seconds: float = 2.0) -> float:
+    fn()  # warm up
+    count = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < seconds:
+        fn()
+        count += 1
+    return count / elapsed
+
+
+def report(title: str, columns: list[str], rows: list[list[str]]) -> None:
+    table = Table(title=title)
+    for column in columns:
+        table.add_column(column)
+    for row in rows:
+        table.add_row(*row)
+    console.print(table)
@@ -2,14 +2,16 @@ from datetime import datetime, timedelta
 from typing import Annotated, Any
 from zoneinfo import ZoneInfo
 
-import bcrypt
 import jwt
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from jwt import InvalidTokenError
 
 from smolvault.auth.models import Token, TokenData, User
-from smolvault.clients.database import DatabaseClient, UserInfo
+from smolvault.auth.passwords import get_password_hasher
+from smolvault.cache.ttl import TTLCache
+from smolvault.clients.async_database import AsyncDatabaseClient
+from smolvault.clients.database import UserInfo
 from smolvault.config import get_settings
 
 settings = get_settings()
@@ -17,14 +19,14 @@ SECRET_KEY = settings.auth_secret_key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# verified tokens and the users they resolve to, so repeat requests skip the signature check and the database
+authenticated_users: TTLCache[str, User] = TTLCache(
+    max_entries=settings.auth_user_cache_size, ttl_seconds=settings.auth_user_cache_ttl_seconds
+)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
-
-
-def decode_token(token: str, db_client: DatabaseClient) -> UserInfo | None:
-    user = db_client.get_user(token)
+async def decode_token(token: str, db_client: AsyncDatabaseClient) -> UserInfo | None:
+    user = await db_client.get_user(token)
     return user
 
 
@@ -39,19 +41,22 @@ def create_access_token(data: dict[str, Any], expires_delta: timedelta | None =
     return Token(access_token=encoded_jwt, token_type="bearer")  # noqa: S106
 
 
-def authenticate_user(db_client: DatabaseClient, username: str, password: str) -> UserInfo | None:
-    user = db_client.get_user(username)
+async def authenticate_user(db_client: AsyncDatabaseClient, username: str, password: str) -> UserInfo | None:
+    user = await db_client.get_user(username)
     if not user:
         return None
-    if not bcrypt.checkpw(password.encode(), user.hashed_password.encode()):
+    if not await get_password_hasher().verify(password, user.hashed_password):
         return None
     return user
 
 
 async def get_current_user(
     token: Annotated[str, Depends(oauth2_scheme)],
-    db_client: Annotated[DatabaseClient, Depends(DatabaseClient)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
 ) -> User:
+    cached_user = authenticated_users.get(token)
+    if cached_user is not None:
+        return cached_user
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -67,7 +72,7 @@ async def get_current_user(
         raise credentials_exception from e
     if token_data.username is None:
         raise credentials_exception
-    user = db_client.get_user(token_data.username)
+    user = await db_client.get_user(token_data.username)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -79,4 +84,7 @@ async def get_current_user(
             status_code=500,
             detail="Corrputed user data",
         )
-    return User(id=user.id, username=user.username, email=user.email, full_name=user.full_name)
+    current_user = User(id=user.id, username=user.username, email=user.email, full_name=user.full_name)
+    expires_at = payload.get("exp")
+    authenticated_users.set(token, current_user, expires_at=float(expires_at) if expires_at is not None else None)
+    return current_user
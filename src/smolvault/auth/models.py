@@ -1,7 +1,4 @@
-from functools import cached_property
-
-import bcrypt
-from pydantic import BaseModel, SecretStr, computed_field
+from pydantic import BaseModel, SecretStr
 
 
 class User(BaseModel):
@@ -17,11 +14,6 @@ class NewUserDTO(BaseModel):
     full_name: str
     password: SecretStr
 
-    @computed_field  # type: ignore[prop-decorator]
-    @cached_property
-    def hashed_password(self) -> str:
-        return bcrypt.hashpw(self.password.get_secret_value().encode(), bcrypt.gensalt()).decode()
-
 
 class Token(BaseModel):
     access_token: str
@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import ParamSpec, TypeVar
+
+import bcrypt
+from fastapi import HTTPException
+
+from smolvault.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+def hash_password(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small dedicated pool (bcrypt releases the GIL, so threads hash in parallel) instead of
+    on the event loop. At most max_pending calls may be running or queued; beyond that requests are turned
+    away with a 503 rather than piling up behind work that takes hundreds of milliseconds each.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, rounds: int) -> None:
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smolvault-bcrypt")
+        self.pending = 0
+
+    async def _run(self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+        if self.pending >= self.max_pending:
+            logger.warning("Rejecting password check, %d already pending", self.pending)
+            raise HTTPException(
+                status_code=503,
+                detail="Too many concurrent authentication requests",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            call = functools.partial(context.run, fn, *args, **kwargs)
+            return await loop.run_in_executor(self.executor, call)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, self.rounds)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+
+@lru_cache
+def get_password_hasher() -> PasswordHasher:
+    settings = get_settings()
+    return PasswordHasher(
+        max_workers=settings.password_hash_workers,
+        max_pending=settings.password_hash_max_pending,
+        rounds=settings.bcrypt_rounds,
+    )
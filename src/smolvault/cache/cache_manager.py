@@ -1,25 +1,418 @@
+import asyncio
+import contextlib
+import dataclasses
+import fcntl
 import logging
+import os
 import pathlib
+import tempfile
+import threading
+import time
+import weakref
+from collections.abc import Callable, Iterable, Iterator
+from typing import BinaryIO
+
+from smolvault.cache.eviction import EvictionPolicy, LRUPolicy
 
 logger = logging.getLogger(__name__)
 
+TEMP_SUFFIX = ".part"
+# temp files untouched for this long belong to a write that died; younger ones may be another worker's fill
+STALE_TEMP_SECONDS = 3600
+BUDGET_LOCK_NAME = ".budget.lock"
+
+
+class FillLease:
+    """
+    Exclusive right to populate one cache entry. Held across worker processes with an flock on a lock
+    file, and released exactly once: explicitly, or when the lease is garbage collected if the response
+    that owned it never ran. The holder removes the lock file on release, so waiters that opened it before
+    then find it gone once they get the flock and start over on a fresh one.
+    """
+
+    def __init__(self, lock_path: pathlib.Path, on_release: Callable[[], None]) -> None:
+        self._lock_path = lock_path
+        self._on_release = on_release
+        self._open()
+
+    def _open(self) -> None:
+        self._fd = os.open(self._lock_path, os.O_CREAT | os.O_RDWR, 0o600)
+        self._finalizer = weakref.finalize(self, FillLease._unlock, self._fd, self._lock_path, self._on_release)
+
+    def try_acquire(self) -> bool:
+        while True:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            if _is_lock_file(self._fd, self._lock_path):
+                return True
+            # the previous holder removed the file we locked; nobody else will ever lock it, so use the new one
+            self._finalizer.detach()
+            os.close(self._fd)
+            self._open()
+
+    def release(self) -> None:
+        self._finalizer()
+
+    @staticmethod
+    def _unlock(fd: int, lock_path: pathlib.Path, on_release: Callable[[], None]) -> None:
+        _remove_lock_file(fd, lock_path)
+        os.close(fd)  # closing the descriptor drops the flock
+        on_release()
+
+
+def _is_lock_file(fd: int, lock_path: pathlib.Path) -> bool:
+    """Whether fd is still the file at lock_path, not one a previous holder has since removed."""
+    try:
+        return os.path.samestat(os.fstat(fd), lock_path.stat())
+    except FileNotFoundError:
+        return False
+
+
+def _remove_lock_file(fd: int, lock_path: pathlib.Path) -> None:
+    """Unlinks lock_path if fd is that file and holds, or can take, its flock, i.e. no one else is using it."""
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return
+    if _is_lock_file(fd, lock_path):
+        lock_path.unlink(missing_ok=True)
+
+
+@dataclasses.dataclass
+class BudgetLedger:
+    """
+    Totals of a cache directory shared by several workers, kept in its budget lock file. The generation goes up
+    with every change, so a worker can tell whether anyone else has touched the directory since it last did.
+    """
+
+    generation: int = 0
+    total_bytes: int = 0
+    total_files: int = 0
+
+    @classmethod
+    def read(cls, fd: int) -> "BudgetLedger":
+        fields = os.pread(fd, 64, 0).split()
+        return cls(*map(int, fields)) if len(fields) == 3 else cls()
+
+    def write(self, fd: int) -> None:
+        data = f"{self.generation} {self.total_bytes} {self.total_files}\n".encode()
+        os.pwrite(fd, data, 0)
+        os.ftruncate(fd, len(data))
+
 
 class CacheManager:
-    def __init__(self, cache_dir: str) -> None:
+    def __init__(
+        self,
+        cache_dir: str,
+        *,
+        max_bytes: int | None = None,
+        max_files: int | None = None,
+        policy: EvictionPolicy | None = None,
+        on_evict: Callable[[str], None] | None = None,
+        fill_poll_interval: float = 0.05,
+        fill_wait_timeout: float | None = 30.0,
+    ) -> None:
         self.cache_dir = pathlib.Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True)
+        self.locks_dir = self.cache_dir / ".locks"
+        self.locks_dir.mkdir(exist_ok=True)
+        self.quarantine_dir = self.cache_dir / ".quarantine"
+        self.quarantine_dir.mkdir(exist_ok=True)
+        self.fill_poll_interval = fill_poll_interval
+        self.fill_wait_timeout = fill_wait_timeout
+        self._fills: dict[str, asyncio.Event] = {}
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.policy = policy or LRUPolicy()
+        self.on_evict = on_evict
+        self.total_bytes = 0
+        self._sizes: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._generation = -1  # of the budget ledger when this worker's view last matched the whole directory
+        self._load_existing()
         logger.info("Created CacheManager with cache directory %s", self.cache_dir)
 
+    def path(self, filename: str) -> pathlib.Path:
+        return self.cache_dir / filename
+
     def file_exists(self, filename: str) -> bool:
         file_path = self.cache_dir / filename
         return file_path.exists()
 
+    def cached_files(self) -> set[str]:
+        with self._lock:
+            return set(self._sizes)
+
+    async def claim(self, filename: str) -> FillLease | None:
+        """
+        Single-flight for cache misses. Returns a lease when the caller should fetch the file and tee it into
+        the cache, or None when it should not: once the file is cached, after waiting out any fill already
+        running in this process or another one, or when that fill is still running after fill_wait_timeout.
+        A fill goes at the pace of the client reading it, so in that last case the caller streams uncached.
+        """
+        try:
+            async with asyncio.timeout(self.fill_wait_timeout):
+                return await self._claim(filename)
+        except TimeoutError:
+            logger.info("Fill of %s is taking too long, not waiting for it", filename)
+            return None
+
+    async def _claim(self, filename: str) -> FillLease | None:
+        while (event := self._fills.get(filename)) is not None:
+            await event.wait()
+        if self.file_exists(filename):
+            return None
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        self._fills[filename] = event
+        lease = FillLease(
+            self.locks_dir / f"{filename}.lock",
+            lambda: self._finish_fill(loop, filename, event),
+        )
+        try:
+            # another process may hold the flock; there is nothing to await on, so poll it
+            while not lease.try_acquire():  # noqa: ASYNC110
+                await asyncio.sleep(self.fill_poll_interval)
+        except BaseException:
+            lease.release()
+            raise
+        if self.file_exists(filename):
+            logger.info("File %s was cached by another worker", filename)
+            lease.release()
+            return None
+        return lease
+
+    def _finish_fill(self, loop: asyncio.AbstractEventLoop, filename: str, event: asyncio.Event) -> None:
+        def finish() -> None:
+            if self._fills.get(filename) is event:
+                del self._fills[filename]
+            event.set()
+
+        try:
+            loop.call_soon_threadsafe(finish)
+        except RuntimeError:
+            logger.info("Event loop closed before the fill of %s was released", filename)
+
+    def touch(self, filename: str) -> None:
+        with self._lock:
+            self.policy.touch(filename)
+
+    def fits(self, size: int) -> bool:
+        return self.max_bytes is None or size <= self.max_bytes
+
     def save_file(self, filename: str, data: bytes) -> str:
         file_path = self.cache_dir / filename
-        with file_path.open("wb") as f:
-            f.write(data)
+        fd, temp_name = tempfile.mkstemp(dir=self.cache_dir, prefix=f".{filename}.", suffix=TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                self._publish(f, pathlib.Path(temp_name), file_path)
+        finally:
+            pathlib.Path(temp_name).unlink(missing_ok=True)
+        self._admit(filename, len(data))
         return file_path.as_posix()
 
+    def tee(self, filename: str, chunks: Iterable[bytes], lease: FillLease | None = None) -> Iterator[bytes]:
+        """
+        Passes chunks through while writing them to the cache. The file only appears under its final name
+        once every chunk has been written, so an interrupted stream never leaves a truncated cache hit behind.
+        The fill lease, if any, is released once the file is in place (or the stream failed).
+        """
+        file_path = self.cache_dir / filename
+        fd, temp_name = tempfile.mkstemp(dir=self.cache_dir, prefix=f".{filename}.", suffix=TEMP_SUFFIX)
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+                self._publish(f, pathlib.Path(temp_name), file_path)
+            logger.info("Cached file %s", file_path)
+            self._admit(filename, size)
+        finally:
+            pathlib.Path(temp_name).unlink(missing_ok=True)
+            if lease is not None:
+                lease.release()
+
+    def quarantine(self, filename: str) -> pathlib.Path | None:
+        """
+        Moves a cached file aside so it stops being served but can still be inspected. Returns None when the
+        file is already gone, e.g. another worker quarantined or evicted it first.
+        """
+        destination = self.quarantine_dir / f"{filename}.{int(time.time())}"
+        if not self._remove(filename, lambda path: path.replace(destination)):
+            logger.info("Cached file %s was removed before it could be quarantined", filename)
+            return None
+        logger.warning("Quarantined cached file %s as %s", filename, destination)
+        return destination
+
     def delete_file(self, local_path: str) -> None:
         file_path = pathlib.Path(local_path)
-        file_path.unlink(missing_ok=True)
+        if file_path.parent != self.cache_dir:
+            file_path.unlink(missing_ok=True)
+            return
+        self._remove(file_path.name, pathlib.Path.unlink)
+
+    def _remove(self, filename: str, remove: Callable[[pathlib.Path], object]) -> bool:
+        """Takes a file out of the cache with remove, keeping the shared totals in step. False if it was gone."""
+        path = self.cache_dir / filename
+        with self._lock, self._budget() as ledger:
+            try:
+                size = path.stat().st_size
+                remove(path)
+            except FileNotFoundError:
+                return False
+            finally:
+                self._forget(filename)
+            if ledger is not None:
+                self._record(ledger, ledger.generation == self._generation, -size, -1)
+        return True
+
+    def _publish(self, f: BinaryIO, temp_path: pathlib.Path, file_path: pathlib.Path) -> None:
+        """Makes a fully written temp file visible under its final name, durably, in one atomic step."""
+        f.flush()
+        os.fsync(f.fileno())
+        temp_path.replace(file_path)
+        dir_fd = os.open(self.cache_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)  # persist the rename itself
+        finally:
+            os.close(dir_fd)
+
+    def _load_existing(self) -> None:
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                # left behind by a write that never finished, e.g. the process was killed mid-download
+                if entry.name.endswith(TEMP_SUFFIX) and entry.is_file() and entry.stat().st_mtime < stale_before:
+                    pathlib.Path(entry.path).unlink(missing_ok=True)
+        self._prune_lock_files()
+        with self._lock, self._budget_lock() as ledger:
+            self._sync_with_disk()
+            evicted = self._evict_over_budget()
+            self._record(ledger, True)
+        self._evicted(evicted)
+        logger.info("Tracking %d cached files (%d bytes)", len(self._sizes), self.total_bytes)
+
+    def _prune_lock_files(self) -> None:
+        """Removes fill lock files nobody holds, e.g. left by a worker that was killed mid-fill."""
+        with os.scandir(self.locks_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".lock") or entry.name == BUDGET_LOCK_NAME:
+                    continue
+                try:
+                    fd = os.open(entry.path, os.O_RDWR)
+                except FileNotFoundError:
+                    continue
+                try:
+                    _remove_lock_file(fd, pathlib.Path(entry.path))
+                finally:
+                    os.close(fd)
+
+    def _admit(self, filename: str, size: int) -> None:
+        with self._lock, self._budget() as ledger:
+            exact = ledger is None or ledger.generation == self._generation
+            if ledger is not None and not exact and self._would_exceed(ledger, filename, size):
+                # workers share the directory, and another one changed it since this one last looked; the scan
+                # is only worth it when eviction has to pick among everything on disk
+                self._sync_with_disk()
+                exact = True
+            previous = self._sizes.get(filename)
+            self._forget(filename)
+            self._sizes[filename] = size
+            self.total_bytes += size
+            # make room before the policy learns about the new file so it is never its own victim
+            evicted = self._evict_over_budget() if exact else []
+            self.policy.admit(filename, size)
+            if ledger is not None:
+                self._record(ledger, exact, size - (previous or 0), int(previous is None))
+        self._evicted(evicted)
+
+    def _would_exceed(self, ledger: BudgetLedger, filename: str, size: int) -> bool:
+        """Whether admitting the file takes the directory over budget, going by the shared totals."""
+        previous = self._sizes.get(filename)
+        return self._exceeds_budget(
+            ledger.total_bytes + size - (previous or 0), ledger.total_files + (previous is None)
+        )
+
+    def _budget(self) -> contextlib.AbstractContextManager[BudgetLedger | None]:
+        budgeted = self.max_bytes is not None or self.max_files is not None
+        return self._budget_lock() if budgeted else contextlib.nullcontext()
+
+    @contextlib.contextmanager
+    def _budget_lock(self) -> Iterator[BudgetLedger]:
+        """Serialises budget accounting and eviction with the other processes sharing the cache directory."""
+        fd = os.open(self.locks_dir / BUDGET_LOCK_NAME, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            ledger = BudgetLedger.read(fd)
+            yield ledger
+            ledger.write(fd)
+        finally:
+            os.close(fd)  # closing the descriptor drops the flock
+
+    def _record(self, ledger: BudgetLedger, exact: bool, bytes_delta: int = 0, files_delta: int = 0) -> None:
+        """
+        Publishes a change to the directory. With an exact view of it this worker's totals replace the shared
+        ones; otherwise it only knows its own change, which it adds to them.
+        """
+        ledger.generation += 1
+        if exact:
+            ledger.total_bytes, ledger.total_files = self.total_bytes, len(self._sizes)
+            self._generation = ledger.generation
+        else:
+            ledger.total_bytes += bytes_delta
+            ledger.total_files += files_delta
+
+    def _sync_with_disk(self) -> None:
+        """Adopts files other workers cached and forgets the ones they evicted, oldest access first."""
+        on_disk: dict[str, os.stat_result] = {}
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(TEMP_SUFFIX) or not entry.is_file():
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    on_disk[entry.name] = entry.stat()
+        for filename in self._sizes.keys() - on_disk.keys():
+            self._forget(filename)
+        for filename, stat in sorted(on_disk.items(), key=lambda item: item[1].st_atime):
+            if self._sizes.get(filename) != stat.st_size:
+                self._forget(filename)
+                self._sizes[filename] = stat.st_size
+                self.total_bytes += stat.st_size
+                self.policy.admit(filename, stat.st_size)
+
+    def _evicted(self, evicted: list[str]) -> None:
+        for local_path in evicted:
+            logger.info("Evicted %s from cache", local_path)
+            if self.on_evict is not None:
+                self.on_evict(local_path)
+
+    def _evict_over_budget(self) -> list[str]:
+        evicted: list[str] = []
+        while self._over_budget():
+            victim = self.policy.victim()
+            if victim is None:
+                break
+            self._forget(victim)
+            victim_path = self.cache_dir / victim
+            victim_path.unlink(missing_ok=True)
+            evicted.append(victim_path.as_posix())
+        return evicted
+
+    def _over_budget(self) -> bool:
+        return self._exceeds_budget(self.total_bytes, len(self._sizes))
+
+    def _exceeds_budget(self, total_bytes: int, total_files: int) -> bool:
+        if self.max_bytes is not None and total_bytes > self.max_bytes:
+            return True
+        return self.max_files is not None and total_files > self.max_files
+
+    def _forget(self, filename: str) -> None:
+        size = self._sizes.pop(filename, None)
+        if size is not None:
+            self.total_bytes -= size
+            self.policy.remove(filename)
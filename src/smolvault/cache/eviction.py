@@ -0,0 +1,121 @@
+import heapq
+import itertools
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class EvictionPolicy(ABC):
+    """Decides which cached file goes first when the cache is over budget. Callers serialise access."""
+
+    @abstractmethod
+    def admit(self, key: str, size: int) -> None: ...
+
+    @abstractmethod
+    def touch(self, key: str) -> None: ...
+
+    @abstractmethod
+    def remove(self, key: str) -> None: ...
+
+    @abstractmethod
+    def victim(self) -> str | None: ...
+
+
+class LRUPolicy(EvictionPolicy):
+    def __init__(self) -> None:
+        self._entries: OrderedDict[str, int] = OrderedDict()
+
+    def admit(self, key: str, size: int) -> None:
+        self._entries[key] = size
+        self._entries.move_to_end(key)
+
+    def touch(self, key: str) -> None:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+    def remove(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def victim(self) -> str | None:
+        return next(iter(self._entries), None)
+
+
+class _HeapPolicy(EvictionPolicy):
+    """
+    Keeps a min-heap of (priority, sequence, key). Touches push a fresh entry instead of re-sorting,
+    stale entries are skipped when popped and the heap is rebuilt once they outnumber the live ones.
+    """
+
+    def __init__(self) -> None:
+        self._sizes: dict[str, int] = {}
+        self._hits: dict[str, int] = {}
+        self._current: dict[str, tuple[float, int]] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._counter = itertools.count()
+
+    @abstractmethod
+    def _priority(self, key: str) -> float: ...
+
+    def admit(self, key: str, size: int) -> None:
+        self._sizes[key] = size
+        self._hits[key] = 1
+        self._push(key)
+
+    def touch(self, key: str) -> None:
+        if key in self._sizes:
+            self._hits[key] += 1
+            self._push(key)
+
+    def remove(self, key: str) -> None:
+        self._sizes.pop(key, None)
+        self._hits.pop(key, None)
+        self._current.pop(key, None)
+
+    def victim(self) -> str | None:
+        while self._heap:
+            priority, sequence, key = self._heap[0]
+            if self._current.get(key) == (priority, sequence):
+                return key
+            heapq.heappop(self._heap)
+        return None
+
+    def _push(self, key: str) -> None:
+        entry = (self._priority(key), next(self._counter))
+        self._current[key] = entry
+        heapq.heappush(self._heap, (*entry, key))
+        if len(self._heap) > 2 * len(self._current) + 64:
+            self._heap = [(*entry, key) for key, entry in self._current.items()]
+            heapq.heapify(self._heap)
+
+
+class LFUPolicy(_HeapPolicy):
+    """Evicts the least frequently used file, breaking ties by least recent use."""
+
+    def _priority(self, key: str) -> float:
+        return self._hits[key]
+
+
+class GDSFPolicy(_HeapPolicy):
+    """
+    Greedy-Dual-Size-Frequency: priority is clock + hits / size, so large rarely used files go first.
+    The clock advances to each victim's priority, which ages entries that stop being requested.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._clock = 0.0
+
+    def _priority(self, key: str) -> float:
+        return self._clock + self._hits[key] / max(self._sizes[key], 1)
+
+    def remove(self, key: str) -> None:
+        entry = self._current.get(key)
+        if entry is not None and key == self.victim():
+            self._clock = entry[0]
+        super().remove(key)
+
+
+EVICTION_POLICIES: dict[str, type[EvictionPolicy]] = {
+    "lru": LRUPolicy,
+    "lfu": LFUPolicy,
+    "gdsf": GDSFPolicy,
+}
@@ -0,0 +1,77 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import pathlib
+from collections.abc import Iterator
+
+from smolvault.cache.cache_manager import CacheManager
+from smolvault.clients.database import DatabaseClient
+from smolvault.compression import decompress_chunks
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: pathlib.Path, codec: str | None = None) -> str:
+    """Digest of the file's content, decoded first when it is stored with codec."""
+    hasher = hashlib.sha256()
+    with path.open("rb") as f:
+        chunks: Iterator[bytes] = iter(functools.partial(f.read, HASH_CHUNK_SIZE), b"")
+        if codec is not None:
+            chunks = decompress_chunks(chunks, codec)
+        for chunk in chunks:
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def reconcile_cache(cache: CacheManager, db_client: DatabaseClient) -> int:
+    """
+    Clears local_path on records whose cached file is gone, e.g. removed by hand or lost in a crash.
+    Uses the directory listing the cache took at startup, so only paths missing from it are stat'ed.
+    """
+    on_disk = cache.cached_files()
+    cleared = 0
+    for local_path, _, _ in db_client.get_cached_files():
+        path = pathlib.Path(local_path)
+        if path.parent == cache.cache_dir and path.name in on_disk:
+            continue
+        if not path.exists():
+            db_client.clear_cache_path(local_path)
+            cleared += 1
+    logger.info("Reconciled cache with database, cleared %d stale paths", cleared)
+    return cleared
+
+
+class CacheVerifier:
+    """Periodically re-hashes cached files against file_sha256 and quarantines any that do not match."""
+
+    def __init__(self, cache: CacheManager, db_client: DatabaseClient, interval_seconds: float) -> None:
+        self.cache = cache
+        self.db_client = db_client
+        self.interval_seconds = interval_seconds
+
+    def verify_once(self) -> list[str]:
+        quarantined: list[str] = []
+        for local_path, expected_sha256, codec in self.db_client.get_cached_files():
+            path = pathlib.Path(local_path)
+            try:
+                actual_sha256 = file_sha256(path, codec)
+            except FileNotFoundError:
+                self.db_client.clear_cache_path(local_path)
+                continue
+            if actual_sha256 != expected_sha256:
+                logger.error("Cached file %s does not match its checksum", local_path)
+                self.cache.quarantine(path.name)
+                self.db_client.clear_cache_path(local_path)
+                quarantined.append(local_path)
+        return quarantined
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await asyncio.to_thread(self.verify_once)
+            except Exception:
+                logger.exception("Cache verification failed")
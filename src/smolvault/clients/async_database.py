@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import functools
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Annotated, ParamSpec, TypeVar
+
+from fastapi import Depends
+
+from smolvault.auth.models import NewUserDTO
+from smolvault.clients.database import DatabaseClient, FileMetadataRecord, ListingRow, UserInfo
+from smolvault.config import get_settings
+from smolvault.models import FileTagsDTO, FileUploadDTO
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+@lru_cache
+def get_db_executor() -> ThreadPoolExecutor:
+    """Dedicated to database calls so slow queries queue here instead of starving the shared threadpool."""
+    return ThreadPoolExecutor(max_workers=get_settings().db_pool_size, thread_name_prefix="smolvault-db")
+
+
+class AsyncDatabaseClient:
+    """Awaitable mirror of DatabaseClient; every call runs on the database executor, never on the event loop."""
+
+    def __init__(self, client: Annotated[DatabaseClient, Depends(DatabaseClient)]) -> None:
+        self.client = client
+
+    async def _run(self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, fn, *args, **kwargs)
+        return await loop.run_in_executor(get_db_executor(), call)
+
+    async def add_metadata(self, file_upload: FileUploadDTO, key: str, *, require_stored_object: bool = False) -> bool:
+        return await self._run(self.client.add_metadata, file_upload, key, require_stored_object=require_stored_object)
+
+    async def add_metadata_batch(
+        self, uploads: Sequence[tuple[FileUploadDTO, str]], *, require_stored_object: bool = False
+    ) -> list[bool]:
+        return await self._run(self.client.add_metadata_batch, uploads, require_stored_object=require_stored_object)
+
+    async def get_upload_usage(self, user_id: int, since_hour: int) -> dict[int, int]:
+        return await self._run(self.client.get_upload_usage, user_id, since_hour)
+
+    async def get_all_metadata(
+        self,
+        user_id: int,
+        *,
+        start_time: datetime | None = None,
+        end_time: datetime | None = None,
+        offset: int | None = 0,
+        limit: int | None = 10,
+        after: tuple[str, int] | None = None,
+    ) -> Sequence[ListingRow]:
+        return await self._run(
+            self.client.get_all_metadata,
+            user_id,
+            start_time=start_time,
+            end_time=end_time,
+            offset=offset,
+            limit=limit,
+            after=after,
+        )
+
+    async def get_metadata(self, filename: str, user_id: int) -> FileMetadataRecord | None:
+        return await self._run(self.client.get_metadata, filename, user_id)
+
+    async def get_owned_object_size(self, user_id: int, file_sha256: str) -> int | None:
+        return await self._run(self.client.get_owned_object_size, user_id, file_sha256)
+
+    async def get_metadata_by_names(self, names: Sequence[str], user_id: int) -> Sequence[FileMetadataRecord]:
+        return await self._run(self.client.get_metadata_by_names, names, user_id)
+
+    async def select_metadata_by_tags(
+        self,
+        user_id: int,
+        *,
+        all_tags: Sequence[str] = (),
+        any_tags: Sequence[str] = (),
+        not_tags: Sequence[str] = (),
+        offset: int | None = 0,
+        limit: int | None = 10,
+        after: tuple[str, int] | None = None,
+    ) -> Sequence[FileMetadataRecord]:
+        return await self._run(
+            self.client.select_metadata_by_tags,
+            user_id,
+            all_tags=all_tags,
+            any_tags=any_tags,
+            not_tags=not_tags,
+            offset=offset,
+            limit=limit,
+            after=after,
+        )
+
+    async def list_metadata_by_tags(
+        self,
+        user_id: int,
+        *,
+        all_tags: Sequence[str] = (),
+        any_tags: Sequence[str] = (),
+        not_tags: Sequence[str] = (),
+        offset: int | None = 0,
+        limit: int | None = 10,
+        after: tuple[str, int] | None = None,
+    ) -> Sequence[ListingRow]:
+        return await self._run(
+            self.client.list_metadata_by_tags,
+            user_id,
+            all_tags=all_tags,
+            any_tags=any_tags,
+            not_tags=not_tags,
+            offset=offset,
+            limit=limit,
+            after=after,
+        )
+
+    async def search_metadata(
+        self, user_id: int, query: str, *, offset: int = 0, limit: int | None = 10
+    ) -> Sequence[ListingRow]:
+        return await self._run(self.client.search_metadata, user_id, query, offset=offset, limit=limit)
+
+    async def get_tag_counts(self, user_id: int) -> dict[str, int]:
+        return await self._run(self.client.get_tag_counts, user_id)
+
+    async def update_tags(self, record: FileMetadataRecord, tags: FileTagsDTO) -> None:
+        await self._run(self.client.update_tags, record, tags)
+
+    async def update_tags_batch(self, records: Sequence[FileMetadataRecord], tags: FileTagsDTO, user_id: int) -> None:
+        await self._run(self.client.update_tags_batch, records, tags, user_id)
+
+    async def update_metadata(self, record: FileMetadataRecord) -> None:
+        await self._run(self.client.update_metadata, record)
+
+    async def clear_cache_path(self, local_path: str) -> None:
+        await self._run(self.client.clear_cache_path, local_path)
+
+    async def delete_metadata(self, record: FileMetadataRecord, user_id: int) -> str | None:
+        return await self._run(self.client.delete_metadata, record, user_id)
+
+    async def delete_metadata_batch(self, records: Sequence[FileMetadataRecord], user_id: int) -> list[str]:
+        return await self._run(self.client.delete_metadata_batch, records, user_id)
+
+    async def object_pending_delete(self, file_sha256: str) -> bool:
+        return await self._run(self.client.object_pending_delete, file_sha256)
+
+    async def purge_stored_objects(self, file_sha256s: Sequence[str]) -> None:
+        await self._run(self.client.purge_stored_objects, file_sha256s)
+
+    async def get_user(self, username: str) -> UserInfo | None:
+        return await self._run(self.client.get_user, username)
+
+    async def get_files_version(self, user_id: int) -> int:
+        return await self._run(self.client.get_files_version, user_id)
+
+    async def get_user_count(self) -> int:
+        return await self._run(self.client.get_user_count)
+
+    async def add_user(self, user: NewUserDTO, hashed_password: str) -> None:
+        await self._run(self.client.add_user, user, hashed_password)
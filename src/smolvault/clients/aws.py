@@ -1,13 +1,87 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
 import logging
-from typing import Any
+from collections.abc import AsyncIterator, Callable, Generator, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, ParamSpec, Protocol, TypeVar
 
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 from smolvault.config import get_settings
-from smolvault.models import FileUploadDTO
 
 logger = logging.getLogger(__name__)
 
+# the most keys S3 accepts in one DeleteObjects request
+DELETE_OBJECTS_MAX_KEYS = 1000
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class AsyncReader(Protocol):
+    async def read(self, size: int = -1) -> bytes: ...
+
+
+class MultipartUpload:
+    """Pushes an object to S3 part by part, so memory use is bounded by one part."""
+
+    def __init__(self, client: Any, bucket_name: str, key: str, part_size: int) -> None:
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+        self.size = 0
+        self._buffer = bytearray()
+        self._upload_id: str | None = None
+        self._parts: list[dict[str, Any]] = []
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        self._buffer += chunk
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[: self.part_size])
+            del self._buffer[: self.part_size]
+            self._upload_part(part)
+
+    def complete(self) -> None:
+        if self._upload_id is None:
+            # the whole object fit in a single part, a plain put saves two round trips
+            self.client.put_object(Bucket=self.bucket_name, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._parts},
+            )
+        self._buffer.clear()
+
+    def abort(self) -> None:
+        self._buffer.clear()
+        if self._upload_id is not None:
+            logger.info("Aborting multipart upload of %s", self.key)
+            self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self._upload_id)
+
+    def _upload_part(self, body: bytes) -> None:
+        if self._upload_id is None:
+            response = self.client.create_multipart_upload(Bucket=self.bucket_name, Key=self.key)
+            self._upload_id = response["UploadId"]
+        part_number = len(self._parts) + 1
+        response = self.client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
 
 class S3Client:
     def __init__(self, bucket_name: str) -> None:
@@ -15,20 +89,163 @@ class S3Client:
         self.settings = get_settings()
         self.bucket_name = bucket_name
         self.session = boto3.Session()
-        self.client = self.session.client("s3")
-        self.bucket = self.session.resource("s3").Bucket(bucket_name)
+        self.client = self.session.client(
+            "s3",
+            config=Config(
+                max_pool_connections=self.settings.s3_max_pool_connections,
+                # adaptive mode adds client-side rate limiting on top of exponential backoff when S3 throttles
+                retries={"mode": "adaptive", "max_attempts": self.settings.s3_max_attempts},
+            ),
+        )
+
+    @property
+    def presigned(self) -> bool:
+        return self.settings.s3_serving_mode == "presigned"
+
+    def should_presign(self, size: int, cached: bool) -> bool:
+        """Whether a download should go from S3 straight to the client instead of through this server."""
+        return self.presigned and (size >= self.settings.presigned_min_size_bytes or not cached)
+
+    def presigned_download_url(
+        self, key: str, content_disposition: str, media_type: str, content_encoding: str | None = None
+    ) -> str:
+        params = {
+            "Bucket": self.bucket_name,
+            "Key": key,
+            "ResponseContentDisposition": content_disposition,
+            "ResponseContentType": media_type,
+        }
+        if content_encoding is not None:
+            params["ResponseContentEncoding"] = content_encoding
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=self.settings.presigned_url_ttl_seconds
+        )
+
+    def presigned_upload_url(self, key: str, checksum_sha256: str) -> str:
+        """A PUT URL for key that S3 only honours for a body with the given base64 SHA-256 checksum."""
+        return self.client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket_name, "Key": key, "ChecksumSHA256": checksum_sha256},
+            ExpiresIn=self.settings.presigned_url_ttl_seconds,
+        )
+
+    def head(self, key: str) -> dict[str, Any] | None:
+        try:
+            return dict(self.client.head_object(Bucket=self.bucket_name, Key=key, ChecksumMode="ENABLED"))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in {"404", "NoSuchKey", "NotFound"}:
+                return None
+            raise
 
-    def upload(self, data: FileUploadDTO) -> str:
-        key = data.name
-        self.bucket.put_object(Key=key, Body=data.content)
-        logger.info("File %s uploaded successfully", key)
-        return key
+    def start_upload(self, key: str) -> MultipartUpload:
+        return MultipartUpload(self.client, self.bucket_name, key, self.settings.upload_part_size_bytes)
 
-    def download(self, key: str) -> Any:
-        response = self.client.get_object(Bucket=self.bucket_name, Key=key)
-        logger.info("File %s downloaded successfully", key)
-        return response["Body"].read()
+    def iter_object(self, key: str, byte_range: tuple[int, int] | None = None) -> Iterator[bytes]:
+        """Yields the object (or the [start, end) slice of it) in chunks without holding it in memory."""
+        extra_args: dict[str, Any] = {}
+        if byte_range is not None:
+            start, end = byte_range
+            extra_args["Range"] = f"bytes={start}-{end - 1}"
+        response = self.client.get_object(Bucket=self.bucket_name, Key=key, **extra_args)
+        logger.info("Streaming file %s from S3", key)
+        yield from response["Body"].iter_chunks(self.settings.download_chunk_size_bytes)
+
+    def copy(self, source_key: str, key: str) -> None:
+        """Server-side copy within the bucket; a managed transfer, so objects past the CopyObject size limit work."""
+        self.client.copy({"Bucket": self.bucket_name, "Key": source_key}, self.bucket_name, key)
 
     def delete(self, key: str) -> None:
         self.client.delete_object(Bucket=self.bucket_name, Key=key)
         logger.info("Deleted file %s from S3", key)
+
+    def delete_objects(self, keys: Sequence[str]) -> list[str]:
+        """Deletes up to DELETE_OBJECTS_MAX_KEYS objects in one request and returns the keys S3 failed to delete."""
+        response = self.client.delete_objects(
+            Bucket=self.bucket_name,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+        errors = response.get("Errors", [])
+        for error in errors:
+            logger.error("Failed to delete %s from S3: %s", error.get("Key"), error.get("Message"))
+        logger.info("Deleted %d files from S3", len(keys) - len(errors))
+        return [error["Key"] for error in errors]
+
+
+class AsyncS3Client:
+    """
+    Runs the blocking boto3 calls of an S3Client on a bounded executor. The executor size is the
+    per-process cap on concurrent S3 work; requests beyond it queue without holding up the event loop.
+    """
+
+    def __init__(self, client: S3Client, max_concurrency: int) -> None:
+        self.client = client
+        self.settings = client.settings
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="smolvault-s3")
+
+    def _submit(self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> asyncio.Future[T]:
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, fn, *args, **kwargs)
+        return loop.run_in_executor(self.executor, call)
+
+    async def _run(self, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+        return await self._submit(fn, *args, **kwargs)
+
+    async def upload_stream(self, key: str, file: AsyncReader) -> MultipartUpload:
+        upload = self.client.start_upload(key)
+        try:
+            while chunk := await file.read(self.settings.upload_chunk_size_bytes):
+                await self._run(upload.write, chunk)
+            await self._run(upload.complete)
+        except Exception:
+            await self._run(upload.abort)
+            raise
+        logger.info("File %s streamed successfully (%d bytes)", key, upload.size)
+        return upload
+
+    def iter_object(self, key: str, byte_range: tuple[int, int] | None = None) -> AsyncIterator[bytes]:
+        return self.iterate(self.client.iter_object(key, byte_range))
+
+    async def iterate(self, chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+        """Drives a blocking chunk pipeline (an S3 body, optionally teed into the cache) on the executor."""
+        pending: asyncio.Future[bytes | None] | None = None
+        try:
+            while True:
+                pending = self._submit(next, chunks, None)
+                # shielded: cancelling the consumer must not lose track of the next() still running in a thread
+                if (chunk := await asyncio.shield(pending)) is None:
+                    break
+                yield chunk
+        finally:
+            if pending is not None and not pending.done():
+                # closing a generator while next() runs raises "generator already executing"
+                with contextlib.suppress(Exception):
+                    await asyncio.shield(pending)
+            if isinstance(chunks, Generator):
+                await self._run(chunks.close)
+
+    async def presigned_download_url(
+        self, key: str, content_disposition: str, media_type: str, content_encoding: str | None = None
+    ) -> str:
+        # signing is local, but the first call may have to fetch credentials
+        return await self._run(
+            self.client.presigned_download_url, key, content_disposition, media_type, content_encoding
+        )
+
+    async def presigned_upload_url(self, key: str, checksum_sha256: str) -> str:
+        return await self._run(self.client.presigned_upload_url, key, checksum_sha256)
+
+    async def head(self, key: str) -> dict[str, Any] | None:
+        return await self._run(self.client.head, key)
+
+    async def copy(self, source_key: str, key: str) -> None:
+        await self._run(self.client.copy, source_key, key)
+
+    async def delete(self, key: str) -> None:
+        await self._run(self.client.delete, key)
+
+    async def delete_many(self, keys: Sequence[str]) -> list[str]:
+        """Deletes the objects in DeleteObjects batches, run concurrently, and returns the keys that failed."""
+        batches = [keys[i : i + DELETE_OBJECTS_MAX_KEYS] for i in range(0, len(keys), DELETE_OBJECTS_MAX_KEYS)]
+        failed = await asyncio.gather(*(self._run(self.client.delete_objects, batch) for batch in batches))
+        return [key for batch in failed for key in batch]
@@ -1,14 +1,41 @@
-from collections.abc import Sequence
+import logging
+from collections import Counter
+from collections.abc import Iterable, Sequence
 from datetime import datetime
-from typing import Annotated
+from functools import lru_cache
+from typing import Annotated, Any, TypeVar
 
 from pydantic import Field as PydanticField
 from pydantic import validate_call
-from sqlmodel import Field, Session, SQLModel, create_engine, select
+from sqlalchemy import (
+    Engine,
+    Float,
+    Index,
+    Integer,
+    Row,
+    Select,
+    column,
+    event,
+    func,
+    insert,
+    intersect,
+    literal,
+    literal_column,
+    table,
+    tuple_,
+)
+from sqlalchemy import select as select_columns
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Field, Session, SQLModel, col, create_engine, delete, select, update
+from sqlmodel.sql.expression import SelectOfScalar
 
 from smolvault.auth.models import NewUserDTO
+from smolvault.clients.migrations import migrate
+from smolvault.clients.write_queue import WriteQueue
 from smolvault.config import get_settings
-from smolvault.models import FileUploadDTO
+from smolvault.models import FileTagsDTO, FileUploadDTO
+
+logger = logging.getLogger(__name__)
 
 
 class UserInfo(SQLModel, table=True):
@@ -17,12 +44,19 @@ class UserInfo(SQLModel, table=True):
     hashed_password: str
     email: str | None = None
     full_name: str | None = None
+    # bumped by every change to the user's files; listing ETags are derived from it
+    files_version: int = 0
 
 
 class FileMetadataRecord(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_filemetadatarecord_user_id_file_name", "user_id", "file_name"),
+        Index("ix_filemetadatarecord_user_id_upload_timestamp", "user_id", "upload_timestamp"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     file_name: str = Field(index=True)
-    file_sha256: str
+    file_sha256: str = Field(index=True)
     size: int
     object_key: str
     link: str
@@ -30,22 +64,206 @@ class FileMetadataRecord(SQLModel, table=True):
     tags: str | None
     local_path: str | None = None
     cache_timestamp: int | None = None
-    user_id: int | None = Field(default=None, foreign_key="userinfo.id", index=True)
+    user_id: int | None = Field(default=None, foreign_key="userinfo.id")
+    codec: str | None = None  # copied from the stored object; size is always the decoded size
+
+
+class StoredObject(SQLModel, table=True):
+    """
+    One S3 object per distinct file content, shared by every FileMetadataRecord with the same digest. A row with
+    no references is a tombstone: its object is being deleted from S3 and the row goes once that has finished.
+    """
+
+    file_sha256: str = Field(primary_key=True)
+    object_key: str
+    size: int
+    ref_count: int = 0
+    codec: str | None = None  # content coding the object is stored with, None when stored as is
+
+
+class TagCount(SQLModel, table=True):
+    """How many of a user's files carry each tag, kept in step with FileTag so facets never count postings."""
+
+    user_id: int = Field(primary_key=True, foreign_key="userinfo.id")
+    tag_name: str = Field(primary_key=True)
+    file_count: int = 0
+
+
+# FTS5 index over file names and tags, rowid = FileMetadataRecord.id. Created by migration, not create_all.
+# The trigram tokenizer matches any substring of three or more characters, case-insensitively.
+file_search = table("filesearch", column("rowid", Integer), column("file_name"), column("tags"), column("rank", Float))
+MIN_SEARCH_TERM_LENGTH = 3
+
+
+def full_text_query(text: str, *, fuzzy: bool = False) -> str:
+    """
+    Turns what the user typed into an FTS5 query. Every term must appear somewhere in the name or tags;
+    with fuzzy, any trigram of any term will do and bm25 puts the files sharing the most trigrams first,
+    which tolerates typos. Terms shorter than a trigram cannot be looked up and are dropped.
+    """
+    terms = [term.lower() for term in text.split() if len(term) >= MIN_SEARCH_TERM_LENGTH]
+    if not terms:
+        raise ValueError(f"Search terms need at least {MIN_SEARCH_TERM_LENGTH} characters")
+    if fuzzy:
+        phrases = dict.fromkeys(term[i : i + 3] for term in terms for i in range(len(term) - 2))
+        return " OR ".join(_fts_phrase(phrase) for phrase in phrases)
+    return " AND ".join(_fts_phrase(term) for term in terms)
+
+
+def _fts_phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def content_object_key(file_sha256: str) -> str:
+    return f"objects/{file_sha256}"
+
+
+def cache_file_name(file_sha256: str, codec: str | None) -> str:
+    """
+    Name of the content's cache entry. The cache holds the bytes as stored, so the codec is part of the name: a
+    record stored as is and one stored compressed never share an entry even when their content is the same.
+    """
+    return file_sha256 if codec is None else f"{file_sha256}.{codec}"
+
+
+def presigned_upload_key(user_id: int, file_sha256: str) -> str:
+    """Where a client PUTs a presigned upload; private to the user until /file/upload/complete adopts it."""
+    return f"uploads/{user_id}/{file_sha256}"
+
+
+# What a listing shows of each file, preceded by the id its page cursor is keyed on. Listings select just these
+# columns and hand the rows to ListingResponse, so no record or response model is built for them.
+LISTING_COLUMNS = (
+    col(FileMetadataRecord.id),
+    col(FileMetadataRecord.file_name),
+    col(FileMetadataRecord.size),
+    col(FileMetadataRecord.upload_timestamp),
+    col(FileMetadataRecord.link),
+    col(FileMetadataRecord.file_sha256),
+    col(FileMetadataRecord.tags),
+)
+ListingRow = Row[tuple[int, str, int, str, str, str, str | None]]
+
+StatementT = TypeVar("StatementT", bound=Select[Any])
+
+
+class UploadUsage(SQLModel, table=True):
+    """Bytes a user uploaded per hour, summed over the last USAGE_WINDOW_HOURS for the daily upload limit."""
+
+    user_id: int = Field(primary_key=True, foreign_key="userinfo.id")
+    hour: int = Field(primary_key=True)  # hours since the epoch
+    bytes_uploaded: int = 0
+
+
+USAGE_WINDOW_HOURS = 24
+
+
+def usage_hour(timestamp: str | None = None) -> int:
+    moment = datetime.fromisoformat(timestamp) if timestamp else datetime.now()
+    return int(moment.timestamp() // 3600)
 
 
 class FileTag(SQLModel, table=True):
+    # per-user posting lists: every file id carrying a tag, read straight from the index
+    __table_args__ = (Index("ix_filetag_user_id_tag_name_file_id", "user_id", "tag_name", "file_id"),)
+
     id: int | None = Field(default=None, primary_key=True)
-    tag_name: str = Field(index=True)
-    file_id: int | None = Field(default=None, foreign_key="filemetadatarecord.id")
+    tag_name: str
+    file_id: int | None = Field(default=None, foreign_key="filemetadatarecord.id", index=True)
+    user_id: int | None = Field(default=None, foreign_key="userinfo.id")
+
+
+def create_db_engine(url: str) -> Engine:
+    settings = get_settings()
+    engine = create_engine(
+        url,
+        echo=False,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        # connections are handed between the event loop and threadpool workers
+        connect_args={"check_same_thread": False},
+    )
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    SQLModel.metadata.create_all(engine)
+    migrate(engine)
+    return engine
+
+
+def _set_sqlite_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+    settings = get_settings()
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers run alongside the writer; NORMAL only fsyncs at checkpoints, which is safe under WAL
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.db_mmap_size_bytes)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.db_busy_timeout_ms)}")
+    cursor.close()
+
+
+@lru_cache
+def get_engine() -> Engine:
+    """One engine and connection pool per worker process, built on first use (app startup)."""
+    settings = get_settings()
+    logger.info("Creating database engine for %s", settings.smolvault_db)
+    return create_db_engine(f"sqlite:///{settings.smolvault_db}")
+
+
+@lru_cache
+def get_write_queue(engine: Engine) -> WriteQueue:
+    return WriteQueue(engine, max_batch=get_settings().db_write_batch_size)
 
 
 class DatabaseClient:
+    """Request-scoped handle on the shared engine; constructing one costs nothing beyond a lookup."""
+
     def __init__(self) -> None:
-        self.settings = get_settings()
-        self.engine = create_engine(f"sqlite:///{self.settings.smolvault_db}", echo=False)
-        SQLModel.metadata.create_all(self.engine)
+        self.engine = get_engine()
 
-    def add_metadata(self, file_upload: FileUploadDTO, key: str) -> None:
+    @property
+    def writer(self) -> WriteQueue:
+        return get_write_queue(self.engine)
+
+    def add_metadata(self, file_upload: FileUploadDTO, key: str, *, require_stored_object: bool = False) -> bool:
+        """
+        Inserts the record and takes a reference on its stored object. With require_stored_object the insert
+        only happens when that content is already in S3; False is returned so the caller can upload it first.
+        """
+        return self.writer.execute(
+            lambda session: self._insert_metadata(
+                session, file_upload, key, require_stored_object=require_stored_object
+            )
+        )
+
+    def add_metadata_batch(
+        self, uploads: Sequence[tuple[FileUploadDTO, str]], *, require_stored_object: bool = False
+    ) -> list[bool]:
+        """add_metadata for many files in one transaction, returning whether each one was inserted."""
+
+        def write(session: Session) -> list[bool]:
+            return [
+                self._insert_metadata(session, file_upload, key, require_stored_object=require_stored_object)
+                for file_upload, key in uploads
+            ]
+
+        return self.writer.execute(write)
+
+    def _insert_metadata(
+        self, session: Session, file_upload: FileUploadDTO, key: str, *, require_stored_object: bool
+    ) -> bool:
+        stored_object = session.get(StoredObject, file_upload.file_sha256)
+        if stored_object is None or stored_object.ref_count == 0:
+            if require_stored_object:
+                return False
+            if stored_object is None:
+                stored_object = StoredObject(
+                    file_sha256=file_upload.file_sha256, object_key=key, size=file_upload.size, codec=file_upload.codec
+                )
+            else:
+                # a tombstone is only revived by an upload that gave up waiting for its delete to finish
+                stored_object.object_key = key
+                stored_object.size = file_upload.size
+                stored_object.codec = file_upload.codec
         file_metadata = FileMetadataRecord(
             file_name=file_upload.name,
             file_sha256=file_upload.file_sha256,
@@ -55,13 +273,104 @@ class DatabaseClient:
             upload_timestamp=file_upload.upload_timestamp,
             tags=file_upload.tags,
             user_id=file_upload.user_id,
+            codec=stored_object.codec,
+        )
+        stored_object.ref_count += 1
+        session.add(stored_object)
+        session.add(file_metadata)
+        session.flush()
+        self._set_file_tags(session, file_metadata, file_upload.tags_list)
+        self._index_for_search(session, file_metadata)
+        self._add_upload_usage(session, file_upload.user_id, usage_hour(file_upload.upload_timestamp), file_upload.size)
+        self._bump_files_version(session, file_upload.user_id)
+        return True
+
+    @staticmethod
+    def _bump_files_version(session: Session, user_id: int | None) -> None:
+        session.execute(
+            update(UserInfo)
+            .where(UserInfo.id == user_id)  # type: ignore[arg-type]
+            .values(files_version=UserInfo.files_version + 1)
+        )
+
+    @staticmethod
+    def _index_for_search(session: Session, *records: FileMetadataRecord) -> None:
+        session.execute(delete(file_search).where(file_search.c.rowid.in_([record.id for record in records])))
+        session.execute(
+            insert(file_search),
+            [{"rowid": record.id, "file_name": record.file_name, "tags": record.tags or ""} for record in records],
         )
+
+    @classmethod
+    def _set_file_tags(cls, session: Session, record: FileMetadataRecord, tags: Iterable[str]) -> None:
+        """Replaces the file's postings with tags and moves the user's tag counts to match."""
+        if record.id is not None:
+            cls._replace_tags(session, record.user_id, [record.id], tags)
+
+    @staticmethod
+    def _replace_tags(session: Session, user_id: int | None, file_ids: Sequence[int], tags: Iterable[str]) -> None:
+        """Gives every file in file_ids exactly the postings in tags, in a fixed number of statements."""
+        wanted = {tag for tag in tags if tag}
+        postings = session.exec(
+            select(FileTag.file_id, FileTag.tag_name).where(col(FileTag.file_id).in_(file_ids))
+        ).all()
+        kept = {(file_id, tag) for file_id, tag in postings if tag in wanted}
+        changes: Counter[str] = Counter()
+        changes.subtract(tag for _, tag in postings if tag not in wanted)
+        if len(kept) < len(postings):
+            session.execute(
+                delete(FileTag).where(col(FileTag.file_id).in_(file_ids)).where(col(FileTag.tag_name).not_in(wanted))
+            )
+        added = [(file_id, tag) for file_id in file_ids for tag in wanted if (file_id, tag) not in kept]
+        if added:
+            session.execute(
+                insert(FileTag), [{"tag_name": tag, "file_id": file_id, "user_id": user_id} for file_id, tag in added]
+            )
+        changes.update(tag for _, tag in added)
+        if user_id is None or not changes:
+            return
+        upsert = sqlite_insert(TagCount)
+        session.execute(
+            upsert.on_conflict_do_update(
+                index_elements=["user_id", "tag_name"],
+                set_={"file_count": TagCount.file_count + upsert.excluded.file_count},
+            ),
+            [{"user_id": user_id, "tag_name": tag, "file_count": delta} for tag, delta in changes.items()],
+        )
+        removed = [tag for tag, delta in changes.items() if delta < 0]
+        if removed:
+            session.execute(
+                delete(TagCount)
+                .where(TagCount.user_id == user_id)  # type: ignore[arg-type]
+                .where(col(TagCount.tag_name).in_(removed))
+                .where(TagCount.file_count <= 0)  # type: ignore[arg-type]
+            )
+
+    @staticmethod
+    def _add_upload_usage(session: Session, user_id: int, hour: int, size: int) -> None:
+        upsert = sqlite_insert(UploadUsage).values(user_id=user_id, hour=hour, bytes_uploaded=size)
+        session.execute(
+            upsert.on_conflict_do_update(
+                index_elements=["user_id", "hour"],
+                set_={"bytes_uploaded": UploadUsage.bytes_uploaded + upsert.excluded.bytes_uploaded},
+            )
+        )
+        # buckets that slid out of the window are never read again
+        session.execute(
+            delete(UploadUsage)
+            .where(UploadUsage.user_id == user_id)  # type: ignore[arg-type]
+            .where(UploadUsage.hour <= hour - USAGE_WINDOW_HOURS)  # type: ignore[arg-type]
+        )
+
+    def get_upload_usage(self, user_id: int, since_hour: int) -> dict[int, int]:
+        """Bytes uploaded by the user per hour, for every hour from since_hour on."""
         with Session(self.engine) as session:
-            session.add(file_metadata)
-            session.commit()
-            for tag in file_upload.tags_list:
-                session.add(FileTag(tag_name=tag, file_id=file_metadata.id))
-            session.commit()
+            statement = (
+                select(UploadUsage.hour, UploadUsage.bytes_uploaded)
+                .where(UploadUsage.user_id == user_id)
+                .where(UploadUsage.hour >= since_hour)
+            )
+            return dict(session.exec(statement).all())
 
     @validate_call
     def get_all_metadata(
@@ -72,15 +381,28 @@ class DatabaseClient:
         end_time: datetime | None = None,
         offset: int | None = 0,
         limit: Annotated[int | None, PydanticField(default=10, lt=100)] = 10,
-    ) -> Sequence[FileMetadataRecord]:
+        after: tuple[str, int] | None = None,
+    ) -> Sequence[ListingRow]:
+        """
+        LISTING_COLUMNS of the user's files in (upload_timestamp, id) order; after is the key of the last row of
+        the previous page.
+        """
         with Session(self.engine) as session:
-            statement = select(FileMetadataRecord).where(FileMetadataRecord.user_id == user_id)
+            statement = select_columns(*LISTING_COLUMNS).where(col(FileMetadataRecord.user_id) == user_id)
             if start_time:
-                statement = statement.where(FileMetadataRecord.upload_timestamp >= start_time.isoformat())
+                statement = statement.where(col(FileMetadataRecord.upload_timestamp) >= start_time.isoformat())
             if end_time:
-                statement = statement.where(FileMetadataRecord.upload_timestamp <= end_time.isoformat())
-            results = session.exec(statement.offset(offset).limit(limit)).all()
-            return results
+                statement = statement.where(col(FileMetadataRecord.upload_timestamp) <= end_time.isoformat())
+            statement = self._page(statement, after)
+            return session.execute(statement.offset(offset).limit(limit)).all()
+
+    @staticmethod
+    def _page(statement: StatementT, after: tuple[str, int] | None) -> StatementT:
+        """Keyset pagination: seeks straight past the previous page instead of counting through an offset."""
+        key = (col(FileMetadataRecord.upload_timestamp), col(FileMetadataRecord.id))
+        if after is not None:
+            statement = statement.where(tuple_(*key) > tuple_(literal(after[0]), literal(after[1])))
+        return statement.order_by(*key)
 
     def get_metadata(self, filename: str, user_id: int) -> FileMetadataRecord | None:
         with Session(self.engine) as session:
@@ -91,58 +413,304 @@ class DatabaseClient:
             )
             return session.exec(statement).first()
 
-    def select_metadata_by_tag(
+    def get_owned_object_size(self, user_id: int, file_sha256: str) -> int | None:
+        """Size of the stored object for this content when one of the user's files references it, else None."""
+        with Session(self.engine) as session:
+            statement = (
+                select(StoredObject.size)
+                .join(FileMetadataRecord, col(FileMetadataRecord.file_sha256) == StoredObject.file_sha256)
+                .where(StoredObject.file_sha256 == file_sha256)
+                .where(FileMetadataRecord.user_id == user_id)
+                .where(col(FileMetadataRecord.object_key) == StoredObject.object_key)
+                .limit(1)
+            )
+            return session.exec(statement).first()
+
+    def get_metadata_by_names(self, names: Sequence[str], user_id: int) -> Sequence[FileMetadataRecord]:
+        with Session(self.engine) as session:
+            statement = (
+                select(FileMetadataRecord)
+                .where(FileMetadataRecord.user_id == user_id)
+                .where(col(FileMetadataRecord.file_name).in_(names))
+            )
+            return session.exec(statement).all()
+
+    @validate_call
+    def select_metadata_by_tags(
         self,
-        tag: str,
         user_id: int,
+        *,
+        all_tags: Sequence[str] = (),
+        any_tags: Sequence[str] = (),
+        not_tags: Sequence[str] = (),
         offset: int | None = 0,
         limit: Annotated[int | None, PydanticField(default=10, lt=100)] = 10,
+        after: tuple[str, int] | None = None,
     ) -> Sequence[FileMetadataRecord]:
+        """Records carrying every tag in all_tags, at least one in any_tags and none in not_tags."""
+        with Session(self.engine) as session:
+            statement = self._by_tags(select(FileMetadataRecord), user_id, all_tags, any_tags, not_tags)
+            statement = self._page(statement, after)
+            return session.exec(statement.offset(offset).limit(limit)).all()
+
+    @validate_call
+    def list_metadata_by_tags(
+        self,
+        user_id: int,
+        *,
+        all_tags: Sequence[str] = (),
+        any_tags: Sequence[str] = (),
+        not_tags: Sequence[str] = (),
+        offset: int | None = 0,
+        limit: Annotated[int | None, PydanticField(default=10, lt=100)] = 10,
+        after: tuple[str, int] | None = None,
+    ) -> Sequence[ListingRow]:
+        """Like select_metadata_by_tags, but only the LISTING_COLUMNS of each file."""
+        with Session(self.engine) as session:
+            statement = self._by_tags(select_columns(*LISTING_COLUMNS), user_id, all_tags, any_tags, not_tags)
+            statement = self._page(statement, after)
+            return session.execute(statement.offset(offset).limit(limit)).all()
+
+    @classmethod
+    def _by_tags(
+        cls,
+        statement: StatementT,
+        user_id: int,
+        all_tags: Sequence[str],
+        any_tags: Sequence[str],
+        not_tags: Sequence[str],
+    ) -> StatementT:
+        record_id = col(FileMetadataRecord.id)
+        required = list(dict.fromkeys(all_tags))
+        if len(required) > 1:
+            tagged_with_all = intersect(*(cls._tag_postings(user_id, [tag]) for tag in required))
+            # the intersection is small; look its rows up by id and sort them rather than walking the
+            # user's whole listing in upload order to find them (the + 0 keeps SQLite off that index)
+            statement = statement.where(col(FileMetadataRecord.user_id) + 0 == user_id)
+            statement = statement.where(record_id.in_(tagged_with_all))
+        else:
+            statement = statement.where(col(FileMetadataRecord.user_id) == user_id)
+            if required:
+                statement = statement.where(record_id.in_(cls._tag_postings(user_id, required)))
+        if any_tags:
+            statement = statement.where(record_id.in_(cls._tag_postings(user_id, any_tags)))
+        if not_tags:
+            statement = statement.where(record_id.not_in(cls._tag_postings(user_id, not_tags)))
+        return statement
+
+    @staticmethod
+    def _tag_postings(user_id: int, tags: Iterable[str]) -> SelectOfScalar[int | None]:
+        """File ids of the user's files carrying any of tags, answered from the posting-list index alone."""
+        return (
+            select(col(FileTag.file_id))
+            .where(FileTag.user_id == user_id)
+            .where(col(FileTag.tag_name).in_(tags))
+            .where(col(FileTag.file_id).is_not(None))
+        )
+
+    @validate_call
+    def search_metadata(
+        self,
+        user_id: int,
+        query: str,
+        *,
+        offset: Annotated[int, PydanticField(ge=0)] = 0,
+        limit: Annotated[int | None, PydanticField(default=10, lt=100)] = 10,
+    ) -> Sequence[ListingRow]:
+        """
+        LISTING_COLUMNS of the files matching an FTS5 query (see full_text_query), best match first. Pages are
+        addressed by position rather than keyed on rank: bm25 scores come from corpus statistics shared by every
+        user's files, so any upload, delete or retag shifts them all, while the order of one user's matches
+        rarely moves.
+        """
         with Session(self.engine) as session:
             statement = (
-                select(FileMetadataRecord)
-                .where(FileTag.file_id == FileMetadataRecord.id)
-                .where(FileTag.tag_name == tag)
-                .where(FileMetadataRecord.user_id == user_id)
+                select_columns(*LISTING_COLUMNS)
+                .join(file_search, file_search.c.rowid == FileMetadataRecord.id)
+                .where(literal_column("filesearch").op("MATCH")(query))
+                .where(col(FileMetadataRecord.user_id) == user_id)
+                .order_by(file_search.c.rank, col(FileMetadataRecord.id))
             )
-            results = session.exec(statement.offset(offset).limit(limit))
-            return results.fetchall()
+            return session.execute(statement.offset(offset).limit(limit)).all()
 
-    def update_metadata(self, record: FileMetadataRecord) -> None:
+    def get_tag_counts(self, user_id: int) -> dict[str, int]:
         with Session(self.engine) as session:
+            statement = (
+                select(TagCount.tag_name, TagCount.file_count)
+                .where(TagCount.user_id == user_id)
+                .order_by(col(TagCount.file_count).desc(), TagCount.tag_name)
+            )
+            return dict(session.exec(statement).all())
+
+    def update_tags(self, record: FileMetadataRecord, tags: FileTagsDTO) -> None:
+        record.tags = tags.tags_str
+
+        def write(session: Session) -> None:
             session.add(record)
-            session.commit()
-            session.refresh(record)
+            self._set_file_tags(session, record, [tag.strip() for tag in tags.tags])
+            self._index_for_search(session, record)
+            self._bump_files_version(session, record.user_id)
+
+        self.writer.execute(write)
+
+    def update_tags_batch(self, records: Sequence[FileMetadataRecord], tags: FileTagsDTO, user_id: int) -> None:
+        """Sets the same tags on every record with a handful of set-based statements in one transaction."""
+        file_ids = [record.id for record in records if record.id is not None]
+        for record in records:
+            record.tags = tags.tags_str
+
+        def write(session: Session) -> None:
+            session.execute(
+                update(FileMetadataRecord)
+                .where(col(FileMetadataRecord.id).in_(file_ids))
+                .where(FileMetadataRecord.user_id == user_id)  # type: ignore[arg-type]
+                .values(tags=tags.tags_str)
+            )
+            self._replace_tags(session, user_id, file_ids, [tag.strip() for tag in tags.tags])
+            self._index_for_search(session, *records)
+            self._bump_files_version(session, user_id)
+
+        self.writer.execute(write)
+
+    def update_metadata(self, record: FileMetadataRecord) -> None:
+        def write(session: Session) -> None:
+            session.add(record)
+            session.flush()
+            self._index_for_search(session, record)
+            self._bump_files_version(session, record.user_id)
+
+        self.writer.execute(write)
+
+    def get_cached_files(self) -> list[tuple[str, str, str | None]]:
+        """Distinct (local_path, file_sha256, codec) for every record the database believes is cached."""
+        with Session(self.engine) as session:
+            statement = (
+                select(FileMetadataRecord.local_path, FileMetadataRecord.file_sha256, FileMetadataRecord.codec)
+                .where(FileMetadataRecord.local_path != None)  # noqa: E711
+                .distinct()
+            )
+            return [(local_path, sha, codec) for local_path, sha, codec in session.exec(statement) if local_path]
+
+    def mark_cached(self, file_sha256: str, codec: str | None, local_path: str, cache_timestamp: int) -> None:
+        statement = (
+            update(FileMetadataRecord)
+            .where(FileMetadataRecord.file_sha256 == file_sha256)  # type: ignore[arg-type]
+            .where(FileMetadataRecord.codec == codec)  # type: ignore[arg-type]
+            .values(local_path=local_path, cache_timestamp=cache_timestamp)
+        )
+        self.writer.execute(lambda session: session.execute(statement))
+
+    def clear_cache_path(self, local_path: str) -> None:
+        statement = (
+            update(FileMetadataRecord)
+            .where(FileMetadataRecord.local_path == local_path)  # type: ignore[arg-type]
+            .values(local_path=None, cache_timestamp=None)
+        )
+        self.writer.execute(lambda session: session.execute(statement))
+
+    def delete_metadata(self, record: FileMetadataRecord, user_id: int) -> str | None:
+        """
+        Deletes the record and drops its reference on the stored object. Returns the object key once nothing
+        references it any more, in which case the caller removes it from S3 and then calls purge_stored_objects;
+        None while it is still shared.
+        """
+        unreferenced = self.delete_metadata_batch([record], user_id)
+        return unreferenced[0] if unreferenced else None
+
+    def delete_metadata_batch(self, records: Sequence[FileMetadataRecord], user_id: int) -> list[str]:
+        """delete_metadata for many records in one transaction, returning every object key left unreferenced."""
+
+        def write(session: Session) -> list[str]:
+            record_id = col(FileMetadataRecord.id)
+            requested = [record.id for record in records if record.id is not None]
+            # another request may have deleted some of them since they were read; drop references only once
+            present = set(
+                session.exec(
+                    select(record_id).where(record_id.in_(requested)).where(FileMetadataRecord.user_id == user_id)
+                ).all()
+            )
+            deleted = [record for record in records if record.id in present]
+            if not deleted:
+                return []
+            file_ids = [record.id for record in deleted if record.id is not None]
+            self._replace_tags(session, user_id, file_ids, ())
+            session.execute(delete(file_search).where(file_search.c.rowid.in_(file_ids)))
+            session.execute(delete(FileMetadataRecord).where(record_id.in_(file_ids)))
+            self._bump_files_version(session, user_id)
+            usage: Counter[int] = Counter()
+            for record in deleted:
+                usage[usage_hour(record.upload_timestamp)] += record.size
+            for hour, size in usage.items():
+                session.execute(
+                    update(UploadUsage)
+                    .where(UploadUsage.user_id == user_id)  # type: ignore[arg-type]
+                    .where(UploadUsage.hour == hour)  # type: ignore[arg-type]
+                    .values(bytes_uploaded=func.max(UploadUsage.bytes_uploaded - size, 0))
+                )
+            stored_objects = {
+                stored_object.file_sha256: stored_object
+                for stored_object in session.exec(
+                    select(StoredObject).where(
+                        col(StoredObject.file_sha256).in_({record.file_sha256 for record in deleted})
+                    )
+                )
+            }
+            unreferenced: list[str] = []
+            for record in deleted:
+                stored_object = stored_objects.get(record.file_sha256)
+                if stored_object is None or stored_object.object_key != record.object_key:
+                    # uploaded before objects were content addressed, the key belongs to this record alone
+                    unreferenced.append(record.object_key)
+                    continue
+                stored_object.ref_count -= 1
+                if stored_object.ref_count == 0:
+                    unreferenced.append(stored_object.object_key)
+            for stored_object in stored_objects.values():
+                # unreferenced rows stay behind as tombstones until purge_stored_objects
+                session.add(stored_object)
+            return unreferenced
 
-    def delete_metadata(self, record: FileMetadataRecord, user_id: int) -> None:
+        return self.writer.execute(write)
+
+    def object_pending_delete(self, file_sha256: str) -> bool:
+        """Whether the stored object for this content is a tombstone, i.e. still being deleted from S3."""
         with Session(self.engine) as session:
-            session.delete(record)
-            session.commit()
-            statement = select(FileTag).where(FileTag.file_id == record.id).where(FileMetadataRecord.user_id == user_id)
-            tags = session.exec(statement)
-            for tag in tags:
-                session.delete(tag)
-            session.commit()
+            statement = select(StoredObject.ref_count).where(StoredObject.file_sha256 == file_sha256)
+            return session.exec(statement).first() == 0
+
+    def purge_stored_objects(self, file_sha256s: Iterable[str]) -> None:
+        """Drops the tombstones of these contents once their objects are gone from S3. Revived rows are kept."""
+        statement = (
+            delete(StoredObject)
+            .where(col(StoredObject.file_sha256).in_(set(file_sha256s)))
+            .where(col(StoredObject.ref_count) == 0)
+        )
+        self.writer.execute(lambda session: session.execute(statement))
 
     def get_user(self, username: str) -> UserInfo | None:
         with Session(self.engine) as session:
             statement = select(UserInfo).where(UserInfo.username == username)
             return session.exec(statement).first()
 
+    def get_files_version(self, user_id: int) -> int:
+        with Session(self.engine) as session:
+            statement = select(UserInfo.files_version).where(UserInfo.id == user_id)
+            return session.exec(statement).first() or 0
+
     def get_user_count(self) -> int:
         with Session(self.engine) as session:
-            statement = select(UserInfo)
-            results = session.exec(statement)
-            return len(results.fetchall())
+            statement = select(func.count()).select_from(UserInfo)
+            return session.exec(statement).one()
 
-    def add_user(self, user: NewUserDTO) -> None:
+    def add_user(self, user: NewUserDTO, hashed_password: str) -> None:
         user_info = UserInfo(
             username=user.username,
-            hashed_password=user.hashed_password,
+            hashed_password=hashed_password,
             email=user.email,
             full_name=user.full_name,
         )
-        with Session(self.engine) as session:
+
+        def write(session: Session) -> None:
             session.add(user_info)
-            session.commit()
-            session.refresh(user_info)
+
+        self.writer.execute(write)
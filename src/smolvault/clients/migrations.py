@@ -0,0 +1,97 @@
+import logging
+from collections.abc import Callable, Sequence
+
+from sqlalchemy import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+Migration = Callable[[Connection], None]
+
+
+def add_query_indexes(conn: Connection) -> None:
+    """The composite indexes the models declared when this migration shipped, frozen here as DDL."""
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_filemetadatarecord_user_id_file_name ON filemetadatarecord (user_id, file_name)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_filemetadatarecord_user_id_upload_timestamp "
+        "ON filemetadatarecord (user_id, upload_timestamp)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_filemetadatarecord_file_sha256 ON filemetadatarecord (file_sha256)"
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_filetag_tag_name_file_id ON filetag (tag_name, file_id)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_filetag_file_id ON filetag (file_id)")
+    # leading columns of the composite indexes that replace them
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_filemetadatarecord_user_id")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_filetag_tag_name")
+
+
+def add_tag_posting_lists(conn: Connection) -> None:
+    """Gives every tag its owner so a user's tags form posting lists in one covering index."""
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(filetag)")}
+    if "user_id" not in columns:
+        conn.exec_driver_sql("ALTER TABLE filetag ADD COLUMN user_id INTEGER REFERENCES userinfo (id)")
+    conn.exec_driver_sql(
+        "UPDATE filetag SET user_id = (SELECT user_id FROM filemetadatarecord WHERE id = filetag.file_id) "
+        "WHERE user_id IS NULL"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_filetag_user_id_tag_name_file_id ON filetag (user_id, tag_name, file_id)"
+    )
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_filetag_tag_name_file_id")
+    conn.exec_driver_sql(
+        "INSERT INTO tagcount (user_id, tag_name, file_count) "
+        "SELECT user_id, tag_name, COUNT(DISTINCT file_id) FROM filetag WHERE user_id IS NOT NULL "
+        "GROUP BY user_id, tag_name ON CONFLICT DO NOTHING"
+    )
+
+
+def add_file_search(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS filesearch USING fts5(file_name, tags, tokenize = 'trigram')"
+    )
+    conn.exec_driver_sql(
+        "INSERT INTO filesearch (rowid, file_name, tags) SELECT id, file_name, coalesce(tags, '') "
+        "FROM filemetadatarecord WHERE id NOT IN (SELECT rowid FROM filesearch)"
+    )
+
+
+def add_files_version(conn: Connection) -> None:
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(userinfo)")}
+    if "files_version" not in columns:
+        conn.exec_driver_sql("ALTER TABLE userinfo ADD COLUMN files_version INTEGER NOT NULL DEFAULT 0")
+
+
+def add_codecs(conn: Connection) -> None:
+    for table in ("filemetadatarecord", "storedobject"):
+        columns = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")}
+        if "codec" not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN codec VARCHAR")
+
+
+# Append only. Each entry runs once per database, in order, and PRAGMA user_version records how many have
+# run. They also run on brand new databases right after create_all, so each must be a no-op on the current
+# schema. Spell the schema changes out in SQL rather than reading the models, which keep changing, and never
+# edit an entry once it has shipped: databases that already ran it won't run it again, so fixes go in a new one.
+MIGRATIONS: Sequence[Migration] = (
+    add_query_indexes,
+    add_tag_posting_lists,
+    add_file_search,
+    add_files_version,
+    add_codecs,
+)
+
+
+def migrate(engine: Engine, migrations: Sequence[Migration] = MIGRATIONS) -> int:
+    """Brings the schema up to date and returns its version. Safe to call from several processes at once."""
+    with engine.connect() as conn:
+        # take the write lock before reading the version so two workers never run the same migration
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        version: int = conn.exec_driver_sql("PRAGMA user_version").scalar_one()
+        for number, migration in enumerate(migrations[version:], start=version + 1):
+            logger.info("Applying database migration %d (%s)", number, migration.__name__)
+            migration(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version={number}")
+        conn.commit()
+    return max(version, len(migrations))
@@ -0,0 +1,78 @@
+import logging
+import queue
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import Any, TypeVar
+
+from sqlalchemy import Engine
+from sqlmodel import Session
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+WriteJob = Callable[[Session], Any]
+
+
+class WriteQueue:
+    """
+    Funnels every write made by this process through a single thread. Jobs that queue up while a
+    transaction is in flight are drained into the next one, so a burst of small writes (such as the
+    cache-timestamp updates after downloads) costs one commit instead of one each. SQLite only allows
+    one writer at a time anyway; with WAL enabled readers are never blocked by this thread.
+    """
+
+    def __init__(self, engine: Engine, max_batch: int = 64) -> None:
+        self.engine = engine
+        self.max_batch = max_batch
+        self._jobs: queue.SimpleQueue[tuple[WriteJob, Future[Any]] | None] = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="smolvault-db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, job: Callable[[Session], T]) -> "Future[T]":
+        future: Future[T] = Future()
+        self._jobs.put((job, future))
+        return future
+
+    def execute(self, job: Callable[[Session], T]) -> T:
+        return self.submit(job).result()
+
+    def close(self) -> None:
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            item = self._jobs.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch: list[tuple[WriteJob, Future[Any]]]) -> None:
+        try:
+            with Session(self.engine, expire_on_commit=False) as session:
+                # take the write lock up front so busy_timeout applies instead of failing on lock upgrade
+                session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                results = [job(session) for job, _ in batch]
+                session.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            logger.warning("Batched write of %d jobs failed, retrying them one by one", len(batch))
+            for item in batch:
+                self._commit([item])
+            return
+        for (_, future), result in zip(batch, results, strict=True):
+            future.set_result(result)
@@ -0,0 +1,240 @@
+import asyncio
+import functools
+import gzip
+import importlib
+from collections.abc import Callable, Generator, Iterable, Iterator
+from types import ModuleType
+from typing import BinaryIO
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from smolvault.cache.ttl import TTLCache
+from smolvault.clients.aws import AsyncReader
+
+
+def _optional_module(name: str) -> ModuleType | None:
+    """Codecs beyond gzip come from optional packages (pip install smolvault[compression])."""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+brotli = _optional_module("brotli")
+zstandard = _optional_module("zstandard")
+
+Encoder = Callable[[bytes], bytes]
+
+
+def _gzip(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+# content codings we can produce, in the order we prefer them when the client accepts several equally
+ENCODERS: dict[str, Encoder] = {}
+if zstandard is not None:
+    # compressor objects are not thread-safe, so every call gets its own
+    ENCODERS["zstd"] = functools.partial(zstandard.compress, level=3)
+if brotli is not None:
+    ENCODERS["br"] = functools.partial(brotli.compress, quality=5)
+ENCODERS["gzip"] = _gzip
+
+COMPRESSIBLE_TYPES = frozenset(
+    {
+        "application/json",
+        "application/javascript",
+        "application/xml",
+        "application/x-ndjson",
+        "image/svg+xml",
+    }
+)
+
+
+def is_compressible(media_type: str | None) -> bool:
+    """Only text-like types are worth it; images, video, archives and unknown binaries are already dense."""
+    if media_type is None:
+        return False
+    media_type = media_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES or media_type.endswith(("+json", "+xml"))
+
+
+def negotiate_encoding(accept_encoding: str, available: Iterable[str] = ENCODERS) -> str | None:
+    """The coding to respond with under RFC 9110 Accept-Encoding rules, or None to send the body as is."""
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                continue
+        weights[coding] = weight
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for coding in available:  # iterated in our order of preference, so ties go to the earlier coding
+        weight = weights.get(coding, wildcard)
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+# the one coding objects are compressed with at rest
+AT_REST_CODEC = "zstd"
+TEXT_SNIFF_BYTES = 4096
+
+
+def looks_like_text(sample: bytes) -> bool:
+    if b"\0" in sample:
+        return False
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # the sample may end in the middle of a character
+        return e.start >= len(sample) - 3
+    return True
+
+
+def choose_codec(f: BinaryIO, media_type: str | None, sample_size: int, max_ratio: float) -> str | None:
+    """
+    The coding to store an upload with, or None to store it as is. Only text-like content is considered, by its
+    media type or by sniffing, and only when a trial compression of its first sample_size bytes shrinks them to
+    at most max_ratio of their size. Leaves f at its start.
+    """
+    if zstandard is None:
+        return None
+    sample = f.read(sample_size)
+    f.seek(0)
+    if not sample or not (is_compressible(media_type) or looks_like_text(sample[:TEXT_SNIFF_BYTES])):
+        return None
+    ratio = len(zstandard.compress(sample, 3)) / len(sample)
+    return AT_REST_CODEC if ratio <= max_ratio else None
+
+
+class CompressingReader:
+    """Reads another async reader through a streaming zstd compressor, compressing off the event loop."""
+
+    def __init__(self, source: AsyncReader, level: int = 3) -> None:
+        if zstandard is None:
+            raise RuntimeError("zstd compression needs the zstandard package")
+        self.source = source
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        self._buffer = bytearray()
+        self._eof = False
+
+    async def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = await self.source.read(size if size > 0 else 1024 * 1024)
+            if chunk:
+                self._buffer += await asyncio.to_thread(self._compressor.compress, chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def decompress_chunks(chunks: Iterator[bytes], codec: str) -> Iterator[bytes]:
+    """Decodes a stream of chunks stored with codec, closing the source when done or abandoned."""
+    if codec != AT_REST_CODEC or zstandard is None:
+        raise ValueError(f"Unsupported codec {codec}")
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    try:
+        for chunk in chunks:
+            if data := decompressor.decompress(chunk):
+                yield data
+    finally:
+        if isinstance(chunks, Generator):
+            chunks.close()
+
+
+class CompressionMiddleware:
+    """
+    Compresses complete text-like responses in the best coding the client accepts. Streams, file downloads
+    (anything sent as an attachment), partial content and bodies that are already encoded pass through
+    untouched. Large responses with an ETag keep their compressed variants, so a listing that is fetched
+    again without changing is not compressed again.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1000,
+        cache_entries: int = 64,
+        cache_min_bytes: int = 64 * 1024,
+        cache_ttl_seconds: float = 600.0,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache_min_bytes = cache_min_bytes
+        self.precompressed: TTLCache[tuple[str, str, str], bytes] = TTLCache(cache_entries, cache_ttl_seconds)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start: Message | None = None
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            assert start is not None
+            passthrough = True
+            headers = MutableHeaders(raw=start["headers"])
+            if message["type"] != "http.response.body" or message.get("more_body", False):
+                await send(start)
+                await send(message)
+                return
+            body: bytes = message.get("body", b"")
+            if self._eligible(start["status"], headers):
+                headers.add_vary_header("Accept-Encoding")
+                if encoding is not None and len(body) >= self.minimum_size:
+                    body = await self._compress(scope["path"], headers, body, encoding)
+                    message = {"type": "http.response.body", "body": body}
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _eligible(status: int, headers: MutableHeaders) -> bool:
+        if status < 200 or status in {204, 206, 304}:
+            return False
+        if "content-encoding" in headers or "content-disposition" in headers:
+            return False
+        if "no-transform" in headers.get("cache-control", ""):
+            return False
+        return is_compressible(headers.get("content-type"))
+
+    async def _compress(self, path: str, headers: MutableHeaders, body: bytes, encoding: str) -> bytes:
+        etag = headers.get("etag")
+        key = (path, etag or "", encoding)
+        cacheable = etag is not None and len(body) >= self.cache_min_bytes
+        compressed = self.precompressed.get(key) if cacheable else None
+        if compressed is None:
+            encoder = ENCODERS[encoding]
+            # big bodies would hold up every other request while they compress
+            compressed = await asyncio.to_thread(encoder, body) if len(body) >= self.cache_min_bytes else encoder(body)
+            if cacheable:
+                self.precompressed.set(key, compressed)
+        headers["content-encoding"] = encoding
+        headers["content-length"] = str(len(compressed))
+        if etag is not None and not etag.startswith("W/"):
+            # a strong validator promises identical bytes, which the other codings of this response are not
+            headers["etag"] = f"W/{etag}"
+        return compressed
@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -13,8 +14,48 @@ class Settings(BaseSettings):
     user_whitelist: str
     users_limit: int
     daily_upload_limit_bytes: int
+    upload_usage_refresh_seconds: float = 30.0  # how stale another worker's uploads may look to the quota check
     sentry_enabled: bool
     sentry_dsn: str
+    upload_chunk_size_bytes: int = 1024 * 1024
+    upload_part_size_bytes: int = 8 * 1024 * 1024  # S3 requires at least 5 MiB for all but the last part
+    download_chunk_size_bytes: int = 64 * 1024
+    download_max_age_seconds: int = 3600  # how long clients may reuse a download before revalidating its ETag
+    s3_max_concurrency: int = 8
+    s3_max_pool_connections: int = 16
+    s3_max_attempts: int = 5
+    object_delete_wait_seconds: float = 5.0  # how long an upload waits for a delete of the same content to leave S3
+    # "presigned" sends clients to S3 with short-lived URLs for every download of at least presigned_min_size_bytes
+    # and every cache miss, and enables the presigned upload endpoints; "proxy" moves every byte through this server
+    s3_serving_mode: Literal["proxy", "presigned"] = "proxy"
+    presigned_min_size_bytes: int = 16 * 1024 * 1024
+    presigned_url_ttl_seconds: int = 300
+    # cache budgets cover the whole smolvault_cache directory, shared by every worker process that uses it
+    cache_max_bytes: int | None = None
+    cache_max_files: int | None = None
+    cache_eviction_policy: Literal["lru", "lfu", "gdsf"] = "lru"
+    cache_verify_interval_seconds: float | None = None  # re-hash cached files this often; disabled when unset
+    # how long a cache miss waits for another request filling the same entry before streaming from S3 uncached
+    cache_fill_wait_seconds: float = 30.0
+    auth_user_cache_size: int = 1024
+    bcrypt_rounds: int = 12  # each extra round doubles the cost of hashing and of every login
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 16
+    # how long a worker keeps serving a verified token from memory; user records are only ever created, so the
+    # one thing this can delay is noticing a user removed from the database by hand
+    auth_user_cache_ttl_seconds: float = 300.0
+    compression_minimum_size: int = 1000
+    # zstd-compress text-like uploads in S3 and the cache (needs smolvault[compression]), keeping the compressed
+    # form only when a trial on the first upload chunk shrinks it to at most compress_at_rest_max_ratio
+    compress_at_rest: bool = False
+    compress_at_rest_max_ratio: float = 0.8
+    compression_cache_entries: int = 64  # compressed variants of large listings kept per worker, keyed by ETag
+    db_pool_size: int = 8
+    db_max_overflow: int = 8
+    db_pool_timeout_seconds: float = 10.0
+    db_busy_timeout_ms: int = 5000
+    db_mmap_size_bytes: int = 64 * 1024 * 1024
+    db_write_batch_size: int = 64
 
     model_config = SettingsConfigDict(env_file=".env")
 
@@ -1,26 +1,75 @@
+import asyncio
+import hashlib
 import json
 import logging
 import pathlib
 import sys
 import urllib.parse
+from collections.abc import AsyncIterator, Iterator, Sequence
+from contextlib import asynccontextmanager
 from logging.handlers import RotatingFileHandler
-from typing import Annotated
+from typing import Annotated, Any, BinaryIO
 
 import sentry_sdk
-from fastapi import BackgroundTasks, Depends, FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import BackgroundTasks, Depends, FastAPI, File, Form, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 from smolvault.auth.decoder import authenticate_user, create_access_token, get_current_user
 from smolvault.auth.models import NewUserDTO, Token, User
+from smolvault.auth.passwords import get_password_hasher
 from smolvault.cache.cache_manager import CacheManager
-from smolvault.clients.aws import S3Client
-from smolvault.clients.database import DatabaseClient, FileMetadataRecord
+from smolvault.cache.eviction import EVICTION_POLICIES
+from smolvault.cache.integrity import CacheVerifier, reconcile_cache
+from smolvault.clients.async_database import AsyncDatabaseClient
+from smolvault.clients.aws import AsyncS3Client, S3Client
+from smolvault.clients.database import (
+    DatabaseClient,
+    FileMetadataRecord,
+    cache_file_name,
+    content_object_key,
+    full_text_query,
+    get_engine,
+    get_write_queue,
+    presigned_upload_key,
+)
+from smolvault.compression import (
+    CompressingReader,
+    CompressionMiddleware,
+    choose_codec,
+    decompress_chunks,
+    negotiate_encoding,
+)
 from smolvault.config import Settings, get_settings
-from smolvault.models import FileMetadata, FileTagsDTO, FileUploadDTO
-from smolvault.validators.operation_validator import UploadValidator, UserCreationValidator
+from smolvault.models import (
+    BulkTagsDTO,
+    FileMetadata,
+    FileSelectionDTO,
+    FileTagsDTO,
+    FileUploadDTO,
+    PresignedUploadDTO,
+)
+from smolvault.pagination import (
+    NEXT_CURSOR_HEADER,
+    decode_cursor,
+    decode_position_cursor,
+    next_cursor,
+    next_position_cursor,
+)
+from smolvault.responses import (
+    CachedFileResponse,
+    ListingResponse,
+    check_not_modified,
+    content_disposition,
+    content_etag,
+    last_modified,
+    listing_etag,
+    media_type_for,
+    metadata_etag,
+    requested_range,
+)
+from smolvault.validators.operation_validator import UploadValidator, UserCreationValidator, get_upload_usage
 
 logging.basicConfig(
     handlers=[
@@ -40,20 +89,55 @@ if settings.sentry_enabled:
         profiles_sample_rate=1.0,
     )
 
-app = FastAPI(title="smolvault", docs_url=None, redoc_url=None)
 
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    engine = get_engine()
+    await asyncio.to_thread(reconcile_cache, cache, DatabaseClient())
+    verifier_task = None
+    if settings.cache_verify_interval_seconds is not None:
+        verifier = CacheVerifier(cache, DatabaseClient(), settings.cache_verify_interval_seconds)
+        verifier_task = asyncio.create_task(verifier.run())
+    yield
+    if verifier_task is not None:
+        verifier_task.cancel()
+    get_write_queue(engine).close()
+    engine.dispose()
+
+
+app = FastAPI(title="smolvault", docs_url=None, redoc_url=None, lifespan=lifespan)
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_minimum_size,
+    cache_entries=settings.compression_cache_entries,
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # browsers only let scripts on another origin read response headers listed here, beyond a few safe ones
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
 
-s3_client = S3Client(bucket_name=settings.smolvault_bucket)
-cache = CacheManager(cache_dir=settings.smolvault_cache)
+s3_client = AsyncS3Client(S3Client(bucket_name=settings.smolvault_bucket), settings.s3_max_concurrency)
+
+
+def _evicted_from_cache(local_path: str) -> None:
+    DatabaseClient().clear_cache_path(local_path)
+
+
+cache = CacheManager(
+    cache_dir=settings.smolvault_cache,
+    max_bytes=settings.cache_max_bytes,
+    max_files=settings.cache_max_files,
+    policy=EVICTION_POLICIES[settings.cache_eviction_policy](),
+    on_evict=_evicted_from_cache,
+    fill_wait_timeout=settings.cache_fill_wait_seconds,
+)
 
 
 @app.get("/")
@@ -64,13 +148,14 @@ async def read_root(current_user: Annotated[User, Depends(get_current_user)]) ->
 @app.post("/users/new")
 async def create_user(
     user: NewUserDTO,
-    db_client: Annotated[DatabaseClient, Depends(DatabaseClient)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
     op_validator: Annotated[UserCreationValidator, Depends(UserCreationValidator)],
 ) -> dict[str, str]:
     logger.info("Received new user creation request for %s", user.username)
-    if op_validator.user_creation_allowed(db_client):
+    if await op_validator.user_creation_allowed(db_client):
         logger.info("Creating new user", extra=user.model_dump(exclude={"password"}))
-        db_client.add_user(user)
+        hashed_password = await get_password_hasher().hash(user.password.get_secret_value())
+        await db_client.add_user(user, hashed_password)
         return {"username": user.username}
     else:
         logger.error("User creation failed. User limit exceeded")
@@ -83,10 +168,10 @@ async def create_user(
 @app.post("/token")
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db_client: Annotated[DatabaseClient, Depends(DatabaseClient)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
 ) -> Token:
     logger.info("Authenticating user %s", form_data.username)
-    user = authenticate_user(db_client, form_data.username, form_data.password)
+    user = await authenticate_user(db_client, form_data.username, form_data.password)
     if not user:
         logger.info("Incorrect username or password for %s", form_data.username)
         raise HTTPException(
@@ -102,37 +187,267 @@ async def login_for_access_token(
 @app.post("/file/upload")
 async def upload_file(
     current_user: Annotated[User, Depends(get_current_user)],
-    db_client: Annotated[DatabaseClient, Depends(DatabaseClient)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
     op_validator: Annotated[UploadValidator, Depends(UploadValidator)],
     file: Annotated[UploadFile, File()],
     tags: str | None = Form(default=None),
 ) -> Response:
     logger.info("Received file upload request from %s", current_user.username)
-    if not op_validator.upload_allowed(current_user.id, db_client):
+    if not await op_validator.upload_allowed(current_user.id, db_client):
         logger.error("Upload limit exceeded for user %s", current_user.username)
         return Response(
             content=json.dumps({"error": "Upload limit exceeded"}),
             status_code=400,
             media_type="application/json",
         )
-    contents = await file.read()
     if file.filename is None:
         logger.error("Filename not received in request")
         raise ValueError("Filename is required")
+    file_sha256, size = await asyncio.to_thread(_spooled_file_digest, file.file)
     file_upload = FileUploadDTO(
         name=file.filename,
-        size=len(contents),
-        content=contents,
+        size=size,
+        content_sha256=file_sha256,
         tags=tags,
         user_id=current_user.id,
     )
-    logger.info(
-        "Uploading file to S3 with name %s uploaded by %s",
-        file_upload.name,
-        current_user.username,
+    key = content_object_key(file_sha256)
+    if await db_client.add_metadata(file_upload, key, require_stored_object=True):
+        logger.info("Content of %s is already stored as %s, skipped the upload", file.filename, key)
+    else:
+        await _wait_for_object_delete(db_client, file_sha256)
+        logger.info("Streaming file %s to S3 uploaded by %s", file.filename, current_user.username)
+        file_upload.codec = await _store_object(key, file)
+        await db_client.add_metadata(file_upload, key)
+    get_upload_usage().record(current_user.id, file_upload.upload_timestamp, file_upload.size)
+    logger.info("File %s uploaded successfully", file_upload.name)
+    return Response(
+        content=json.dumps(file_upload.model_dump(exclude={"content", "tags"})),
+        status_code=201,
+        media_type="application/json",
     )
-    object_key = s3_client.upload(data=file_upload)
-    db_client.add_metadata(file_upload, object_key)
+
+
+@app.post("/files/upload")
+async def upload_files(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
+    op_validator: Annotated[UploadValidator, Depends(UploadValidator)],
+    files: Annotated[list[UploadFile], File()],
+    tags: str | None = Form(default=None),
+) -> Response:
+    """
+    Uploads many files at once. The quota is checked once for the whole batch and each file gets its own status in
+    the body. Records are written in two transactions: first every file whose content is already stored is linked
+    to it, then the rest once their content has been sent to S3, concurrently. A failure in between leaves the
+    first set in place, just as if those files had been uploaded on their own.
+    """
+    logger.info("Received upload of %d files from %s", len(files), current_user.username)
+    remaining = await op_validator.remaining_upload_bytes(current_user.id, db_client)
+    if remaining <= 0:
+        logger.error("Upload limit exceeded for user %s", current_user.username)
+        return Response(
+            content=json.dumps({"error": "Upload limit exceeded"}),
+            status_code=400,
+            media_type="application/json",
+        )
+    digests = await asyncio.to_thread(lambda: [_spooled_file_digest(file.file) for file in files])
+    results: list[dict[str, Any]] = []
+    accepted: dict[int, tuple[FileUploadDTO, str]] = {}
+    for index, (file, (file_sha256, size)) in enumerate(zip(files, digests, strict=True)):
+        if not file.filename:
+            results.append({"name": file.filename, "status": 400, "error": "Filename is required"})
+            continue
+        # like single uploads, a file is accepted as long as the allowance is not used up before it
+        if remaining <= 0:
+            results.append({"name": file.filename, "status": 400, "error": "Upload limit exceeded"})
+            continue
+        remaining -= size
+        file_upload = FileUploadDTO(
+            name=file.filename,
+            size=size,
+            content_sha256=file_sha256,
+            tags=tags,
+            user_id=current_user.id,
+        )
+        accepted[index] = (file_upload, content_object_key(file_sha256))
+        results.append({"name": file.filename, "status": 201})
+
+    inserted = await db_client.add_metadata_batch(list(accepted.values()), require_stored_object=True)
+    missing = [index for index, done in zip(accepted, inserted, strict=True) if not done]
+    # content repeated within the batch only needs to be sent once
+    to_upload = {accepted[index][1]: files[index] for index in missing}
+    await asyncio.gather(
+        *(_wait_for_object_delete(db_client, sha) for sha in {accepted[index][0].file_sha256 for index in missing})
+    )
+    uploaded = await _upload_objects(to_upload, current_user)
+    retry = [index for index in missing if accepted[index][1] in uploaded]
+    for index in retry:
+        file_upload, key = accepted[index]
+        file_upload.codec = uploaded[key]
+    if retry:
+        await db_client.add_metadata_batch([accepted[index] for index in retry])
+    for index in set(missing) - set(retry):
+        results[index] |= {"status": 502, "error": "Upload to storage failed"}
+        del accepted[index]
+
+    usage = get_upload_usage()
+    for index, (file_upload, _) in accepted.items():
+        usage.record(current_user.id, file_upload.upload_timestamp, file_upload.size)
+        results[index] |= file_upload.model_dump(exclude={"content", "tags"})
+    logger.info("Uploaded %d of %d files for %s", len(accepted), len(files), current_user.username)
+    return Response(
+        content=json.dumps(results),
+        status_code=201 if len(accepted) == len(files) else 207,
+        media_type="application/json",
+    )
+
+
+async def _upload_objects(uploads: dict[str, UploadFile], current_user: User) -> dict[str, str | None]:
+    """Streams each file to S3 under its key, a few at a time, and returns the codec of each key that made it."""
+    limit = asyncio.Semaphore(settings.s3_max_concurrency)
+
+    async def upload(key: str, file: UploadFile) -> str | None:
+        async with limit:
+            logger.info("Streaming file %s to S3 uploaded by %s", file.filename, current_user.username)
+            return await _store_object(key, file)
+
+    outcomes = await asyncio.gather(*(upload(key, file) for key, file in uploads.items()), return_exceptions=True)
+    uploaded: dict[str, str | None] = {}
+    for key, outcome in zip(uploads, outcomes, strict=True):
+        if isinstance(outcome, Exception):
+            logger.error("Failed to upload %s to S3", key, exc_info=outcome)
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            uploaded[key] = outcome
+    return uploaded
+
+
+async def _wait_for_object_delete(db_client: AsyncDatabaseClient, file_sha256: str) -> None:
+    """
+    Holds an upload back while a delete of the same content is still removing the object from S3, so that
+    delete cannot take the freshly written object with it. Gives up after object_delete_wait_seconds, for a
+    delete that died before it finished.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.object_delete_wait_seconds
+    while await db_client.object_pending_delete(file_sha256):
+        if loop.time() >= deadline:
+            logger.warning("Delete of content %s did not finish, uploading over it", file_sha256)
+            return
+        await asyncio.sleep(0.05)
+
+
+async def _store_object(key: str, file: UploadFile) -> str | None:
+    """Streams the spooled upload to S3, compressed when that pays off, and returns the codec it was stored with."""
+    await file.seek(0)
+    codec = None
+    if settings.compress_at_rest:
+        media_type = file.content_type or media_type_for(file.filename or "")
+        codec = await asyncio.to_thread(
+            choose_codec, file.file, media_type, settings.upload_chunk_size_bytes, settings.compress_at_rest_max_ratio
+        )
+    if codec is None:
+        await s3_client.upload_stream(key=key, file=file)
+        return None
+    upload = await s3_client.upload_stream(key=key, file=CompressingReader(file))
+    logger.info("Stored %s with %s (%d bytes)", key, codec, upload.size)
+    return codec
+
+
+@app.post("/file/upload/presigned")
+async def start_presigned_upload(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
+    op_validator: Annotated[UploadValidator, Depends(UploadValidator)],
+    upload: PresignedUploadDTO,
+) -> Response:
+    """
+    First half of an upload that bypasses this server: returns a short-lived URL the client PUTs the file to,
+    sending the listed headers, then it calls /file/upload/complete. The URL is null when one of the caller's own
+    files already has this content, in which case the client can complete straight away.
+    """
+    _require_presigned_mode()
+    logger.info("Presigned upload of %s requested by %s", upload.name, current_user.username)
+    if not await op_validator.upload_allowed(current_user.id, db_client):
+        logger.error("Upload limit exceeded for user %s", current_user.username)
+        return Response(
+            content=json.dumps({"error": "Upload limit exceeded"}),
+            status_code=400,
+            media_type="application/json",
+        )
+    upload_url = None
+    # anyone can claim a digest, so only content the caller has already uploaded themselves skips the transfer
+    if await db_client.get_owned_object_size(current_user.id, upload.file_sha256) is None:
+        upload_url = await s3_client.presigned_upload_url(
+            presigned_upload_key(current_user.id, upload.file_sha256), upload.checksum_sha256
+        )
+    return Response(
+        content=json.dumps(
+            {
+                "upload_url": upload_url,
+                "headers": {"x-amz-checksum-sha256": upload.checksum_sha256},
+                "expires_in": settings.presigned_url_ttl_seconds,
+            }
+        ),
+        status_code=200,
+        media_type="application/json",
+    )
+
+
+@app.post("/file/upload/complete")
+async def complete_presigned_upload(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
+    op_validator: Annotated[UploadValidator, Depends(UploadValidator)],
+    upload: PresignedUploadDTO,
+) -> Response:
+    _require_presigned_mode()
+    logger.info("Completing presigned upload of %s for %s", upload.name, current_user.username)
+    if not await op_validator.upload_allowed(current_user.id, db_client):
+        logger.error("Upload limit exceeded for user %s", current_user.username)
+        return Response(
+            content=json.dumps({"error": "Upload limit exceeded"}),
+            status_code=400,
+            media_type="application/json",
+        )
+    key = content_object_key(upload.file_sha256)
+    size = await db_client.get_owned_object_size(current_user.id, upload.file_sha256)
+    if size is not None:
+        file_upload = _presigned_file(upload, size, current_user)
+        if await db_client.add_metadata(file_upload, key, require_stored_object=True):
+            logger.info("Content of %s is already stored as %s", upload.name, key)
+            return _created(file_upload, current_user)
+    staged_key = presigned_upload_key(current_user.id, upload.file_sha256)
+    staged = await s3_client.head(staged_key)
+    if staged is None:
+        raise HTTPException(status_code=400, detail="File has not been uploaded")
+    # only the URL signed with this checksum can write the staged key, so S3 verified the body on the way in;
+    # the checksum is re-checked where S3 reports one, and the size is whatever S3 actually stored
+    if staged.get("ChecksumSHA256", upload.checksum_sha256) != upload.checksum_sha256:
+        raise HTTPException(status_code=400, detail="Uploaded file does not match its description")
+    file_upload = _presigned_file(upload, staged["ContentLength"], current_user)
+    if not await db_client.add_metadata(file_upload, key, require_stored_object=True):
+        await _wait_for_object_delete(db_client, upload.file_sha256)
+        await s3_client.copy(staged_key, key)
+        await db_client.add_metadata(file_upload, key)
+    await s3_client.delete(staged_key)
+    return _created(file_upload, current_user)
+
+
+def _presigned_file(upload: PresignedUploadDTO, size: int, current_user: User) -> FileUploadDTO:
+    return FileUploadDTO(
+        name=upload.name,
+        size=size,
+        content_sha256=upload.file_sha256,
+        tags=upload.tags,
+        user_id=current_user.id,
+    )
+
+
+def _created(file_upload: FileUploadDTO, current_user: User) -> Response:
+    get_upload_usage().record(current_user.id, file_upload.upload_timestamp, file_upload.size)
     logger.info("File %s uploaded successfully", file_upload.name)
     return Response(
         content=json.dumps(file_upload.model_dump(exclude={"content", "tags"})),
@@ -141,15 +456,35 @@ async def upload_file(
     )
 
 
+def _require_presigned_mode() -> None:
+    if not s3_client.client.presigned:
+        raise HTTPException(status_code=404, detail="Presigned transfers are disabled")
+
+
+def _spooled_file_digest(f: BinaryIO) -> tuple[str, int]:
+    hasher = hashlib.sha256()
+    size = 0
+    while chunk := f.read(settings.upload_chunk_size_bytes):
+        hasher.update(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
 @app.get("/file/original")
 async def get_file(
+    request: Request,
     current_user: Annotated[User, Depends(get_current_user)],
-    db_client: Annotated[DatabaseClient, Depends(DatabaseClient)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
     filename: str,
     background_tasks: BackgroundTasks,
+    redirect: bool = True,
 ) -> Response:
+    """
+    Streams the file, or in presigned mode points the client at S3: a 302 by default, or with redirect=false a
+    JSON body holding the URL.
+    """
     logger.info("Received file download request for %s from %s", filename, current_user.username)
-    record = db_client.get_metadata(filename, current_user.id)
+    record = await db_client.get_metadata(filename, current_user.id)
     if record is None:
         logger.info("File not found: %s", filename)
         return Response(
@@ -157,70 +492,272 @@ async def get_file(
             status_code=404,
             media_type="application/json",
         )
-    if record.local_path is None or cache.file_exists(record.file_name) is False:
-        logger.info("File %s not found in cache, downloading from S3", filename)
-        content = s3_client.download(record.object_key)
-        record.local_path = cache.save_file(record.file_name, content)
-        record.cache_timestamp = int(pathlib.Path(record.local_path).stat().st_mtime)
-        logger.info("Saved file %s at time %d", record.local_path, record.cache_timestamp)
-        background_tasks.add_task(db_client.update_metadata, record)
+    etag = content_etag(record.file_sha256)
+    validators = {"etag": etag, "cache-control": f"private, max-age={settings.download_max_age_seconds}"}
+    if (modified := last_modified(record.upload_timestamp)) is not None:
+        validators["last-modified"] = modified
+    check_not_modified(request.headers, validators)
+    media_type = media_type_for(record.file_name)
+    cache_name = cache_file_name(record.file_sha256, record.codec)
+    accepted_codec = None
+    if record.codec is not None:
+        accepted_codec = negotiate_encoding(request.headers.get("accept-encoding", ""), [record.codec])
+    # S3 can only hand out the object as stored, so compressed ones go there only for clients that accept that
+    if s3_client.client.should_presign(record.size, cache.file_exists(cache_name)) and accepted_codec == record.codec:
+        logger.info("Sending %s to S3 for %s", current_user.username, filename)
+        url = await s3_client.presigned_download_url(
+            record.object_key, content_disposition(record.file_name), media_type, record.codec
+        )
+        return _presigned_response(url, redirect)
+    if record.codec is not None:
+        return await _serve_encoded(
+            db_client, record, record.codec, validators, media_type, accepted_codec is not None, background_tasks
+        )
+    # validated up front so an unsatisfiable range gets the same 416 whether or not the file is cached
+    byte_range = requested_range(request.headers, etag, record.size)
+    if not cache.file_exists(cache_name):
+        headers = {
+            "accept-ranges": "bytes",
+            "content-disposition": content_disposition(record.file_name),
+            **validators,
+        }
+        if byte_range is not None:
+            start, end = byte_range
+            logger.info("Streaming bytes %d-%d of %s from S3", start, end - 1, filename)
+            headers["content-range"] = f"bytes {start}-{end - 1}/{record.size}"
+            headers["content-length"] = str(end - start)
+            return StreamingResponse(
+                s3_client.iter_object(record.object_key, byte_range),
+                status_code=206,
+                headers=headers,
+                media_type=media_type,
+            )
+        headers["content-length"] = str(record.size)
+        lease = await cache.claim(cache_name) if cache.fits(record.size) else None
+        if lease is not None:
+            logger.info("File %s not found in cache, streaming from S3", filename)
+            body = cache.tee(cache_name, s3_client.client.iter_object(record.object_key), lease)
+            background_tasks.add_task(_record_cached_file, db_client.client, record)
+            return StreamingResponse(s3_client.iterate(body), headers=headers, media_type=media_type)
+        if not cache.file_exists(cache_name):
+            # larger than the whole cache, or another request is still filling it at its client's pace
+            logger.info("File %s cannot be cached now, streaming from S3", filename)
+            return StreamingResponse(s3_client.iter_object(record.object_key), headers=headers, media_type=media_type)
     logger.info("Serving file %s from cache", record.file_name)
-    return FileResponse(path=record.local_path, filename=record.file_name)
+    cache.touch(cache_name)
+    return CachedFileResponse(
+        path=cache.path(cache_name), filename=record.file_name, media_type=media_type, headers=validators
+    )
+
+
+async def _serve_encoded(
+    db_client: AsyncDatabaseClient,
+    record: FileMetadataRecord,
+    codec: str,
+    validators: dict[str, str],
+    media_type: str,
+    passthrough: bool,
+    background_tasks: BackgroundTasks,
+) -> Response:
+    """
+    Serves an object stored compressed with codec: as is to clients that accept the coding, decoded on the fly for
+    the rest. Ranges would address the decoded bytes, so they are answered in full, which RFC 9110 allows.
+    """
+    headers = {"content-disposition": content_disposition(record.file_name), "vary": "Accept-Encoding", **validators}
+    cache_name = cache_file_name(record.file_sha256, record.codec)
+    lease = None
+    if not cache.file_exists(cache_name) and cache.fits(record.size):
+        lease = await cache.claim(cache_name)
+    chunks: Iterator[bytes]
+    if cache.file_exists(cache_name):
+        logger.info("Serving file %s from cache", record.file_name)
+        cache.touch(cache_name)
+        chunks = _read_file(cache.path(cache_name))
+        if passthrough:
+            headers["content-length"] = str(cache.path(cache_name).stat().st_size)
+    else:
+        logger.info("File %s not found in cache, streaming from S3", record.file_name)
+        chunks = s3_client.client.iter_object(record.object_key)
+        if lease is not None:
+            chunks = cache.tee(cache_name, chunks, lease)
+            background_tasks.add_task(_record_cached_file, db_client.client, record)
+    if passthrough:
+        headers["content-encoding"] = codec
+        # the body is a different representation than the decoded one
+        headers["etag"] = f"W/{validators['etag']}"
+    else:
+        chunks = decompress_chunks(chunks, codec)
+        headers["content-length"] = str(record.size)
+    return StreamingResponse(s3_client.iterate(chunks), headers=headers, media_type=media_type)
+
+
+def _read_file(path: pathlib.Path) -> Iterator[bytes]:
+    with path.open("rb") as f:
+        while chunk := f.read(settings.download_chunk_size_bytes):
+            yield chunk
+
+
+def _presigned_response(url: str, redirect: bool) -> Response:
+    headers = {"cache-control": "no-store"}  # the URL expires long before any cached copy would
+    if redirect:
+        return RedirectResponse(url, status_code=302, headers=headers)
+    return Response(
+        content=json.dumps({"url": url, "expires_in": settings.presigned_url_ttl_seconds}),
+        status_code=200,
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def _record_cached_file(db_client: DatabaseClient, record: FileMetadataRecord) -> None:
+    cache_name = cache_file_name(record.file_sha256, record.codec)
+    if not cache.file_exists(cache_name):
+        logger.info("File %s was not fully cached, skipping metadata update", cache_name)
+        return
+    local_path = cache.path(cache_name)
+    cache_timestamp = int(local_path.stat().st_mtime)
+    logger.info("Saved file %s at time %d", local_path, cache_timestamp)
+    db_client.mark_cached(record.file_sha256, record.codec, local_path.as_posix(), cache_timestamp)
 
 
 @app.get("/file/{name}/metadata")
 async def get_file_metadata(
+    request: Request,
+    response: Response,
     current_user: Annotated[User, Depends(get_current_user)],
-    db_client: Annotated[DatabaseClient, Depends(DatabaseClient)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
     name: str,
 ) -> FileMetadata | None:
     logger.info("Retrieving metadata for file %s requested by %s", name, current_user.username)
-    record: FileMetadataRecord | None = db_client.get_metadata(urllib.parse.unquote(name), current_user.id)
+    record: FileMetadataRecord | None = await db_client.get_metadata(urllib.parse.unquote(name), current_user.id)
     if record:
         logger.info("Retrieved metadata for file %s", name)
+        etag = metadata_etag(record.file_name, record.file_sha256, record.upload_timestamp, record.tags)
+        validators = {"etag": etag, "cache-control": "private, no-cache"}
+        check_not_modified(request.headers, validators)
+        response.headers.update(validators)
         return FileMetadata.model_validate(record.model_dump())
     logger.info("File metadata for %s not found", name)
     return None
 
 
-@app.get("/files")
+@app.get("/files", response_model=list[FileMetadata])
 async def get_files(
+    request: Request,
     current_user: Annotated[User, Depends(get_current_user)],
-    db_client: Annotated[DatabaseClient, Depends(DatabaseClient)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
     offset: int | None = None,
     limit: int | None = None,
-) -> list[FileMetadata]:
+    cursor: str | None = None,
+) -> ListingResponse:
     logger.info("Retrieving all files for user %s", current_user.username)
-    raw_metadata = db_client.get_all_metadata(user_id=current_user.id, offset=offset, limit=limit)
-    logger.info("Retrieved %d records from database", len(raw_metadata))
-    results = [FileMetadata.model_validate(metadata.model_dump()) for metadata in raw_metadata]
-    return results
+    headers = await _check_listing(request, db_client, current_user)
+    after = decode_cursor(cursor) if cursor else None
+    rows = await db_client.get_all_metadata(user_id=current_user.id, offset=offset, limit=limit, after=after)
+    logger.info("Retrieved %d records from database", len(rows))
+    if (next_page := next_cursor(rows, limit)) is not None:
+        headers[NEXT_CURSOR_HEADER] = next_page
+    return ListingResponse(rows, headers=headers)
 
 
-@app.get("/files/search")
+@app.get("/files/search", response_model=list[FileMetadata])
 async def search_files(
+    request: Request,
     current_user: Annotated[User, Depends(get_current_user)],
-    db_client: Annotated[DatabaseClient, Depends(DatabaseClient)],
-    tag: str,
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
+    tag: Annotated[list[str], Query()] = [],  # noqa: B006
+    any_tag: Annotated[list[str], Query()] = [],  # noqa: B006
+    not_tag: Annotated[list[str], Query()] = [],  # noqa: B006
     offset: int | None = None,
     limit: int | None = None,
-) -> list[FileMetadata]:
-    logger.info("Retrieving files with tag %s for user %s", tag, current_user.username)
-    raw_metadata = db_client.select_metadata_by_tag(tag, current_user.id, offset=offset, limit=limit)
-    logger.info("Retrieved %d records from database with tag %s", len(raw_metadata), tag)
-    results = [FileMetadata.model_validate(metadata.model_dump()) for metadata in raw_metadata]
-    return results
+    cursor: str | None = None,
+) -> ListingResponse:
+    """Files with every `tag`, at least one `any_tag` and no `not_tag`; each parameter may be repeated."""
+    if not tag and not any_tag:
+        raise HTTPException(status_code=400, detail="At least one tag or any_tag is required")
+    logger.info(
+        "Retrieving files for user %s with tags %s, any of %s, none of %s", current_user.username, tag, any_tag, not_tag
+    )
+    headers = await _check_listing(request, db_client, current_user)
+    after = decode_cursor(cursor) if cursor else None
+    rows = await db_client.list_metadata_by_tags(
+        current_user.id,
+        all_tags=tag,
+        any_tags=any_tag,
+        not_tags=not_tag,
+        offset=offset,
+        limit=limit,
+        after=after,
+    )
+    logger.info("Retrieved %d records from database", len(rows))
+    if (next_page := next_cursor(rows, limit)) is not None:
+        headers[NEXT_CURSOR_HEADER] = next_page
+    return ListingResponse(rows, headers=headers)
+
+
+@app.get("/files/query", response_model=list[FileMetadata])
+async def query_files(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
+    q: str,
+    fuzzy: bool = False,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> ListingResponse:
+    """
+    Ranked substring (or, with fuzzy, typo-tolerant) search over file names and tags. The cursor holds a position
+    in the ranking, so a page can still shift by a row when the user's own matching files change in between.
+    """
+    logger.info("Searching files of user %s for %s", current_user.username, q)
+    try:
+        query = full_text_query(q, fuzzy=fuzzy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    headers = await _check_listing(request, db_client, current_user)
+    position = decode_position_cursor(cursor) if cursor else 0
+    rows = await db_client.search_metadata(current_user.id, query, offset=position, limit=limit)
+    logger.info("Found %d matching records", len(rows))
+    if (next_page := next_position_cursor(rows, limit, position)) is not None:
+        headers[NEXT_CURSOR_HEADER] = next_page
+    return ListingResponse(rows, headers=headers)
+
+
+@app.get("/files/tags")
+async def get_tag_counts(
+    request: Request,
+    response: Response,
+    current_user: Annotated[User, Depends(get_current_user)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
+) -> dict[str, int]:
+    logger.info("Counting tags for user %s", current_user.username)
+    response.headers.update(await _check_listing(request, db_client, current_user))
+    return await db_client.get_tag_counts(current_user.id)
+
+
+async def _check_listing(request: Request, db_client: AsyncDatabaseClient, current_user: User) -> dict[str, str]:
+    """
+    Answers 304 when none of the user's files changed since the client fetched this exact listing, and
+    otherwise returns the validators to send with it.
+    """
+    files_version = await db_client.get_files_version(current_user.id)
+    validators = {
+        "etag": listing_etag(current_user.id, files_version, request.url.query),
+        "cache-control": "private, no-cache",
+    }
+    check_not_modified(request.headers, validators)
+    return validators
 
 
 @app.patch("/file/{name}/tags")
 async def update_file_tags(
     current_user: Annotated[User, Depends(get_current_user)],
-    db_client: Annotated[DatabaseClient, Depends(DatabaseClient)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
     name: str,
     tags: FileTagsDTO,
 ) -> Response:
     logger.info("Updating tags for file %s requested by %s", name, current_user.username)
-    record: FileMetadataRecord | None = db_client.get_metadata(name, current_user.id)
+    record: FileMetadataRecord | None = await db_client.get_metadata(name, current_user.id)
     if record is None:
         logger.info("Tag update failed. File %s not found", name)
         return Response(
@@ -229,8 +766,7 @@ async def update_file_tags(
             media_type="application/json",
         )
 
-    record.tags = tags.tags_str
-    db_client.update_metadata(record)
+    await db_client.update_tags(record, tags)
     file_metadata = FileMetadata.model_validate(record.model_dump())
     logger.info("Tags updated for file %s", name)
     return Response(
@@ -245,15 +781,101 @@ async def update_file_tags(
     )
 
 
+@app.patch("/files/tags")
+async def update_files_tags(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
+    tags: BulkTagsDTO,
+) -> Response:
+    logger.info("Bulk tag update requested by %s", current_user.username)
+    records = await _select_files(db_client, current_user, tags.files)
+    if records:
+        await db_client.update_tags_batch(records, tags, current_user.id)
+    logger.info("Tags updated for %d files", len(records))
+    return Response(
+        content=json.dumps(
+            {
+                "message": "Tags updated successfully",
+                "updated": [record.file_name for record in records],
+            }
+        ),
+        status_code=200,
+        media_type="application/json",
+    )
+
+
+@app.post("/files/delete")
+async def delete_files(
+    current_user: Annotated[User, Depends(get_current_user)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
+    selection: FileSelectionDTO,
+    background_tasks: BackgroundTasks,
+) -> Response:
+    logger.info("Bulk delete requested by %s", current_user.username)
+    records = await _select_files(db_client, current_user, selection)
+    unreferenced_keys = set(await db_client.delete_metadata_batch(records, current_user.id)) if records else set()
+    usage = get_upload_usage()
+    stale_cache_paths: list[str] = []
+    for record in records:
+        usage.record(current_user.id, record.upload_timestamp, -record.size)
+        if record.object_key not in unreferenced_keys:
+            continue
+        cached_content = cache.path(cache_file_name(record.file_sha256, record.codec)).as_posix()
+        if record.object_key == content_object_key(record.file_sha256):
+            stale_cache_paths.append(cached_content)
+        elif record.local_path and record.local_path != cached_content:
+            stale_cache_paths.append(record.local_path)
+    if unreferenced_keys:
+        try:
+            failed = await s3_client.delete_many(sorted(unreferenced_keys))
+        finally:
+            await db_client.purge_stored_objects(
+                [record.file_sha256 for record in records if record.object_key in unreferenced_keys]
+            )
+        if failed:
+            logger.error("%d objects could not be deleted from S3", len(failed))
+    background_tasks.add_task(_delete_cached_files, stale_cache_paths)
+    logger.info("Deleted %d files", len(records))
+    return Response(
+        content=json.dumps(
+            {
+                "message": "Files deleted successfully",
+                "deleted": [record.file_name for record in records],
+            }
+        ),
+        status_code=200,
+        media_type="application/json",
+    )
+
+
+async def _select_files(
+    db_client: AsyncDatabaseClient, current_user: User, selection: FileSelectionDTO
+) -> Sequence[FileMetadataRecord]:
+    if selection.names:
+        return await db_client.get_metadata_by_names(selection.names, current_user.id)
+    return await db_client.select_metadata_by_tags(
+        current_user.id,
+        all_tags=selection.tag,
+        any_tags=selection.any_tag,
+        not_tags=selection.not_tag,
+        limit=None,
+    )
+
+
+def _delete_cached_files(local_paths: list[str]) -> None:
+    for local_path in local_paths:
+        cache.delete_file(local_path)
+
+
 @app.delete("/file/{name}")
 async def delete_file(
     current_user: Annotated[User, Depends(get_current_user)],
-    db_client: Annotated[DatabaseClient, Depends(DatabaseClient)],
+    db_client: Annotated[AsyncDatabaseClient, Depends(AsyncDatabaseClient)],
     name: str,
     background_tasks: BackgroundTasks,
 ) -> Response:
     logger.info("Recieved delete request for file %s from %s", name, current_user.username)
-    record: FileMetadataRecord | None = db_client.get_metadata(name, current_user.id)
+    record: FileMetadataRecord | None = await db_client.get_metadata(name, current_user.id)
     if record is None:
         logger.info("File %s not found", name)
         return Response(
@@ -261,10 +883,18 @@ async def delete_file(
             status_code=404,
             media_type="application/json",
         )
-    s3_client.delete(record.object_key)
-    db_client.delete_metadata(record, current_user.id)
-    if record.local_path:
-        background_tasks.add_task(cache.delete_file, record.local_path)
+    unreferenced_key = await db_client.delete_metadata(record, current_user.id)
+    get_upload_usage().record(current_user.id, record.upload_timestamp, -record.size)
+    if unreferenced_key is not None:
+        try:
+            await s3_client.delete(unreferenced_key)
+        finally:
+            await db_client.purge_stored_objects([record.file_sha256])
+        cached_content = cache.path(cache_file_name(record.file_sha256, record.codec)).as_posix()
+        if unreferenced_key == content_object_key(record.file_sha256):
+            background_tasks.add_task(cache.delete_file, cached_content)
+        elif record.local_path and record.local_path != cached_content:
+            background_tasks.add_task(cache.delete_file, record.local_path)
     logger.info("File %s deleted successfully", name)
     return Response(
         content=json.dumps({"message": "File deleted successfully", "record": record.model_dump()}),
@@ -1,16 +1,20 @@
+import base64
 import hashlib
 import urllib.parse
 from datetime import datetime
 from functools import cached_property
+from typing import Self
 from zoneinfo import ZoneInfo
 
-from pydantic import BaseModel, Field, computed_field
+from pydantic import BaseModel, Field, computed_field, model_validator
 
 
 class FileUploadDTO(BaseModel):
     name: str
     size: int
-    content: bytes
+    content: bytes | None = None  # None when the file was streamed to S3 in parts
+    content_sha256: str | None = Field(default=None, exclude=True)  # digest computed while streaming
+    codec: str | None = Field(default=None, exclude=True)  # content coding of the stored object, None when raw
     user_id: int
     upload_timestamp: str = Field(default_factory=lambda: datetime.now(ZoneInfo("UTC")).isoformat())
     tags: str | None  # comma separated tags
@@ -18,7 +22,9 @@ class FileUploadDTO(BaseModel):
     @computed_field  # type: ignore
     @cached_property
     def file_sha256(self) -> str:
-        return hashlib.sha256(self.content).hexdigest()
+        if self.content_sha256 is not None:
+            return self.content_sha256
+        return hashlib.sha256(self.content or b"").hexdigest()
 
     @computed_field  # type: ignore
     @cached_property
@@ -34,6 +40,20 @@ class FileUploadDTO(BaseModel):
         return [part.strip() for part in parts]
 
 
+class PresignedUploadDTO(BaseModel):
+    """A file the client will PUT to S3 itself; it describes the content up front so S3 can verify it."""
+
+    name: str
+    file_sha256: str = Field(pattern=r"^[0-9a-f]{64}$")
+    tags: str | None = None  # comma separated tags
+
+    @computed_field  # type: ignore
+    @cached_property
+    def checksum_sha256(self) -> str:
+        """The digest as S3 spells it in x-amz-checksum-sha256."""
+        return base64.b64encode(bytes.fromhex(self.file_sha256)).decode()
+
+
 class FileTagsDTO(BaseModel):
     tags: list[str]
 
@@ -46,6 +66,25 @@ class FileTagsDTO(BaseModel):
         return combined_tags[:-1]
 
 
+class FileSelectionDTO(BaseModel):
+    """The files a bulk operation applies to: either by name, or by the same tag filter as /files/search."""
+
+    names: list[str] = []
+    tag: list[str] = []
+    any_tag: list[str] = []
+    not_tag: list[str] = []
+
+    @model_validator(mode="after")
+    def check_selection(self) -> Self:
+        if bool(self.names) == bool(self.tag or self.any_tag):
+            raise ValueError("Select files either by names or by tag/any_tag")
+        return self
+
+
+class BulkTagsDTO(FileTagsDTO):
+    files: FileSelectionDTO
+
+
 class FileMetadata(BaseModel):
     name: str = Field(alias="file_name")
     size: int
@@ -0,0 +1,67 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from typing import Any
+
+from fastapi import HTTPException
+
+from smolvault.clients.database import ListingRow
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode(key: list[Any]) -> str:
+    payload = json.dumps(key, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def _decode(cursor: str, *types: type) -> list[Any]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(key, list) or len(key) != len(types):
+            raise TypeError
+        if not all(_is_instance(value, expected) for value, expected in zip(key, types, strict=True)):
+            raise TypeError
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+    return key
+
+
+def _is_instance(value: Any, expected: type) -> bool:
+    if isinstance(value, bool):
+        return False
+    if expected is float:
+        return isinstance(value, int | float)
+    return isinstance(value, expected)
+
+
+def encode_cursor(row: ListingRow) -> str:
+    """Opaque to clients: the (upload_timestamp, id) key of the last row on a page."""
+    return _encode([row.upload_timestamp, row.id])
+
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    upload_timestamp, record_id = _decode(cursor, str, int)
+    return upload_timestamp, record_id
+
+
+def next_cursor(rows: Sequence[ListingRow], limit: int | None) -> str | None:
+    """A full page may have more behind it; a short one is the last."""
+    if limit is None or not rows or len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1])
+
+
+def decode_position_cursor(cursor: str) -> int:
+    (position,) = _decode(cursor, int)
+    if position < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return position
+
+
+def next_position_cursor(rows: Sequence[ListingRow], limit: int | None, position: int) -> str | None:
+    """Like next_cursor for listings whose keys are not stable, e.g. ranked search: the position of the next page."""
+    if limit is None or not rows or len(rows) < limit:
+        return None
+    return _encode([position + len(rows)])
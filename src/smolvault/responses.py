@@ -0,0 +1,159 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+from collections.abc import Callable, Iterable, Sequence
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from mimetypes import guess_type
+from typing import Any
+from urllib.parse import quote
+
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, Response
+from starlette.datastructures import Headers
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _stdlib_dumps(content: Any) -> bytes:
+    # byte for byte what starlette's JSONResponse renders
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+
+dumps: Callable[[Any], bytes] = _stdlib_dumps
+with contextlib.suppress(ImportError):  # pip install smolvault[speedups]
+    import orjson
+
+    dumps = orjson.dumps
+
+
+def content_etag(file_sha256: str) -> str:
+    return f'"{file_sha256}"'
+
+
+def metadata_etag(file_name: str, file_sha256: str, upload_timestamp: str, tags: str | None) -> str:
+    digest = hashlib.sha256("\0".join((file_name, file_sha256, upload_timestamp, tags or "")).encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def listing_etag(user_id: int, files_version: int, query: str) -> str:
+    """Weak, since the same listing may be sent with different content codings."""
+    digest = hashlib.sha256(query.encode()).hexdigest()[:16]
+    return f'W/"{user_id}-{files_version}-{digest}"'
+
+
+def last_modified(upload_timestamp: str) -> str | None:
+    try:
+        return formatdate(datetime.fromisoformat(upload_timestamp).timestamp(), usegmt=True)
+    except ValueError:
+        return None
+
+
+def check_not_modified(headers: Headers, validators: dict[str, str]) -> None:
+    """
+    Raises 304 Not Modified, carrying the validators, when the client's copy is still current. If-Modified-Since
+    is only consulted when there is no If-None-Match, as RFC 9110 requires.
+    """
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        current = _etag_matches(if_none_match, validators["etag"])
+    else:
+        current = _not_modified_since(headers.get("if-modified-since"), validators.get("last-modified"))
+    if current:
+        raise HTTPException(status_code=304, headers=validators)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison
+    opaque_tag = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque_tag for candidate in if_none_match.split(","))
+
+
+def _not_modified_since(if_modified_since: str | None, modified: str | None) -> bool:
+    if if_modified_since is None or modified is None:
+        return False
+    try:
+        return parsedate_to_datetime(modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+def media_type_for(filename: str) -> str:
+    return guess_type(filename)[0] or "application/octet-stream"
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def requested_range(headers: Headers, etag: str, size: int) -> tuple[int, int] | None:
+    """
+    Returns the single [start, end) byte range the client asked for, or None when the full body should be sent.
+    Multi-range and malformed headers are ignored, which RFC 9110 allows.
+    """
+    http_range = headers.get("range")
+    if http_range is None:
+        return None
+    if_range = headers.get("if-range")
+    if if_range is not None and if_range != etag:
+        return None
+    match = _RANGE_PATTERN.match(http_range.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+        if last and int(last) < start:
+            return None
+    elif last:
+        start = max(size - int(last), 0)
+        end = size
+    else:
+        return None
+    if start >= size or start >= end:
+        raise HTTPException(
+            status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+
+class CachedFileResponse(FileResponse):
+    """
+    FileResponse that evaluates If-Range against the ETag we send rather than starlette's stat-based one,
+    so validators stay the same whether a file is served from the cache or streamed from S3.
+    """
+
+    def _should_use_range(self, http_if_range: str, stat_result: os.stat_result) -> bool:  # type: ignore[override]
+        return http_if_range in {self.headers.get("etag"), formatdate(stat_result.st_mtime, usegmt=True)}
+
+
+class ListingResponse(Response):
+    """
+    A file listing rendered straight from database rows that start with LISTING_COLUMNS (see
+    smolvault.clients.database), in the shape of list[FileMetadata] but without building a model per row.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Iterable[Sequence[Any]]) -> bytes:
+        return dumps(
+            [
+                {
+                    "file_name": file_name,
+                    "size": size,
+                    "upload_timestamp": upload_timestamp,
+                    "link": link,
+                    "file_sha256": file_sha256,
+                    "tags_list": None if tags is None else [tag.strip() for tag in tags.split(",")],
+                }
+                for _, file_name, size, upload_timestamp, link, file_sha256, tags, *_ in content
+            ]
+        )
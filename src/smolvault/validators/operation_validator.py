@@ -1,28 +1,73 @@
 import logging
-from datetime import datetime, timedelta
+from functools import lru_cache
 
-from smolvault.clients.database import DatabaseClient
+from smolvault.cache.ttl import TTLCache
+from smolvault.clients.async_database import AsyncDatabaseClient
+from smolvault.clients.database import USAGE_WINDOW_HOURS, usage_hour
 from smolvault.config import get_settings
 
 logger = logging.getLogger(__name__)
 
 
+class UploadUsageMirror:
+    """
+    In-memory copy of each user's hourly upload counters. A user's counters are read from the database on
+    first use and then kept current by this process's uploads and deletes; they are re-read every
+    refresh_seconds to pick up other workers. The quota check sums at most USAGE_WINDOW_HOURS numbers.
+    """
+
+    def __init__(self, refresh_seconds: float, max_users: int = 4096) -> None:
+        self._usage: TTLCache[int, dict[int, int]] = TTLCache(max_entries=max_users, ttl_seconds=refresh_seconds)
+
+    async def bytes_uploaded(self, user_id: int, db_client: AsyncDatabaseClient) -> int:
+        since_hour = usage_hour() - USAGE_WINDOW_HOURS + 1
+        hours = self._usage.get(user_id)
+        if hours is None:
+            hours = await db_client.get_upload_usage(user_id, since_hour)
+            self._usage.set(user_id, hours)
+        return sum(size for hour, size in hours.items() if hour >= since_hour)
+
+    def record(self, user_id: int, upload_timestamp: str, size: int) -> None:
+        """Applies an upload (positive size) or delete (negative size) the database has already recorded."""
+        hours = self._usage.get(user_id)
+        if hours is not None:
+            hour = usage_hour(upload_timestamp)
+            hours[hour] = max(hours.get(hour, 0) + size, 0)
+
+
+@lru_cache
+def parse_whitelist(user_whitelist: str) -> frozenset[str]:
+    """Keyed by the raw setting, so a reloaded Settings with a different whitelist gets a fresh set."""
+    return frozenset(user_id.strip() for user_id in user_whitelist.split(",") if user_id.strip())
+
+
+@lru_cache
+def get_upload_usage() -> UploadUsageMirror:
+    return UploadUsageMirror(get_settings().upload_usage_refresh_seconds)
+
+
 class UploadValidator:
     def __init__(self) -> None:
         self.settings = get_settings()
         self.daily_upload_limit_bytes = self.settings.daily_upload_limit_bytes
-        self.whitelist = self.settings.user_whitelist.split(",")
+        self.whitelist = parse_whitelist(self.settings.user_whitelist)
+        self.usage = get_upload_usage()
 
-    def upload_allowed(self, user_id: int, db_client: DatabaseClient) -> bool:
-        valid = self._uploads_under_limit_prev_24h(user_id, db_client) and self._user_on_whitelist(user_id)
+    async def upload_allowed(self, user_id: int, db_client: AsyncDatabaseClient) -> bool:
+        valid = await self._uploads_under_limit_prev_24h(user_id, db_client) and self._user_on_whitelist(user_id)
         logger.info("Upload allowed result for user %s: %s", user_id, valid)
         return valid
 
-    def _uploads_under_limit_prev_24h(self, user_id: int, db_client: DatabaseClient) -> bool:
+    async def remaining_upload_bytes(self, user_id: int, db_client: AsyncDatabaseClient) -> int:
+        """What is left of the user's 24 hour allowance, or 0 when they may not upload at all."""
+        if not self._user_on_whitelist(user_id):
+            return 0
+        bytes_uploaded = await self.usage.bytes_uploaded(user_id, db_client)
+        return max(self.daily_upload_limit_bytes - bytes_uploaded, 0)
+
+    async def _uploads_under_limit_prev_24h(self, user_id: int, db_client: AsyncDatabaseClient) -> bool:
         logger.info("Checking upload limit for user %s", user_id)
-        start_time = datetime.now() - timedelta(days=1)
-        metadata = db_client.get_all_metadata(user_id, start_time=start_time)
-        bytes_uploaded = sum([record.size for record in metadata])
+        bytes_uploaded = await self.usage.bytes_uploaded(user_id, db_client)
         logger.info(
             "User %s has uploaded %d bytes in the last 24 hours. DAILY_LIMIT: %d",
             user_id,
@@ -41,7 +86,7 @@ class UserCreationValidator:
         self.settings = get_settings()
         self.users_limit = self.settings.users_limit
 
-    def user_creation_allowed(self, db_client: DatabaseClient) -> bool:
-        users: int = db_client.get_user_count()
+    async def user_creation_allowed(self, db_client: AsyncDatabaseClient) -> bool:
+        users: int = await db_client.get_user_count()
         logger.info("%d users currently in the system", users)
         return users < self.users_limit
@@ -1,3 +1,4 @@
+import pathlib
 import sqlite3
 from datetime import datetime
 from typing import Any
@@ -72,4 +73,10 @@ def bak_db(c: Context) -> None:
 
 @task
 def export_reqs(c: Context) -> None:
-    c.run("uv export --no-emit-project --no-dev --output-file=requirements.txt", echo=True, pty=True)
+    c.run("uv export --no-emit-project --all-extras --output-file=requirements.txt", echo=True, pty=True)
+
+
+@task
+def bench(c: Context, name: str = "") -> None:
+    for script in sorted(pathlib.Path("benchmarks").glob(f"bench_{name}*.py")):
+        c.run(f"python {script}", echo=True, pty=True)
@@ -2,7 +2,9 @@ import os
 import pathlib
 from collections.abc import Generator
 from datetime import datetime
+from functools import lru_cache
 from typing import Any, Literal
+from uuid import uuid4
 from zoneinfo import ZoneInfo
 
 import boto3
@@ -11,9 +13,10 @@ from httpx import ASGITransport, AsyncClient
 from moto import mock_aws
 from mypy_boto3_s3 import S3Client
 from polyfactory.pytest_plugin import register_fixture
-from sqlmodel import SQLModel, create_engine
+from sqlalchemy import Engine
 
-from smolvault.clients.database import DatabaseClient, FileMetadataRecord
+from smolvault.auth.passwords import hash_password
+from smolvault.clients.database import DatabaseClient, FileMetadataRecord, create_db_engine
 from smolvault.main import app
 from smolvault.models import FileMetadata
 
@@ -22,10 +25,14 @@ from .factories import UserFactory
 user_factory_fixture = register_fixture(UserFactory, name="user_factory")
 
 
+@lru_cache
+def get_test_engine() -> Engine:
+    return create_db_engine("sqlite:///test.db")
+
+
 class TestDatabaseClient(DatabaseClient):
     def __init__(self) -> None:
-        self.engine = create_engine("sqlite:///test.db", echo=False, connect_args={"check_same_thread": False})
-        SQLModel.metadata.create_all(self.engine)
+        self.engine = get_test_engine()
 
 
 @pytest.fixture(scope="module")
@@ -41,7 +48,7 @@ def db_client() -> TestDatabaseClient:
 @pytest.fixture
 def user(user_factory: UserFactory, db_client: TestDatabaseClient) -> tuple[str, str]:
     user = user_factory.build()
-    db_client.add_user(user)
+    db_client.add_user(user, hash_password(user.password.get_secret_value(), rounds=4))
     return user.username, user.password.get_secret_value()
 
 
@@ -101,6 +108,12 @@ def camera_img() -> bytes:
         return f.read()
 
 
+@pytest.fixture
+def unique_img(camera_img: bytes) -> bytes:
+    """Content no other test has uploaded, so it is neither deduplicated nor already cached."""
+    return camera_img + uuid4().bytes
+
+
 @pytest.fixture
 def file_metadata_record() -> FileMetadataRecord:
     return FileMetadataRecord(
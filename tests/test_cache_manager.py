@@ -1,6 +1,15 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections.abc import Iterator
 from pathlib import Path
 
-from smolvault.cache.cache_manager import CacheManager
+import pytest
+
+from smolvault.cache.cache_manager import STALE_TEMP_SECONDS, CacheManager
+from smolvault.cache.eviction import GDSFPolicy, LFUPolicy
+from smolvault.cache.integrity import CacheVerifier, reconcile_cache
 
 
 def test_create_cache_manager_dir_not_exists(tmp_path: Path) -> None:
@@ -16,3 +25,243 @@ def test_create_cache_manager_dir__exists(tmp_path: Path) -> None:
     cache_dir.mkdir()
     cache_mgr = CacheManager(cache_dir.as_posix())
     assert cache_mgr.cache_dir == cache_dir
+
+
+def test_lru_eviction_over_byte_budget(tmp_path: Path) -> None:
+    evicted: list[str] = []
+    cache_mgr = CacheManager(tmp_path.as_posix(), max_bytes=30, on_evict=evicted.append)
+    cache_mgr.save_file("a", b"a" * 10)
+    cache_mgr.save_file("b", b"b" * 10)
+    cache_mgr.save_file("c", b"c" * 10)
+    cache_mgr.touch("a")
+    cache_mgr.save_file("d", b"d" * 10)
+
+    assert evicted == [(tmp_path / "b").as_posix()]
+    assert cache_mgr.file_exists("b") is False
+    assert cache_mgr.file_exists("a")
+    assert cache_mgr.total_bytes == 30
+
+
+def test_lfu_eviction_over_file_budget(tmp_path: Path) -> None:
+    cache_mgr = CacheManager(tmp_path.as_posix(), max_files=2, policy=LFUPolicy())
+    cache_mgr.save_file("a", b"a")
+    cache_mgr.save_file("b", b"b")
+    cache_mgr.touch("a")
+    cache_mgr.touch("b")
+    cache_mgr.touch("a")
+    cache_mgr.save_file("c", b"c")
+
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_file()) == ["a", "c"]
+
+
+def test_gdsf_evicts_large_cold_files_first(tmp_path: Path) -> None:
+    cache_mgr = CacheManager(tmp_path.as_posix(), max_bytes=1100, policy=GDSFPolicy())
+    cache_mgr.save_file("small", b"s" * 10)
+    cache_mgr.save_file("large", b"l" * 1000)
+    cache_mgr.touch("large")
+    cache_mgr.save_file("medium", b"m" * 100)
+
+    assert cache_mgr.file_exists("small")
+    assert cache_mgr.file_exists("medium")
+    assert cache_mgr.file_exists("large") is False
+
+
+def test_existing_files_count_against_budget(tmp_path: Path) -> None:
+    for name in ("a", "b", "c"):
+        (tmp_path / name).write_bytes(b"x" * 10)
+    cache_mgr = CacheManager(tmp_path.as_posix(), max_files=2)
+    assert len([path for path in tmp_path.iterdir() if path.is_file()]) == 2
+    assert cache_mgr.total_bytes == 20
+
+
+def test_workers_sharing_a_directory_share_its_budget(tmp_path: Path) -> None:
+    first = CacheManager(tmp_path.as_posix(), max_files=2)
+    second = CacheManager(tmp_path.as_posix(), max_files=2)
+    first.save_file("a", b"a")
+    second.save_file("b", b"b")
+    first.save_file("c", b"c")
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_file()) == ["b", "c"]
+
+    second.save_file("d", b"d")
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_file()) == ["c", "d"]
+    assert second.cached_files() == {"c", "d"}
+    assert second.total_bytes == 2
+
+
+def test_workers_only_rescan_the_directory_to_evict(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    first = CacheManager(tmp_path.as_posix(), max_files=4)
+    scans = 0
+    sync_with_disk = first._sync_with_disk
+
+    def counting_sync() -> None:
+        nonlocal scans
+        scans += 1
+        sync_with_disk()
+
+    monkeypatch.setattr(first, "_sync_with_disk", counting_sync)
+    for name in "abcde":
+        first.save_file(name, b"x")
+    assert scans == 0  # alone in the directory, its own view is exact
+    assert first.cached_files() == {"b", "c", "d", "e"}
+
+    second = CacheManager(tmp_path.as_posix(), max_files=4)
+    second.delete_file((tmp_path / "b").as_posix())
+    first.save_file("f", b"x")
+    assert scans == 0  # the shared totals say there is room, so nothing needs evicting
+    second.save_file("g", b"x")
+    first.save_file("h", b"x")
+    assert scans == 1
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_file()) == ["e", "f", "g", "h"]
+
+
+def test_tee_admits_file_once_complete(tmp_path: Path) -> None:
+    cache_mgr = CacheManager(tmp_path.as_posix(), max_bytes=100)
+    chunks = cache_mgr.tee("file", [b"abc", b"def"])
+    assert next(chunks) == b"abc"
+    assert cache_mgr.file_exists("file") is False
+    assert list(chunks) == [b"def"]
+    assert (tmp_path / "file").read_bytes() == b"abcdef"
+    assert cache_mgr.total_bytes == 6
+
+
+@pytest.mark.anyio
+async def test_claim_coalesces_concurrent_misses(tmp_path: Path) -> None:
+    cache_mgr = CacheManager(tmp_path.as_posix())
+    lease = await cache_mgr.claim("file")
+    assert lease is not None
+    follower = asyncio.create_task(cache_mgr.claim("file"))
+    await asyncio.sleep(0.01)
+    assert not follower.done()
+
+    assert list(cache_mgr.tee("file", [b"data"], lease)) == [b"data"]
+    assert await follower is None
+    assert await cache_mgr.claim("file") is None
+
+
+@pytest.mark.anyio
+async def test_claim_waits_for_other_processes(tmp_path: Path) -> None:
+    worker_a = CacheManager(tmp_path.as_posix(), fill_poll_interval=0.01)
+    worker_b = CacheManager(tmp_path.as_posix(), fill_poll_interval=0.01)
+    lease = await worker_a.claim("file")
+    assert lease is not None
+    follower = asyncio.create_task(worker_b.claim("file"))
+    await asyncio.sleep(0.05)
+    assert not follower.done()
+
+    list(worker_a.tee("file", [b"data"], lease))
+    assert await follower is None
+
+
+@pytest.mark.anyio
+async def test_fill_removes_its_lock_file(tmp_path: Path) -> None:
+    worker_a = CacheManager(tmp_path.as_posix(), fill_poll_interval=0.01)
+    worker_b = CacheManager(tmp_path.as_posix(), fill_poll_interval=0.01)
+    lease = await worker_a.claim("file")
+    assert lease is not None
+    other = await worker_b.claim("other")
+    assert other is not None
+    (tmp_path / ".locks" / "stale.lock").touch()  # left by a worker that died mid-fill
+
+    list(worker_a.tee("file", [b"data"], lease))
+    assert not (tmp_path / ".locks" / "file.lock").exists()
+    CacheManager(tmp_path.as_posix())
+    # the lock of the fill still running survives the cleanup at startup
+    assert sorted(path.name for path in (tmp_path / ".locks").iterdir()) == [".budget.lock", "other.lock"]
+    other.release()
+    assert sorted(path.name for path in (tmp_path / ".locks").iterdir()) == [".budget.lock"]
+
+
+@pytest.mark.anyio
+async def test_claim_gives_up_on_slow_fills(tmp_path: Path) -> None:
+    worker_a = CacheManager(tmp_path.as_posix(), fill_poll_interval=0.01)
+    worker_b = CacheManager(tmp_path.as_posix(), fill_poll_interval=0.01, fill_wait_timeout=0.05)
+    lease = await worker_a.claim("file")
+    assert lease is not None
+    assert await worker_b.claim("file") is None
+    assert worker_b.file_exists("file") is False
+    # the lease is still good, and once it is released the next miss gets one of its own
+    lease.release()
+    assert await worker_b.claim("file") is not None
+
+
+@pytest.mark.anyio
+async def test_failed_fill_hands_over_the_lease(tmp_path: Path) -> None:
+    cache_mgr = CacheManager(tmp_path.as_posix())
+    lease = await cache_mgr.claim("file")
+    assert lease is not None
+    follower = asyncio.create_task(cache_mgr.claim("file"))
+
+    def broken_stream() -> Iterator[bytes]:
+        yield b"partial"
+        raise ConnectionError
+
+    with pytest.raises(ConnectionError):
+        list(cache_mgr.tee("file", broken_stream(), lease))
+    assert await follower is not None
+
+
+class FakeCacheRecords:
+    def __init__(self, records: list[tuple[str, str, str | None]]) -> None:
+        self.records = records
+        self.cleared: list[str] = []
+
+    def get_cached_files(self) -> list[tuple[str, str, str | None]]:
+        return [record for record in self.records if record[0] not in self.cleared]
+
+    def clear_cache_path(self, local_path: str) -> None:
+        self.cleared.append(local_path)
+
+
+def test_unfinished_writes_removed_at_startup(tmp_path: Path) -> None:
+    stale = tmp_path / ".file.abc123.part"
+    stale.write_bytes(b"partial")
+    os.utime(stale, (time.time() - STALE_TEMP_SECONDS - 1,) * 2)
+    # still being written by another worker sharing the directory
+    (tmp_path / ".other.def456.part").write_bytes(b"in flight")
+    (tmp_path / "file").write_bytes(b"complete")
+    cache_mgr = CacheManager(tmp_path.as_posix())
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_file()) == [".other.def456.part", "file"]
+    assert cache_mgr.cached_files() == {"file"}
+
+
+def test_interrupted_tee_leaves_no_files(tmp_path: Path) -> None:
+    cache_mgr = CacheManager(tmp_path.as_posix())
+    chunks = cache_mgr.tee("file", [b"abc", b"def"])
+    next(chunks)
+    chunks.close()
+    assert [path for path in tmp_path.iterdir() if path.is_file()] == []
+
+
+def test_verifier_quarantines_corrupt_files(tmp_path: Path) -> None:
+    cache_mgr = CacheManager(tmp_path.as_posix())
+    good = cache_mgr.save_file("good", b"good")
+    bad = cache_mgr.save_file("bad", b"bad")
+    (tmp_path / "bad").write_bytes(b"flipped")
+    records = FakeCacheRecords(
+        [(good, hashlib.sha256(b"good").hexdigest(), None), (bad, hashlib.sha256(b"bad").hexdigest(), None)]
+    )
+    verifier = CacheVerifier(cache_mgr, records, interval_seconds=60)  # type: ignore[arg-type]
+    assert verifier.verify_once() == [bad]
+    assert records.cleared == [bad]
+    assert cache_mgr.file_exists("bad") is False
+    assert cache_mgr.cached_files() == {"good"}
+    assert len(list(cache_mgr.quarantine_dir.iterdir())) == 1
+
+
+def test_quarantine_tolerates_files_already_gone(tmp_path: Path) -> None:
+    cache_mgr = CacheManager(tmp_path.as_posix())
+    cache_mgr.save_file("file", b"data")
+    # another worker moved it aside first
+    (tmp_path / "file").unlink()
+    assert cache_mgr.quarantine("file") is None
+    assert cache_mgr.cached_files() == set()
+    assert cache_mgr.total_bytes == 0
+
+
+def test_reconcile_clears_missing_files(tmp_path: Path) -> None:
+    cache_mgr = CacheManager(tmp_path.as_posix())
+    present = cache_mgr.save_file("present", b"data")
+    missing = (tmp_path / "missing").as_posix()
+    records = FakeCacheRecords([(present, "sha", None), (missing, "sha", None)])
+    assert reconcile_cache(cache_mgr, records) == 1  # type: ignore[arg-type]
+    assert records.cleared == [missing]
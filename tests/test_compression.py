@@ -0,0 +1,83 @@
+import json
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from smolvault.compression import ENCODERS, CompressionMiddleware, is_compressible, negotiate_encoding
+
+LISTING = [{"file_name": f"file-{i}.txt", "tags": "a,b,c"} for i in range(5000)]
+
+
+def test_negotiate_encoding() -> None:
+    assert negotiate_encoding("gzip") == "gzip"
+    assert negotiate_encoding("GZIP;q=0.5, deflate") == "gzip"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("") is None
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("*;q=0") is None
+    # ties go to the preferred coding, higher weights win
+    assert negotiate_encoding("*") == next(iter(ENCODERS))
+    assert negotiate_encoding("gzip, br;q=0.1, zstd;q=0.1") == "gzip"
+
+
+def test_is_compressible() -> None:
+    assert is_compressible("application/json")
+    assert is_compressible("text/csv; charset=utf-8")
+    assert is_compressible("application/problem+json")
+    assert not is_compressible("image/jpeg")
+    assert not is_compressible("video/mp4")
+    assert not is_compressible("application/zip")
+    assert not is_compressible("application/octet-stream")
+    assert not is_compressible(None)
+
+
+def build_app() -> CompressionMiddleware:
+    async def listing(_: object) -> Response:
+        return JSONResponse(LISTING, headers={"etag": '"v1"'})
+
+    async def download(_: object) -> Response:
+        return Response(b"x" * 5000, media_type="text/plain", headers={"content-disposition": "attachment"})
+
+    async def stream(_: object) -> Response:
+        return StreamingResponse(iter([b"x" * 5000, b"y" * 5000]), media_type="text/plain")
+
+    async def photo(_: object) -> Response:
+        return Response(b"x" * 5000, media_type="image/jpeg")
+
+    routes = [
+        Route("/listing", listing),
+        Route("/download", download),
+        Route("/stream", stream),
+        Route("/photo", photo),
+    ]
+    return CompressionMiddleware(Starlette(routes=routes))
+
+
+@pytest.mark.anyio
+async def test_compression_middleware() -> None:
+    middleware = build_app()
+    client = AsyncClient(transport=ASGITransport(app=middleware), base_url="http://testserver")
+    headers = {"Accept-Encoding": "gzip"}
+
+    response = await client.get("/listing", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"v1"'
+    assert int(response.headers["content-length"]) < len(json.dumps(LISTING))
+    assert response.json() == LISTING
+    # the compressed variant is kept and reused while the ETag stays the same
+    assert len(middleware.precompressed) == 1
+    response = await client.get("/listing", headers=headers)
+    assert response.json() == LISTING
+    assert len(middleware.precompressed) == 1
+
+    response = await client.get("/listing", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    for path in ("/download", "/stream", "/photo"):
+        response = await client.get(path, headers=headers)
+        assert "content-encoding" not in response.headers, path
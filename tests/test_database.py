@@ -0,0 +1,168 @@
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import event, text
+from sqlmodel import Session, select
+
+from smolvault.clients.async_database import AsyncDatabaseClient
+from smolvault.clients.database import DatabaseClient, UserInfo, content_object_key, create_db_engine, usage_hour
+from smolvault.clients.write_queue import WriteQueue
+from smolvault.models import FileMetadata, FileUploadDTO
+from smolvault.responses import ListingResponse
+from smolvault.validators.operation_validator import UploadUsageMirror, parse_whitelist
+
+
+def test_sqlite_pragmas(tmp_path: Path) -> None:
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'pragmas.db'}")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+
+
+def add_user(name: str) -> Callable[[Session], None]:
+    return lambda session: session.add(UserInfo(username=name, hashed_password="not-a-hash"))  # noqa: S106
+
+
+def test_write_queue_batches_pending_writes(tmp_path: Path) -> None:
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'writes.db'}")
+    commits: list[int] = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    writer = WriteQueue(engine)
+    started, release = threading.Event(), threading.Event()
+
+    def blocking_write(session: Session) -> None:
+        started.set()
+        release.wait()
+
+    first = writer.submit(blocking_write)
+    started.wait()
+    futures = [writer.submit(add_user(f"user{i}")) for i in range(10)]
+    release.set()
+    first.result()
+    for future in futures:
+        future.result()
+    writer.close()
+
+    with Session(engine) as session:
+        assert len(session.exec(select(UserInfo)).all()) == 10
+    # the ten writes queued behind the blocked one share a single transaction
+    assert len(commits) == 2
+
+
+def test_write_queue_isolates_failed_jobs(tmp_path: Path) -> None:
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'writes.db'}")
+    writer = WriteQueue(engine)
+    release = threading.Event()
+
+    def failing_write(session: Session) -> None:
+        raise ValueError("bad write")
+
+    writer.submit(lambda session: release.wait())
+    good = writer.submit(add_user("good"))
+    failed = writer.submit(failing_write)
+    release.set()
+    good.result()
+    with pytest.raises(ValueError, match="bad write"):
+        failed.result()
+    writer.close()
+
+    with Session(engine) as session:
+        assert session.exec(select(UserInfo.username)).all() == ["good"]
+
+
+@pytest.mark.anyio
+async def test_async_client_runs_off_the_event_loop(db_client: DatabaseClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    threads: list[str] = []
+
+    def get_user(username: str) -> None:
+        threads.append(threading.current_thread().name)
+
+    monkeypatch.setattr(db_client, "get_user", get_user)
+    assert await AsyncDatabaseClient(db_client).get_user("nobody") is None
+    assert threads[0].startswith("smolvault-db")
+
+
+@pytest.mark.anyio
+async def test_upload_usage_counts_every_upload(db_client: DatabaseClient) -> None:
+    user_id = 10_000 + uuid4().int % 10_000
+    for i in range(15):
+        upload = FileUploadDTO(name=f"file-{i}", size=100, content_sha256=uuid4().hex, tags=None, user_id=user_id)
+        db_client.add_metadata(upload, content_object_key(upload.file_sha256))
+    hour = usage_hour()
+    assert db_client.get_upload_usage(user_id, hour - 23) == {hour: 1500}
+
+    mirror = UploadUsageMirror(refresh_seconds=60)
+    async_client = AsyncDatabaseClient(db_client)
+    assert await mirror.bytes_uploaded(user_id, async_client) == 1500
+
+    record = db_client.get_metadata("file-0", user_id)
+    assert record is not None
+    db_client.delete_metadata(record, user_id)
+    mirror.record(user_id, record.upload_timestamp, -record.size)
+    assert db_client.get_upload_usage(user_id, hour - 23) == {hour: 1400}
+    assert await mirror.bytes_uploaded(user_id, async_client) == 1400
+
+
+def test_listing_response_matches_file_metadata(db_client: DatabaseClient) -> None:
+    user_id = 10_000 + uuid4().int % 10_000
+    for name, tags in [("notes.txt", None), ("smörgåsbord.png", "red, green ,blue"), ('"quoted".txt', "")]:
+        upload = FileUploadDTO(name=name, size=100, content_sha256=uuid4().hex, tags=tags, user_id=user_id)
+        db_client.add_metadata(upload, content_object_key(upload.file_sha256))
+
+    rows = db_client.get_all_metadata(user_id, limit=None)
+    records = [db_client.get_metadata(row.file_name, user_id) for row in rows]
+    models = [FileMetadata.model_validate(record.model_dump()) for record in records if record is not None]
+    # what FastAPI sent when the listing endpoints returned list[FileMetadata]
+    expected = TypeAdapter(list[FileMetadata]).dump_python(models, mode="json", by_alias=True)
+    assert ListingResponse(rows).body == JSONResponse(expected).body
+
+
+def test_user_count_and_whitelist(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    with Session(engine) as session:
+        session.add_all([UserInfo(username=f"user{i}", hashed_password="not-a-hash") for i in range(3)])  # noqa: S106
+        session.commit()
+    client = DatabaseClient()
+    monkeypatch.setattr(client, "engine", engine)
+    assert client.get_user_count() == 3
+    assert parse_whitelist(" 1, 2,,3 ") == frozenset({"1", "2", "3"})
+
+
+@pytest.mark.parametrize("method", ["get_all_metadata", "select_metadata_by_tags", "list_metadata_by_tags"])
+def test_listing_limits_are_capped(db_client: DatabaseClient, method: str) -> None:
+    with pytest.raises(ValidationError):
+        getattr(db_client, method)(0, limit=100)
+    # bulk selections ask for every match
+    assert getattr(db_client, method)(0, limit=None) == []
+
+
+def test_unreferenced_objects_stay_tombstoned_until_purged(db_client: DatabaseClient) -> None:
+    user_id = 10_000 + uuid4().int % 10_000
+    upload = FileUploadDTO(name="file", size=100, content_sha256=uuid4().hex, tags=None, user_id=user_id)
+    key = content_object_key(upload.file_sha256)
+    db_client.add_metadata(upload, key)
+    record = db_client.get_metadata("file", user_id)
+    assert record is not None
+    assert db_client.delete_metadata(record, user_id) == key
+    # while S3 deletes the object, the content counts as not stored
+    assert db_client.object_pending_delete(upload.file_sha256)
+    assert db_client.add_metadata(upload, key, require_stored_object=True) is False
+
+    db_client.purge_stored_objects([upload.file_sha256])
+    assert not db_client.object_pending_delete(upload.file_sha256)
+    assert db_client.add_metadata(upload, key, require_stored_object=True) is False
+
+    # an upload that went ahead anyway revives the tombstone, and a late purge leaves it alone
+    db_client.add_metadata(upload, key)
+    record = db_client.get_metadata("file", user_id)
+    assert record is not None
+    assert db_client.delete_metadata(record, user_id) == key
+    db_client.add_metadata(upload, key)
+    db_client.purge_stored_objects([upload.file_sha256])
+    assert db_client.add_metadata(upload, key, require_stored_object=True)
@@ -1,9 +1,13 @@
+import asyncio
+import hashlib
 from typing import Any
 from uuid import uuid4
 
 import pytest
 from httpx import AsyncClient
+from mypy_boto3_s3 import S3Client
 
+from smolvault.main import s3_client
 from smolvault.models import FileUploadDTO
 
 
@@ -37,3 +41,97 @@ async def test_delete_file(client: AsyncClient, camera_img: bytes, access_token:
     assert response.status_code == 200
     assert actual["message"] == "File deleted successfully"
     assert actual["record"]["file_name"] == filename
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket")
+async def test_duplicate_content_stored_once(
+    client: AsyncClient, aws: S3Client, unique_img: bytes, access_token: str
+) -> None:
+    headers = {"Authorization": f"Bearer {access_token}"}
+    filenames = [f"{uuid4().hex[:6]}-camera.png" for _ in range(2)]
+    for filename in filenames:
+        response = await client.post(
+            "/file/upload", files={"file": (filename, unique_img, "image/png")}, headers=headers
+        )
+        assert response.status_code == 201
+    key = f"objects/{hashlib.sha256(unique_img).hexdigest()}"
+    assert [obj["Key"] for obj in aws.list_objects_v2(Bucket="test-bucket")["Contents"]] == [key]
+
+    # the object outlives the first delete because the second file still references it
+    response = await client.delete(f"/file/{filenames[0]}", headers=headers)
+    assert response.status_code == 200
+    response = await client.get("/file/original", params={"filename": filenames[1]}, headers=headers)
+    assert response.content == unique_img
+
+    response = await client.delete(f"/file/{filenames[1]}", headers=headers)
+    assert response.status_code == 200
+    assert "Contents" not in aws.list_objects_v2(Bucket="test-bucket")
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket")
+async def test_bulk_delete(client: AsyncClient, aws: S3Client, unique_img: bytes, access_token: str) -> None:
+    headers = {"Authorization": f"Bearer {access_token}"}
+    tag = f"bulk-{uuid4().hex[:6]}"
+    names = [f"{uuid4().hex[:6]}-{n}.png" for n in ("a", "b", "c")]
+    response = await client.post(
+        "/files/upload",
+        files=[
+            ("files", (names[0], unique_img, "image/png")),
+            ("files", (names[1], unique_img, "image/png")),
+            ("files", (names[2], unique_img + b"c", "image/png")),
+        ],
+        data={"tags": tag},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    assert aws.list_objects_v2(Bucket="test-bucket")["KeyCount"] == 2
+
+    response = await client.post("/files/delete", json={"names": [names[0], names[2], "missing.png"]}, headers=headers)
+    assert response.status_code == 200
+    assert sorted(response.json()["deleted"]) == sorted([names[0], names[2]])
+    # the content of the first file is still referenced by the second
+    key = f"objects/{hashlib.sha256(unique_img).hexdigest()}"
+    assert [obj["Key"] for obj in aws.list_objects_v2(Bucket="test-bucket")["Contents"]] == [key]
+    assert (await client.get("/files/tags", headers=headers)).json()[tag] == 1
+
+    response = await client.post("/files/delete", json={"tag": [tag]}, headers=headers)
+    assert response.json()["deleted"] == [names[1]]
+    assert "Contents" not in aws.list_objects_v2(Bucket="test-bucket")
+    assert tag not in (await client.get("/files/tags", headers=headers)).json()
+    response = await client.get("/files/search", params={"tag": [tag]}, headers=headers)
+    assert response.json() == []
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket")
+async def test_reupload_while_deleting_keeps_object(
+    client: AsyncClient, aws: S3Client, unique_img: bytes, access_token: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    headers = {"Authorization": f"Bearer {access_token}"}
+    first, second = (f"{uuid4().hex[:6]}-camera.png" for _ in range(2))
+    response = await client.post("/file/upload", files={"file": (first, unique_img, "image/png")}, headers=headers)
+    assert response.status_code == 201
+    delete = s3_client.delete
+    reuploads: list[asyncio.Task[Any]] = []
+
+    async def slow_delete(key: str) -> None:
+        # the same content comes back while its object is still being removed from S3
+        reuploads.append(
+            asyncio.create_task(
+                client.post("/file/upload", files={"file": (second, unique_img, "image/png")}, headers=headers)
+            )
+        )
+        await asyncio.sleep(0.2)
+        await delete(key)
+
+    monkeypatch.setattr(s3_client, "delete", slow_delete)
+    response = await client.delete(f"/file/{first}", headers=headers)
+    assert response.status_code == 200
+    response = await reuploads[0]
+    assert response.status_code == 201
+    key = f"objects/{hashlib.sha256(unique_img).hexdigest()}"
+    assert [obj["Key"] for obj in aws.list_objects_v2(Bucket="test-bucket")["Contents"]] == [key]
+    response = await client.get("/file/original", params={"filename": second}, headers=headers)
+    assert response.content == unique_img
@@ -1,12 +1,14 @@
-from collections.abc import Sequence
+import asyncio
+from collections.abc import Iterator, Sequence
 from typing import Any
 from uuid import uuid4
 
 import pytest
 from httpx import AsyncClient
 
-from smolvault.clients.database import DatabaseClient, FileMetadataRecord
-from smolvault.models import FileMetadata
+from smolvault.clients.aws import S3Client
+from smolvault.clients.database import LISTING_COLUMNS, DatabaseClient, FileMetadataRecord, content_object_key
+from smolvault.models import FileMetadata, FileUploadDTO
 
 
 @pytest.mark.anyio
@@ -18,8 +20,8 @@ async def test_list_files(
     file_metadata: FileMetadata,
     access_token: str,
 ) -> None:
-    def mock_get_all_files(*args: Any, **kwargs: Any) -> Sequence[FileMetadataRecord]:
-        return [file_metadata_record]
+    def mock_get_all_files(*args: Any, **kwargs: Any) -> Sequence[tuple[Any, ...]]:
+        return [tuple(getattr(file_metadata_record, column.key) for column in LISTING_COLUMNS)]
 
     monkeypatch.setattr(DatabaseClient, "get_all_metadata", mock_get_all_files)
     response = await client.get("/files", headers={"Authorization": f"Bearer {access_token}"})
@@ -63,3 +65,181 @@ async def test_get_file_not_found(client: AsyncClient, access_token: str) -> Non
     )
     assert response.status_code == 404
     assert response.json() == {"error": "File not found"}
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket")
+async def test_get_file_range(client: AsyncClient, unique_img: bytes, access_token: str) -> None:
+    filename = f"{uuid4().hex[:6]}-camera.png"
+    headers = {"Authorization": f"Bearer {access_token}"}
+    await client.post("/file/upload", files={"file": (filename, unique_img, "image/png")}, headers=headers)
+
+    # uncached: the range is fetched straight from S3
+    response = await client.get(
+        "/file/original", params={"filename": filename}, headers={**headers, "Range": "bytes=0-99"}
+    )
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 0-99/{len(unique_img)}"
+    assert response.content == unique_img[:100]
+    etag = response.headers["etag"]
+
+    # full download populates the cache
+    response = await client.get("/file/original", params={"filename": filename}, headers=headers)
+    assert response.status_code == 200
+    assert response.content == unique_img
+
+    # cached: suffix range served from disk with the same validator
+    response = await client.get(
+        "/file/original",
+        params={"filename": filename},
+        headers={**headers, "Range": "bytes=-50", "If-Range": etag},
+    )
+    assert response.status_code == 206
+    assert response.headers["etag"] == etag
+    assert response.content == unique_img[-50:]
+
+    # stale validator: the full body is sent instead
+    response = await client.get(
+        "/file/original",
+        params={"filename": filename},
+        headers={**headers, "Range": "bytes=0-99", "If-Range": '"stale"'},
+    )
+    assert response.status_code == 200
+    assert response.content == unique_img
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket")
+async def test_get_file_range_not_satisfiable(client: AsyncClient, unique_img: bytes, access_token: str) -> None:
+    filename = f"{uuid4().hex[:6]}-camera.png"
+    headers = {"Authorization": f"Bearer {access_token}"}
+    await client.post("/file/upload", files={"file": (filename, unique_img, "image/png")}, headers=headers)
+    response = await client.get(
+        "/file/original",
+        params={"filename": filename},
+        headers={**headers, "Range": f"bytes={len(unique_img)}-"},
+    )
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(unique_img)}"
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket")
+async def test_concurrent_misses_fetch_once(
+    client: AsyncClient, unique_img: bytes, access_token: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    filename = f"{uuid4().hex[:6]}-camera.png"
+    headers = {"Authorization": f"Bearer {access_token}"}
+    await client.post("/file/upload", files={"file": (filename, unique_img, "image/png")}, headers=headers)
+
+    fetches: list[str] = []
+    iter_object = S3Client.iter_object
+
+    def counting_iter_object(self: S3Client, key: str, byte_range: tuple[int, int] | None = None) -> Iterator[bytes]:
+        fetches.append(key)
+        return iter_object(self, key, byte_range)
+
+    monkeypatch.setattr(S3Client, "iter_object", counting_iter_object)
+    responses = await asyncio.gather(
+        *(client.get("/file/original", params={"filename": filename}, headers=headers) for _ in range(5))
+    )
+    assert [response.status_code for response in responses] == [200] * 5
+    assert all(response.content == unique_img for response in responses)
+    assert len(fetches) == 1
+
+
+@pytest.mark.anyio
+async def test_list_files_cursor_pagination(client: AsyncClient, db_client: DatabaseClient, access_token: str) -> None:
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = (await client.get("/", headers=headers)).json()["id"]
+    for i in range(5):
+        upload = FileUploadDTO(name=f"{uuid4().hex[:6]}-{i}.txt", size=1, content=b"x", tags=None, user_id=user_id)
+        db_client.add_metadata(upload, content_object_key(upload.file_sha256))
+    response = await client.get("/files", headers=headers)
+    expected = [record["file_name"] for record in response.json()]
+    assert "x-next-cursor" not in response.headers
+
+    names: list[str] = []
+    params = {"limit": "2"}
+    while True:
+        response = await client.get("/files", params=params, headers=headers)
+        assert response.status_code == 200
+        names.extend(record["file_name"] for record in response.json())
+        if "x-next-cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["x-next-cursor"]
+    assert names == expected
+    # browser clients on another origin can read the cursor
+    response = await client.get("/files", params={"limit": "2"}, headers={**headers, "Origin": "https://example.com"})
+    assert "x-next-cursor" in response.headers["access-control-expose-headers"].lower().split(", ")
+
+    response = await client.get("/files", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket")
+async def test_conditional_gets(
+    client: AsyncClient, db_client: DatabaseClient, unique_img: bytes, access_token: str
+) -> None:
+    filename = f"{uuid4().hex[:6]}-camera.png"
+    headers = {"Authorization": f"Bearer {access_token}"}
+    await client.post("/file/upload", files={"file": (filename, unique_img, "image/png")}, headers=headers)
+    params = {"filename": filename}
+
+    response = await client.get("/file/original", params=params, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["cache-control"].startswith("private, max-age=")
+    etag, modified = response.headers["etag"], response.headers["last-modified"]
+
+    for conditional in (
+        {"If-None-Match": etag},
+        {"If-None-Match": f'"other", W/{etag}'},
+        {"If-Modified-Since": modified},
+    ):
+        response = await client.get("/file/original", params=params, headers={**headers, **conditional})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+    # If-None-Match takes precedence over If-Modified-Since
+    response = await client.get(
+        "/file/original", params=params, headers={**headers, "If-None-Match": '"other"', "If-Modified-Since": modified}
+    )
+    assert response.status_code == 200
+    assert response.content == unique_img
+
+    # metadata and listings, validated by the user's files_version
+    user_id = (await client.get("/", headers=headers)).json()["id"]
+    upload = FileUploadDTO(name=f"{uuid4().hex[:6]}.txt", size=1, content=b"x", tags="a", user_id=user_id)
+    db_client.add_metadata(upload, content_object_key(upload.file_sha256))
+
+    listing = await client.get("/files", headers=headers)
+    metadata = await client.get(f"/file/{upload.name}/metadata", headers=headers)
+    tags = await client.get("/files/tags", headers=headers)
+    fetched = {"/files": listing, f"/file/{upload.name}/metadata": metadata, "/files/tags": tags}
+    for url, first in fetched.items():
+        assert first.status_code == 200
+        response = await client.get(url, headers={**headers, "If-None-Match": first.headers["etag"]})
+        assert response.status_code == 304
+    # a different page of the same listing has its own validator
+    response = await client.get("/files", params={"limit": "1"}, headers=headers)
+    assert response.headers["etag"] != listing.headers["etag"]
+
+    response = await client.patch(f"/file/{upload.name}/tags", json={"tags": ["b"]}, headers=headers)
+    assert response.status_code == 200
+    for url, first in fetched.items():
+        response = await client.get(url, headers={**headers, "If-None-Match": first.headers["etag"]})
+        assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_list_files_compressed(client: AsyncClient, db_client: DatabaseClient, access_token: str) -> None:
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = (await client.get("/", headers=headers)).json()["id"]
+    for _ in range(10):
+        upload = FileUploadDTO(name=f"{uuid4().hex}.txt", size=1, content=b"x", tags="a,b", user_id=user_id)
+        db_client.add_metadata(upload, content_object_key(upload.file_sha256))
+    response = await client.get("/files", params={"limit": "10"}, headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 10
@@ -1,8 +1,10 @@
+import hashlib
 from typing import Any
 from uuid import uuid4
 
 import pytest
 from httpx import AsyncClient
+from mypy_boto3_s3 import S3Client
 
 from smolvault.models import FileUploadDTO
 
@@ -51,3 +53,34 @@ async def test_upload_file_no_tags(client: AsyncClient, camera_img: bytes, acces
     actual.pop("upload_timestamp")
     actual.pop("user_id")
     assert actual == expected
+
+
+@pytest.mark.anyio
+async def test_upload_files_batch(client: AsyncClient, aws: S3Client, unique_img: bytes, access_token: str) -> None:
+    aws.create_bucket(Bucket="test-bucket", CreateBucketConfiguration={"LocationConstraint": "us-west-1"})
+    other_img = unique_img + b"other"
+    names = [f"{uuid4().hex[:6]}-{n}.png" for n in ("first", "copy", "other", "over")]
+    response = await client.post(
+        "/files/upload",
+        files=[
+            ("files", (names[0], unique_img, "image/png")),
+            ("files", (names[1], unique_img, "image/png")),
+            ("files", (names[2], other_img, "image/png")),
+            ("files", (names[3], other_img + b"over", "image/png")),
+        ],
+        data={"tags": "batch"},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert response.status_code == 207
+    results: list[dict[str, Any]] = response.json()
+    assert [result["name"] for result in results] == names
+    assert [result["status"] for result in results] == [201, 201, 201, 400]
+    assert results[0]["file_sha256"] == hashlib.sha256(unique_img).hexdigest()
+    assert results[3]["error"] == "Upload limit exceeded"
+    # the repeated content was only sent once
+    assert aws.list_objects_v2(Bucket="test-bucket")["KeyCount"] == 2
+
+    response = await client.get(
+        "/files/search", params={"tag": "batch"}, headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert sorted(file["file_name"] for file in response.json()) == sorted(names[:3])
@@ -0,0 +1,94 @@
+from uuid import uuid4
+
+import pytest
+from httpx import AsyncClient
+
+from smolvault.auth.passwords import hash_password
+from smolvault.clients.database import DatabaseClient, content_object_key, full_text_query
+from smolvault.models import FileTagsDTO, FileUploadDTO
+
+from .factories import UserFactory
+
+
+def test_full_text_query() -> None:
+    assert full_text_query("Holiday  cam") == '"holiday" AND "cam"'
+    assert full_text_query("ab cat") == '"cat"'
+    assert full_text_query("beach", fuzzy=True) == '"bea" OR "eac" OR "ach"'
+    assert full_text_query('say "hi"') == '"say" AND """hi"""'
+    with pytest.raises(ValueError, match="at least 3 characters"):
+        full_text_query("a b")
+
+
+@pytest.mark.anyio
+async def test_query_files(client: AsyncClient, db_client: DatabaseClient, access_token: str) -> None:
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = (await client.get("/", headers=headers)).json()["id"]
+    marker = uuid4().hex[:8]
+    names = [f"{marker}-holiday-beach.png", f"{marker}-holiday-mountains.png", f"{marker}-receipt.pdf"]
+    for name, tags in zip(names, ["summer,beach", "winter", None], strict=True):
+        upload = FileUploadDTO(name=name, size=1, content=name.encode(), tags=tags, user_id=user_id)
+        db_client.add_metadata(upload, content_object_key(upload.file_sha256))
+
+    async def query(**params: str) -> list[str]:
+        response = await client.get("/files/query", params=params, headers=headers)
+        assert response.status_code == 200
+        return [record["file_name"] for record in response.json()]
+
+    assert set(await query(q=f"{marker} HOLIDAY")) == set(names[:2])
+    assert await query(q=f"{marker} summer") == [names[0]]
+    # a typo still finds the file, ahead of anything sharing fewer trigrams
+    assert (await query(q=f"{marker} reciept", fuzzy="true"))[0] == names[2]
+
+    pages: list[str] = []
+    params = {"q": marker, "limit": "2"}
+    while True:
+        response = await client.get("/files/query", params=params, headers=headers)
+        pages.extend(record["file_name"] for record in response.json())
+        if "x-next-cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["x-next-cursor"]
+    assert sorted(pages) == sorted(names)
+
+    # the index follows tag updates and deletes
+    record = db_client.get_metadata(names[2], user_id)
+    assert record is not None
+    db_client.update_tags(record, FileTagsDTO(tags=["taxes"]))
+    assert await query(q=f"{marker} taxes") == [names[2]]
+    db_client.delete_metadata(record, user_id)
+    assert await query(q=f"{marker} taxes") == []
+
+    response = await client.get("/files/query", params={"q": "ab"}, headers=headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_query_pages_survive_other_users_changes(
+    client: AsyncClient, db_client: DatabaseClient, access_token: str, user_factory: UserFactory
+) -> None:
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = (await client.get("/", headers=headers)).json()["id"]
+    other = user_factory.build()
+    db_client.add_user(other, hash_password(other.password.get_secret_value(), rounds=4))
+    other_info = db_client.get_user(other.username)
+    assert other_info is not None
+    assert other_info.id is not None
+    marker = uuid4().hex[:8]
+    names = [f"{marker}-{'x' * i}.txt" for i in range(6)]
+    for name in names:
+        upload = FileUploadDTO(name=name, size=1, content=name.encode(), tags=None, user_id=user_id)
+        db_client.add_metadata(upload, content_object_key(upload.file_sha256))
+
+    pages: list[str] = []
+    params = {"q": marker, "limit": "2"}
+    while True:
+        response = await client.get("/files/query", params=params, headers=headers)
+        pages.extend(record["file_name"] for record in response.json())
+        if "x-next-cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["x-next-cursor"]
+        # someone else's matching uploads change the corpus statistics, and with them every bm25 score
+        for _ in range(5):
+            name = f"{marker}-{uuid4().hex}"
+            upload = FileUploadDTO(name=name, size=1, content=name.encode(), tags=marker, user_id=other_info.id)
+            db_client.add_metadata(upload, content_object_key(upload.file_sha256))
+    assert sorted(pages) == sorted(names)
@@ -0,0 +1,158 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import pytest
+from sqlalchemy import Engine, create_engine, event, inspect, text
+
+from smolvault.clients.database import DatabaseClient, create_db_engine
+from smolvault.clients.migrations import MIGRATIONS
+
+
+@pytest.fixture
+def engine(tmp_path: Path) -> Engine:
+    return create_db_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+
+
+def index_names(engine: Engine, table: str) -> set[str]:
+    return {index["name"] for index in inspect(engine).get_indexes(table) if index["name"]}
+
+
+def test_migrations_upgrade_old_schema(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_filemetadatarecord_user_id_file_name"))
+        conn.execute(text("CREATE INDEX ix_filemetadatarecord_user_id ON filemetadatarecord (user_id)"))
+        conn.execute(text("DROP TABLE filetag"))
+        conn.execute(text("CREATE TABLE filetag (id INTEGER PRIMARY KEY, tag_name VARCHAR NOT NULL, file_id INTEGER)"))
+        conn.execute(text("CREATE INDEX ix_filetag_tag_name ON filetag (tag_name)"))
+        conn.execute(
+            text(
+                "INSERT INTO filemetadatarecord (id, file_name, file_sha256, size, object_key, link, upload_timestamp, "
+                "user_id) VALUES (7, 'a', 'sha', 1, 'a', '', '', 3)"
+            )
+        )
+        conn.execute(text("INSERT INTO filetag (tag_name, file_id) VALUES ('x', 7)"))
+        conn.execute(text("DROP TABLE filesearch"))
+        conn.execute(text("ALTER TABLE userinfo DROP COLUMN files_version"))
+        conn.execute(text("ALTER TABLE filemetadatarecord DROP COLUMN codec"))
+        conn.execute(text("ALTER TABLE storedobject DROP COLUMN codec"))
+        conn.execute(text("PRAGMA user_version=0"))
+    engine.dispose()
+
+    engine = create_db_engine(engine.url.render_as_string())
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA user_version")).scalar() == len(MIGRATIONS)
+    indexes = index_names(engine, "filemetadatarecord")
+    assert "ix_filemetadatarecord_user_id_file_name" in indexes
+    assert "ix_filemetadatarecord_user_id" not in indexes
+    assert "ix_filetag_user_id_tag_name_file_id" in index_names(engine, "filetag")
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT user_id FROM filetag WHERE file_id = 7")).scalar() == 3
+        assert conn.execute(text("SELECT file_count FROM tagcount WHERE user_id = 3 AND tag_name = 'x'")).scalar() == 1
+        assert conn.execute(text("SELECT count(*) FROM filesearch WHERE rowid = 7")).scalar() == 1
+    assert "files_version" in {column["name"] for column in inspect(engine).get_columns("userinfo")}
+    for table in ("filemetadatarecord", "storedobject"):
+        assert "codec" in {column["name"] for column in inspect(engine).get_columns(table)}
+
+
+# the schema create_all produced before there were migrations, spelled out so the test never follows the models
+UNMIGRATED_SCHEMA = (
+    "CREATE TABLE userinfo (id INTEGER NOT NULL, username VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL, "
+    "email VARCHAR, full_name VARCHAR, PRIMARY KEY (id))",
+    "CREATE UNIQUE INDEX ix_userinfo_username ON userinfo (username)",
+    "CREATE TABLE filemetadatarecord (id INTEGER NOT NULL, file_name VARCHAR NOT NULL, file_sha256 VARCHAR NOT NULL, "
+    "size INTEGER NOT NULL, object_key VARCHAR NOT NULL, link VARCHAR NOT NULL, upload_timestamp VARCHAR NOT NULL, "
+    "tags VARCHAR, local_path VARCHAR, cache_timestamp INTEGER, user_id INTEGER, PRIMARY KEY (id), "
+    "FOREIGN KEY(user_id) REFERENCES userinfo (id))",
+    "CREATE INDEX ix_filemetadatarecord_user_id ON filemetadatarecord (user_id)",
+    "CREATE INDEX ix_filemetadatarecord_file_name ON filemetadatarecord (file_name)",
+    "CREATE TABLE filetag (id INTEGER NOT NULL, tag_name VARCHAR NOT NULL, file_id INTEGER, PRIMARY KEY (id), "
+    "FOREIGN KEY(file_id) REFERENCES filemetadatarecord (id))",
+    "CREATE INDEX ix_filetag_tag_name ON filetag (tag_name)",
+)
+
+
+def index_columns(engine: Engine) -> dict[str, list[str | None]]:
+    return {
+        index["name"]: index["column_names"]
+        for table in inspect(engine).get_table_names()
+        for index in inspect(engine).get_indexes(table)
+        if index["name"]
+    }
+
+
+@pytest.mark.parametrize("applied", [0, 1])
+def test_migrations_upgrade_unmigrated_schema(engine: Engine, tmp_path: Path, applied: int) -> None:
+    """Databases that already ran some migrations pick up from the next one and end up with the same schema."""
+    old = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with old.begin() as conn:
+        for statement in UNMIGRATED_SCHEMA:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql(
+            "INSERT INTO filemetadatarecord (id, file_name, file_sha256, size, object_key, link, upload_timestamp, "
+            "tags, user_id) VALUES (7, 'a.txt', 'sha', 1, 'a.txt', '', '', 'x', 3)"
+        )
+        conn.exec_driver_sql("INSERT INTO filetag (tag_name, file_id) VALUES ('x', 7)")
+        for migration in MIGRATIONS[:applied]:
+            migration(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version={applied}")
+    old.dispose()
+
+    upgraded = create_db_engine(old.url.render_as_string())
+    with upgraded.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA user_version").scalar() == len(MIGRATIONS)
+        assert conn.exec_driver_sql("SELECT user_id FROM filetag WHERE file_id = 7").scalar() == 3
+    assert index_columns(upgraded) == index_columns(engine)
+
+
+def query_plans(engine: Engine, monkeypatch: pytest.MonkeyPatch, call: Any) -> list[str]:
+    """Runs a DatabaseClient call against engine and returns the query plan of every statement it issued."""
+    statements: list[tuple[str, Any]] = []
+
+    def capture(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    client = DatabaseClient()
+    monkeypatch.setattr(client, "engine", engine)
+    event.listen(engine, "before_cursor_execute", capture)
+    call(client)
+    event.remove(engine, "before_cursor_execute", capture)
+    with engine.connect() as conn:
+        return [
+            " | ".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters))
+            for statement, parameters in statements
+        ]
+
+
+@pytest.mark.parametrize(
+    ("call", "index"),
+    [
+        (lambda client: client.get_metadata("camera.png", 1), "ix_filemetadatarecord_user_id_file_name"),
+        (
+            lambda client: client.select_metadata_by_tags(
+                1, all_tags=["camera", "photo", "2024"], any_tags=["home", "work"], not_tags=["private"]
+            ),
+            "ix_filetag_user_id_tag_name_file_id",
+        ),
+        (lambda client: client.get_tag_counts(1), "sqlite_autoindex_tagcount_1"),
+        (
+            lambda client: client.get_all_metadata(1, start_time=datetime(2024, 1, 1)),
+            "ix_filemetadatarecord_user_id_upload_timestamp",
+        ),
+    ],
+)
+def test_hot_queries_use_indexes(engine: Engine, monkeypatch: pytest.MonkeyPatch, call: Any, index: str) -> None:
+    plans = query_plans(engine, monkeypatch, call)
+    assert plans
+    for plan in plans:
+        assert index in plan
+        assert "SCAN" not in plan
+
+
+def test_file_listing_pages_in_index_order(engine: Engine, monkeypatch: pytest.MonkeyPatch) -> None:
+    after = ("2024-01-01T00:00:00+00:00", 42)
+    [plan] = query_plans(engine, monkeypatch, lambda client: client.get_all_metadata(1, after=after))
+    assert "ix_filemetadatarecord_user_id_upload_timestamp" in plan
+    # rows come off the index already in (upload_timestamp, id) order, so a page never sorts the whole listing
+    assert "TEMP B-TREE" not in plan
@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from smolvault.auth.passwords import PasswordHasher
+
+
+@pytest.mark.anyio
+async def test_hash_uses_configured_rounds() -> None:
+    hasher = PasswordHasher(max_workers=1, max_pending=4, rounds=5)
+    hashed_password = await hasher.hash("secret")
+    assert hashed_password.startswith("$2b$05$")
+    assert await hasher.verify("secret", hashed_password)
+    assert not await hasher.verify("wrong", hashed_password)
+
+
+@pytest.mark.anyio
+async def test_rejects_work_beyond_max_pending() -> None:
+    hasher = PasswordHasher(max_workers=1, max_pending=2, rounds=8)
+    tasks = [asyncio.create_task(hasher.hash("secret")) for _ in range(2)]
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as exc_info:
+        await hasher.hash("secret")
+    assert exc_info.value.status_code == 503
+    await asyncio.gather(*tasks)
+    assert hasher.pending == 0
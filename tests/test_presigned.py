@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+from uuid import uuid4
+
+import pytest
+import requests
+from httpx import AsyncClient
+from mypy_boto3_s3 import S3Client
+
+from smolvault.auth.passwords import hash_password
+from smolvault.clients.database import DatabaseClient
+from smolvault.config import get_settings
+from tests.factories import UserFactory
+
+
+@pytest.fixture
+def _presigned_mode(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(get_settings(), "s3_serving_mode", "presigned")
+    monkeypatch.setattr(get_settings(), "presigned_min_size_bytes", 0)
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket", "_presigned_mode")
+async def test_presigned_upload_and_download(
+    client: AsyncClient, aws: S3Client, unique_img: bytes, access_token: str
+) -> None:
+    headers = {"Authorization": f"Bearer {access_token}"}
+    upload = {
+        "name": f"{uuid4().hex[:6]}-camera.png",
+        "file_sha256": hashlib.sha256(unique_img).hexdigest(),
+        "tags": "camera",
+    }
+    response = await client.post("/file/upload/complete", json=upload, headers=headers)
+    assert response.status_code == 400
+
+    response = await client.post("/file/upload/presigned", json=upload, headers=headers)
+    assert response.status_code == 200
+    target = response.json()
+    # moto intercepts requests, not httpx
+    put = await asyncio.to_thread(
+        requests.put, target["upload_url"], data=unique_img, headers=target["headers"], timeout=10
+    )
+    assert put.ok
+
+    # the size is read back from S3, whatever the client claims
+    response = await client.post("/file/upload/complete", json={**upload, "size": 0}, headers=headers)
+    assert response.status_code == 201
+    assert response.json()["file_sha256"] == upload["file_sha256"]
+    assert response.json()["size"] == len(unique_img)
+    # the staged upload became the content object
+    key = f"objects/{upload['file_sha256']}"
+    assert [obj["Key"] for obj in aws.list_objects_v2(Bucket="test-bucket")["Contents"]] == [key]
+
+    # the content is already stored, so a second name for it needs no transfer
+    response = await client.post(
+        "/file/upload/presigned", json={**upload, "name": f"copy-{upload['name']}"}, headers=headers
+    )
+    assert response.json()["upload_url"] is None
+
+    params = {"filename": upload["name"]}
+    response = await client.get("/file/original", params=params, headers=headers)
+    assert response.status_code == 302
+    assert response.headers["cache-control"] == "no-store"
+    response = await client.get("/file/original", params={**params, "redirect": "false"}, headers=headers)
+    assert response.status_code == 200
+    download = await asyncio.to_thread(requests.get, response.json()["url"], timeout=10)
+    assert download.content == unique_img
+
+
+@pytest.mark.anyio
+async def test_presigned_upload_disabled(client: AsyncClient, access_token: str) -> None:
+    upload = {"name": "a.txt", "file_sha256": hashlib.sha256(b"a").hexdigest()}
+    response = await client.post(
+        "/file/upload/presigned", json=upload, headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket", "_presigned_mode")
+async def test_presigned_upload_cannot_claim_other_users_content(
+    client: AsyncClient,
+    db_client: DatabaseClient,
+    user_factory: UserFactory,
+    unique_img: bytes,
+    access_token: str,
+) -> None:
+    name = f"{uuid4().hex[:6]}-camera.png"
+    response = await client.post(
+        "/file/upload",
+        files={"file": (name, unique_img, "image/png")},
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+    assert response.status_code == 201
+
+    other = user_factory.build()
+    db_client.add_user(other, hash_password(other.password.get_secret_value(), rounds=4))
+    response = await client.post(
+        "/token", data={"username": other.username, "password": other.password.get_secret_value()}
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    upload = {"name": name, "size": 0, "file_sha256": hashlib.sha256(unique_img).hexdigest()}
+    # knowing the digest reveals nothing and grants nothing: the content has to be sent like any other
+    response = await client.post("/file/upload/presigned", json=upload, headers=headers)
+    assert response.json()["upload_url"] is not None
+    response = await client.post("/file/upload/complete", json=upload, headers=headers)
+    assert response.status_code == 400
+    response = await client.get("/file/original", params={"filename": name}, headers=headers)
+    assert response.status_code == 404
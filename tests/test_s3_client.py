@@ -0,0 +1,112 @@
+import asyncio
+import io
+import threading
+import time
+from collections.abc import Iterator
+
+import boto3
+import pytest
+
+from smolvault.clients.aws import AsyncS3Client, MultipartUpload, S3Client
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class BytesReader:
+    def __init__(self, data: bytes) -> None:
+        self.stream = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self.stream.read(size)
+
+
+@pytest.mark.usefixtures("_test_bucket")
+def test_multipart_upload_spans_parts() -> None:
+    client = boto3.client("s3")
+    data = bytes(range(256)) * (11 * 1024 * 1024 // 256)
+    upload = MultipartUpload(client, "test-bucket", "large.bin", part_size=MIN_PART_SIZE)
+    for offset in range(0, len(data), 1024 * 1024):
+        upload.write(data[offset : offset + 1024 * 1024])
+    upload.complete()
+
+    assert upload.size == len(data)
+    assert len(upload._parts) == 3
+    assert client.get_object(Bucket="test-bucket", Key="large.bin")["Body"].read() == data
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket")
+async def test_upload_stream_small_file(camera_img: bytes) -> None:
+    s3_client = AsyncS3Client(S3Client(bucket_name="test-bucket"), max_concurrency=2)
+    upload = await s3_client.upload_stream("camera.png", BytesReader(camera_img))
+
+    assert upload.size == len(camera_img)
+    assert upload._parts == []
+    assert b"".join([chunk async for chunk in s3_client.iter_object("camera.png")]) == camera_img
+
+
+@pytest.mark.usefixtures("_bucket_w_camera_img")
+def test_iter_object_range(camera_img: bytes) -> None:
+    s3_client = S3Client(bucket_name="test-bucket")
+    assert b"".join(s3_client.iter_object("camera.png", byte_range=(100, 1124))) == camera_img[100:1124]
+
+
+@pytest.mark.usefixtures("aws")
+def test_s3_client_retries_and_pool() -> None:
+    config = S3Client(bucket_name="test-bucket").client.meta.config
+    assert config.retries["mode"] == "adaptive"
+    assert config.max_pool_connections == 16
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("aws")
+async def test_async_client_bounds_concurrency(monkeypatch: pytest.MonkeyPatch) -> None:
+    s3_client = AsyncS3Client(S3Client(bucket_name="test-bucket"), max_concurrency=2)
+    in_flight: list[int] = []
+    lock = threading.Lock()
+    active = 0
+
+    def slow_delete(key: str) -> None:
+        nonlocal active
+        with lock:
+            active += 1
+            in_flight.append(active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+
+    monkeypatch.setattr(s3_client.client, "delete", slow_delete)
+    await asyncio.gather(*(s3_client.delete(f"key-{i}") for i in range(8)))
+    assert max(in_flight) == 2
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("aws")
+async def test_iterate_closes_pipeline_after_cancelled_read() -> None:
+    s3_client = AsyncS3Client(S3Client(bucket_name="test-bucket"), max_concurrency=2)
+    reading, release = threading.Event(), threading.Event()
+    closed: list[bool] = []
+
+    def chunks() -> Iterator[bytes]:
+        try:
+            yield b"first"
+            reading.set()
+            release.wait(5)
+            yield b"second"
+        finally:
+            closed.append(True)
+
+    async def consume() -> None:
+        async for _ in s3_client.iterate(chunks()):
+            pass
+
+    task = asyncio.create_task(consume())
+    await asyncio.to_thread(reading.wait, 5)
+    task.cancel()
+    await asyncio.sleep(0.05)
+    # the read in flight is waited out rather than closing the generator underneath it
+    assert not task.done()
+    release.set()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert closed == [True]
@@ -1,7 +1,10 @@
+from uuid import uuid4
+
 import pytest
 from httpx import AsyncClient
 
-from smolvault.models import FileMetadata
+from smolvault.clients.database import DatabaseClient, content_object_key
+from smolvault.models import FileMetadata, FileUploadDTO
 
 
 @pytest.mark.anyio
@@ -48,3 +51,74 @@ async def test_search_tag_not_found(client: AsyncClient, access_token: str) -> N
     assert response.status_code == 200
     assert len(response.json()) == 0
     assert response.json() == []
+
+
+@pytest.mark.anyio
+async def test_search_tag_boolean_and_facets(client: AsyncClient, db_client: DatabaseClient, access_token: str) -> None:
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = (await client.get("/", headers=headers)).json()["id"]
+    red, blue, green = (f"{color}-{uuid4().hex[:6]}" for color in ("red", "blue", "green"))
+    files = {"a.txt": [red, blue], "b.txt": [red, green], "c.txt": [blue], "d.txt": [red, blue, green]}
+    names = {}
+    for name, tags in files.items():
+        upload = FileUploadDTO(
+            name=f"{uuid4().hex[:6]}-{name}", size=1, content=b"x", tags=",".join(tags), user_id=user_id
+        )
+        db_client.add_metadata(upload, content_object_key(upload.file_sha256))
+        names[name] = upload.name
+
+    async def search(**params: list[str]) -> set[str]:
+        response = await client.get("/files/search", params=params, headers=headers)
+        assert response.status_code == 200
+        return {record["file_name"] for record in response.json()}
+
+    assert await search(tag=[red, blue]) == {names["a.txt"], names["d.txt"]}
+    assert await search(any_tag=[green, blue]) == {names[name] for name in ("a.txt", "b.txt", "c.txt", "d.txt")}
+    assert await search(tag=[red], not_tag=[green]) == {names["a.txt"]}
+    assert await search(tag=[red], any_tag=[blue, green], not_tag=[blue]) == {names["b.txt"]}
+
+    response = await client.get("/files/tags", headers=headers)
+    counts = response.json()
+    assert (counts[red], counts[blue], counts[green]) == (3, 3, 2)
+
+    # retagging replaces the file's postings
+    response = await client.patch(f"/file/{names['c.txt']}/tags", json={"tags": [green]}, headers=headers)
+    assert response.status_code == 200
+    assert await search(tag=[green]) == {names["b.txt"], names["c.txt"], names["d.txt"]}
+    assert await search(tag=[blue]) == {names["a.txt"], names["d.txt"]}
+    counts = (await client.get("/files/tags", headers=headers)).json()
+    assert (counts[red], counts[blue], counts[green]) == (3, 2, 3)
+
+    response = await client.get("/files/search", params={"not_tag": [red]}, headers=headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_bulk_tag_update(client: AsyncClient, db_client: DatabaseClient, access_token: str) -> None:
+    headers = {"Authorization": f"Bearer {access_token}"}
+    user_id = (await client.get("/", headers=headers)).json()["id"]
+    old, new, kept = (f"{label}-{uuid4().hex[:6]}" for label in ("old", "new", "kept"))
+    names = []
+    for tags in ([old, kept], [old], [kept]):
+        upload = FileUploadDTO(
+            name=f"{uuid4().hex[:6]}.txt", size=1, content=b"x", tags=",".join(tags), user_id=user_id
+        )
+        db_client.add_metadata(upload, content_object_key(upload.file_sha256))
+        names.append(upload.name)
+
+    response = await client.patch("/files/tags", json={"files": {"tag": [old]}, "tags": [new, kept]}, headers=headers)
+    assert response.status_code == 200
+    assert sorted(response.json()["updated"]) == sorted(names[:2])
+    counts = (await client.get("/files/tags", headers=headers)).json()
+    assert old not in counts
+    assert (counts[new], counts[kept]) == (2, 3)
+    response = await client.get("/files/search", params={"tag": [new, kept]}, headers=headers)
+    assert {record["file_name"] for record in response.json()} == set(names[:2])
+
+    response = await client.patch("/files/tags", json={"files": {"names": names[2:]}, "tags": []}, headers=headers)
+    assert response.json()["updated"] == names[2:]
+    counts = (await client.get("/files/tags", headers=headers)).json()
+    assert counts[kept] == 2
+
+    response = await client.patch("/files/tags", json={"files": {}, "tags": [new]}, headers=headers)
+    assert response.status_code == 422
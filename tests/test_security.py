@@ -4,6 +4,8 @@ from uuid import uuid4
 import pytest
 from httpx import AsyncClient
 
+from smolvault.auth.decoder import authenticated_users
+from smolvault.clients.database import DatabaseClient, UserInfo
 from tests.conftest import TestDatabaseClient
 
 
@@ -111,6 +113,31 @@ async def test_get_file(client: AsyncClient, camera_img: bytes, user_john: str,
     assert response.content == camera_img
 
 
+@pytest.mark.anyio
+async def test_authenticated_user_cached(client: AsyncClient, user_john: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Test that a verified token is resolved to its user once and then served from memory until the entry expires.
+    """
+    lookups: list[str] = []
+    get_user = DatabaseClient.get_user
+
+    def counting_get_user(self: DatabaseClient, username: str) -> UserInfo | None:
+        lookups.append(username)
+        return get_user(self, username)
+
+    monkeypatch.setattr(DatabaseClient, "get_user", counting_get_user)
+    authenticated_users.clear()
+    for _ in range(3):
+        response = await client.get("/", headers={"Authorization": f"Bearer {user_john}"})
+        assert response.json()["username"] == "john"
+    assert lookups == ["john"]
+
+    now = authenticated_users.clock()
+    monkeypatch.setattr(authenticated_users, "clock", lambda: now + authenticated_users.ttl_seconds)
+    await client.get("/", headers={"Authorization": f"Bearer {user_john}"})
+    assert lookups == ["john", "john"]
+
+
 @pytest.fixture
 async def _fully_populated_user_bucket(
     client: AsyncClient, camera_img: bytes, user_jack: str, _test_bucket: None
@@ -0,0 +1,135 @@
+import hashlib
+import io
+import os
+import pathlib
+from datetime import datetime
+from uuid import uuid4
+from zoneinfo import ZoneInfo
+
+import pytest
+from httpx import AsyncClient
+from mypy_boto3_s3 import S3Client
+from sqlmodel import Session
+
+from smolvault.cache.integrity import CacheVerifier
+from smolvault.clients.database import DatabaseClient, FileMetadataRecord, cache_file_name
+from smolvault.compression import CompressingReader, choose_codec, decompress_chunks, looks_like_text
+from smolvault.config import get_settings
+from smolvault.main import cache
+
+pytest.importorskip("zstandard")
+
+CSV = "".join(f"{i},{uuid4().hex[:8]},note number {i}\n" for i in range(600)).encode()
+
+
+def test_choose_codec() -> None:
+    noise = os.urandom(64 * 1024)
+    assert choose_codec(io.BytesIO(CSV), "text/csv", 1024 * 1024, 0.8) == "zstd"
+    # unknown types are sniffed
+    assert choose_codec(io.BytesIO(CSV), None, 1024 * 1024, 0.8) == "zstd"
+    assert choose_codec(io.BytesIO(noise), "text/plain", 1024 * 1024, 0.8) is None
+    assert choose_codec(io.BytesIO(noise), None, 1024 * 1024, 0.8) is None
+    assert looks_like_text("naïve".encode()[:3])
+    assert not looks_like_text(b"PK\x03\x04\x00")
+
+
+@pytest.mark.anyio
+async def test_compressing_reader_round_trip() -> None:
+    class AsyncBytes:
+        def __init__(self, data: bytes) -> None:
+            self.data = io.BytesIO(data)
+
+        async def read(self, size: int = -1) -> bytes:
+            return self.data.read(size)
+
+    reader = CompressingReader(AsyncBytes(CSV))
+    chunks = []
+    while chunk := await reader.read(1000):
+        chunks.append(chunk)
+    assert all(len(chunk) <= 1000 for chunk in chunks)
+    assert sum(map(len, chunks)) < len(CSV)
+    assert b"".join(decompress_chunks(iter(chunks), "zstd")) == CSV
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket")
+async def test_compressed_upload_and_download(
+    client: AsyncClient,
+    aws: S3Client,
+    db_client: DatabaseClient,
+    access_token: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(get_settings(), "compress_at_rest", True)
+    headers = {"Authorization": f"Bearer {access_token}"}
+    content = CSV + uuid4().bytes.hex().encode()
+    filename = f"{uuid4().hex[:6]}-notes.csv"
+    response = await client.post("/file/upload", files={"file": (filename, content, "text/csv")}, headers=headers)
+    assert response.status_code == 201
+    assert response.json()["size"] == len(content)
+    stored = aws.list_objects_v2(Bucket="test-bucket")["Contents"]
+    assert [obj["Size"] < len(content) for obj in stored] == [True]
+
+    params = {"filename": filename}
+    response = await client.get("/file/original", params=params, headers={**headers, "Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.content == content
+    # that download filled the cache with the compressed bytes, which still verify against the content hash
+    sha = response.headers["etag"].strip('"')
+    cached = pathlib.Path(cache.path(cache_file_name(sha, "zstd")))
+    assert cached.stat().st_size < len(content)
+    assert CacheVerifier(cache, db_client, interval_seconds=60).verify_once() == []
+
+    response = await client.get("/file/original", params=params, headers={**headers, "Accept-Encoding": "zstd"})
+    assert response.headers["content-encoding"] == "zstd"
+    assert response.headers["etag"] == f'W/"{sha}"'
+    assert int(response.headers["content-length"]) == cached.stat().st_size
+    assert response.content == content  # httpx decodes zstd
+
+
+@pytest.mark.anyio
+@pytest.mark.usefixtures("_test_bucket")
+async def test_raw_and_compressed_copies_cache_separately(
+    client: AsyncClient,
+    aws: S3Client,
+    db_client: DatabaseClient,
+    user: tuple[str, str],
+    access_token: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(get_settings(), "compress_at_rest", True)
+    headers = {"Authorization": f"Bearer {access_token}", "Accept-Encoding": "identity"}
+    content = CSV + uuid4().bytes.hex().encode()
+    sha = hashlib.sha256(content).hexdigest()
+    # a record from before content was deduplicated: stored as is, under its own key
+    legacy_name = f"{uuid4().hex[:6]}-legacy.csv"
+    aws.put_object(Bucket="test-bucket", Key=legacy_name, Body=content)
+    user_info = db_client.get_user(user[0])
+    assert user_info is not None
+    with Session(db_client.engine) as session:
+        session.add(
+            FileMetadataRecord(
+                file_name=legacy_name,
+                file_sha256=sha,
+                size=len(content),
+                object_key=legacy_name,
+                link="",
+                upload_timestamp=datetime.now(ZoneInfo("UTC")).isoformat(),
+                tags=None,
+                user_id=user_info.id,
+            )
+        )
+        session.commit()
+    filename = f"{uuid4().hex[:6]}-notes.csv"
+    response = await client.post("/file/upload", files={"file": (filename, content, "text/csv")}, headers=headers)
+    assert response.status_code == 201
+
+    for _ in range(2):  # the second round is served from the cache
+        for name in (legacy_name, filename):
+            response = await client.get("/file/original", params={"filename": name}, headers=headers)
+            assert response.status_code == 200
+            assert response.content == content
+    assert pathlib.Path(cache.path(cache_file_name(sha, None))).read_bytes() == content
+    assert pathlib.Path(cache.path(cache_file_name(sha, "zstd"))).stat().st_size < len(content)
+    assert CacheVerifier(cache, db_client, interval_seconds=60).verify_once() == []
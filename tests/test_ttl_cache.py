@@ -0,0 +1,41 @@
+from smolvault.cache.ttl import TTLCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_ttl() -> None:
+    clock = FakeClock()
+    cache: TTLCache[str, int] = TTLCache(max_entries=10, ttl_seconds=60, clock=clock)
+    cache.set("a", 1)
+    clock.now += 59
+    assert cache.get("a") == 1
+    clock.now += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_explicit_deadline_caps_ttl() -> None:
+    clock = FakeClock()
+    cache: TTLCache[str, int] = TTLCache(max_entries=10, ttl_seconds=60, clock=clock)
+    cache.set("a", 1, expires_at=clock.now + 5)
+    cache.set("b", 2, expires_at=clock.now + 500)
+    clock.now += 10
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+
+def test_least_recently_used_dropped_when_full() -> None:
+    cache: TTLCache[str, int] = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3